@@ -1,18 +1,47 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 import os
 from flask_cors import CORS
+from app.cache import PayloadCache
+from app.ratelimit import RateLimiter
+from app.routing import RoutingSQLAlchemy
+from app.metrics import Metrics
+from app.deadline import RequestDeadlines
+from app.slowlog import SlowQueryLog
+from app.registry import BusinessNoIndex
+from app.snapshot import RegistrySnapshot
 
 # 初始化擴展
-db = SQLAlchemy()
+# 唯讀端點的查詢可分流至副本
+db = RoutingSQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
 
 # 創建 CORS 實例
 cors = CORS()
 
+# 跨 worker 共用的壓縮回應快取
+payload_cache = PayloadCache()
+
+# 跨 worker 共用的 API 密鑰限流
+rate_limiter = RateLimiter()
+
+# Prometheus 監控指標
+metrics = Metrics()
+
+# 依端點類別設定的請求時限
+deadlines = RequestDeadlines()
+
+# 慢查詢記錄
+slow_query_log = SlowQueryLog()
+
+# 統一編號點陣圖索引
+business_no_index = BusinessNoIndex()
+
+# 登記資料欄式快照
+registry_snapshot = RegistrySnapshot()
+
 def create_app():
     app = Flask(__name__)
     
@@ -23,30 +52,43 @@ def create_app():
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
+    payload_cache.init_app(app)
+    rate_limiter.init_app(app)
+    metrics.init_app(app)
+    deadlines.init_app(app)
+    slow_query_log.init_app(app)
+    business_no_index.init_app(app)
+    registry_snapshot.init_app(app)
 
-    cors.init_app(app, resources={r"/*": {"origins": "http://localhost:8080"}})
+    cors.init_app(app, resources={r"/*": {"origins": app.config['CORS_ORIGINS']}})
     
     # 註冊藍圖
     from app.routes import main_bp
     from app.auth import auth_bp
+    from app.jobs import export_jobs
+    
+    export_jobs.init_app(app)
     
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
     
-    # 創建數據表
-    with app.app_context():
-        db.create_all()
-
-        # 導入並運行種子數據函數
-        from app.seeds import seed_data
-        seed_data()
-        
-        # 如果沒有API密鑰，創建一個默認的
-        # from app.models import ApiKey
-        # if not ApiKey.query.first():
-        #     default_key = ApiKey(key="admin123", is_active=True, description="Default API Key")
-        #     db.session.add(default_key)
-        #     db.session.commit()
+    # 資料表建立與種子數據改由 `flask init-db` / `flask seed` 在部署時執行，
+    # worker 啟動時不再連線資料庫
+    from app.commands import (
+        init_db_command, backfill_typed_columns_command, refresh_branch_counts_command,
+        match_companies_command, build_business_no_index_command, build_snapshot_command,
+        load_companies_command, seed_command, slow_query_report_command
+    )
+    
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(backfill_typed_columns_command)
+    app.cli.add_command(refresh_branch_counts_command)
+    app.cli.add_command(match_companies_command)
+    app.cli.add_command(build_business_no_index_command)
+    app.cli.add_command(build_snapshot_command)
+    app.cli.add_command(load_companies_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(slow_query_report_command)
     
     return app
 
@@ -0,0 +1,450 @@
+# app/asgi.py
+"""
+非同步服務模式
+
+DataAccess 的查詢端點 (CreateCursor、GetSummary、FindByBusinessNo、GetCompanyGroup、TryFindCompanyBusinessNo)
+在事件迴圈上以 asyncpg 執行，等待資料庫時不佔用 worker，單一行程可同時處理大量搜尋與分頁請求；
+其他路徑轉交原本的 Flask 應用程式處理，維持相容
+
+- 查詢條件與回應格式與 Flask 路由共用 app/search.py
+- JWT 以 PyJWT 驗證，與 flask_jwt_extended 簽發的令牌相容
+- 限流、API 密鑰快取與共用回應快取沿用同一份共享記憶體
+- 監控指標與 Flask 路由使用相同的端點標籤
+- 唯讀查詢輪流送往 DATABASE_REPLICA_URLS 中的副本，游標與 API 密鑰一律使用主庫
+- 請求時限與 Flask 路由相同 (app/deadline.py)；時限到期或用戶端中斷連線時取消處理中的 task，
+  asyncpg 隨即送出 cancel 中止執行中的查詢
+
+啟動方式:
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py app.asgi:application
+"""
+import asyncio
+import datetime
+import itertools
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from functools import wraps
+
+import jwt
+from sqlalchemy import select, insert, delete
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+from app import app as flask_app, payload_cache, rate_limiter, deadlines
+from app.auth import _cache_valid, _key_active_cache
+from app.deadline import QueryTooBroad, current_budget
+from app.metrics import start_request, finish_request, observe_deadline
+from app.models import ApiKey, Company, CompanyGov, SearchCursor
+from app.routes import compress_data
+from app.search import (
+    company_aggregation_filter, company_group_statement, range_filters,
+    group_item, summary_items, summary_page_statement, typeahead_item, TYPEAHEAD_LIMIT
+)
+
+# 同步驅動 -> 非同步驅動
+_ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def _async_url(uri):
+    url = make_url(uri)
+    return url.set(drivername=_ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def _async_engine_options(config):
+    """沿用同步模式的連線池設定，查詢逾時改以 asyncpg 的 server_settings 傳入"""
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    options.pop('connect_args', None)
+    statement_timeout = config.get('DB_STATEMENT_TIMEOUT_MS', 0)
+    if statement_timeout and config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(statement_timeout)}}
+    return options
+
+
+class AsyncDatabase:
+    """主庫與唯讀副本的非同步引擎，於每個 worker 啟動時建立"""
+
+    def __init__(self):
+        self.primary = None
+        self.replicas = []
+        self._cycle = None
+
+    def open(self, config):
+        options = _async_engine_options(config)
+        self.primary = create_async_engine(_async_url(config['SQLALCHEMY_DATABASE_URI']), **options)
+        self.replicas = [
+            create_async_engine(_async_url(uri), **options)
+            for uri in config.get('SQLALCHEMY_REPLICA_URIS', [])
+        ]
+        self._cycle = itertools.cycle(self.replicas) if self.replicas else None
+
+    def replica(self):
+        """輪流回傳唯讀副本，未設定副本時使用主庫"""
+        return next(self._cycle) if self._cycle else self.primary
+
+    async def close(self):
+        for engine in [self.primary, *self.replicas]:
+            if engine is not None:
+                await engine.dispose()
+
+
+database = AsyncDatabase()
+
+
+# ---- 驗證與限流 ----
+
+def _error(message, status_code, headers=None):
+    return JSONResponse({'error': message}, status_code=status_code, headers=headers)
+
+
+def _jwt_identity(request):
+    """
+    解析 Authorization 標頭中的 JWT，回傳 (API 密鑰ID, 錯誤回應)
+    錯誤訊息與狀態碼與 flask_jwt_extended 相同
+    """
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None, JSONResponse({'msg': 'Missing Authorization Header'}, status_code=401)
+
+    config = flask_app.config
+    try:
+        payload = jwt.decode(
+            header[len('Bearer '):],
+            config['JWT_SECRET_KEY'],
+            algorithms=[config.get('JWT_ALGORITHM', 'HS256')],
+        )
+    except jwt.ExpiredSignatureError:
+        return None, JSONResponse({'msg': 'Token has expired'}, status_code=401)
+    except jwt.InvalidTokenError as e:
+        return None, JSONResponse({'msg': str(e)}, status_code=422)
+
+    if payload.get('type') != 'access':
+        return None, JSONResponse({'msg': 'Only non-refresh tokens are allowed'}, status_code=422)
+    return payload.get(config.get('JWT_IDENTITY_CLAIM', 'sub')), None
+
+
+async def _is_api_key_active(key_id):
+    """與 app.auth.is_api_key_active 相同，共用程序內快取"""
+    entry = _key_active_cache.get(key_id)
+    if entry and _cache_valid(entry, flask_app.config.get('API_KEY_CACHE_TTL', 300)):
+        return entry[0]
+
+    generation = rate_limiter.key_generation()
+    active = False
+    if str(key_id).isdigit():
+        async with database.primary.connect() as conn:
+            active = bool(await conn.scalar(select(ApiKey.is_active).where(ApiKey.id == int(key_id))))
+
+    _key_active_cache[key_id] = (active, generation, time.time())
+    return active
+
+
+async def _client_disconnected(request):
+    """等到用戶端中斷連線才回傳；DataAccess 的非同步端點都是 GET，不會與處理函式爭用 receive()"""
+    while True:
+        message = await request.receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _run_within_deadline(request, handler):
+    """
+    執行處理函式，時限到期或用戶端中斷連線時取消
+    取消後等待 task 結束，讓執行中的查詢中止、連線歸還連線池
+    """
+    budget = current_budget()
+    task = asyncio.ensure_future(handler(request))
+    watcher = asyncio.ensure_future(_client_disconnected(request))
+    try:
+        done, _ = await asyncio.wait(
+            {task, watcher},
+            timeout=max(0, budget.remaining_ms()) / 1000 if budget else None,
+            return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        watcher.cancel()
+
+    if task in done:
+        return task.result()
+
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+
+    if watcher in done:
+        if budget is not None:
+            observe_deadline(budget.endpoint_class, 'disconnected')
+        # 用戶端已離線，回應不會送達，只用於監控的狀態碼
+        return Response(status_code=499)
+    raise budget.exceed('timeout')
+
+
+def endpoint(endpoint_class):
+    """
+    驗證 JWT 與 API 密鑰狀態，並套用該端點類別的限流與請求時限，
+    等同 @jwt_required() + @rate_limited()
+    """
+    def decorator(handler):
+        async def authorized(request):
+            key_id, error = _jwt_identity(request)
+            if error is not None:
+                return error
+
+            if not await _is_api_key_active(key_id):
+                return _error('API key has been deactivated', 401)
+
+            allowed, retry_after = rate_limiter.acquire(key_id, endpoint_class)
+            if not allowed:
+                return _error('Too many requests', 429, {'Retry-After': str(retry_after)})
+
+            deadline_token = deadlines.start(endpoint_class)
+            try:
+                return await _run_within_deadline(request, handler)
+            except QueryTooBroad as e:
+                return JSONResponse(e.to_dict(), status_code=422)
+            finally:
+                deadlines.finish(deadline_token)
+                rate_limiter.release(key_id, endpoint_class)
+
+        @wraps(handler)
+        async def wrapper(request):
+            token = start_request(wrapper.metrics_endpoint)
+            status = 500
+            try:
+                response = await authorized(request)
+                status = response.status_code
+                return response
+            finally:
+                finish_request(token, request.method, status)
+
+        wrapper.metrics_endpoint = handler.__name__
+        return wrapper
+    return decorator
+
+
+def _route(path, handler):
+    """註冊非同步端點，監控標籤使用與 Flask 相同的路由規則寫法"""
+    handler.metrics_endpoint = path.replace('{', '<').replace('}', '>')
+    return Route(path, handler, methods=['GET'])
+
+
+def _compressed_response(compressed_data):
+    return Response(compressed_data, media_type='text/plain')
+
+
+# ---- DataAccess 端點 ----
+
+@endpoint('search')
+async def create_cursor(request):
+    """
+    搜尋公司資料並建立游標
+    """
+    collection = request.query_params.get('collection')
+    keywords = request.query_params.getlist('keywords')
+
+    try:
+        conditions, order_by = range_filters(request.query_params)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    if not collection or not (keywords or conditions):
+        return _error('缺少必要參數', 400)
+
+    if collection != 'CompanyAggregation':
+        return _error(f'不支援的資料集: {collection}', 400)
+
+    statement = select(CompanyGov.id).where(*conditions).order_by(*order_by)
+    if keywords:
+        statement = statement.where(company_aggregation_filter(keywords))
+
+    async with database.replica().connect() as conn:
+        result = await conn.execute(statement)
+        result_ids = [str(row.id) for row in result]
+
+    cursor_id = str(uuid.uuid4())
+    async with database.primary.begin() as conn:
+        await conn.execute(insert(SearchCursor.__table__).values(
+            cursor_id=cursor_id,
+            keywords=json.dumps(keywords),
+            result_ids=json.dumps(result_ids),
+            total_count=len(result_ids),
+            expires_at=datetime.datetime.utcnow() + datetime.timedelta(hours=24)  # 游標24小時後過期
+        ))
+
+    return JSONResponse({
+        'cursorId': cursor_id,
+        'totalCount': len(result_ids)
+    })
+
+
+@endpoint('read')
+async def get_summary(request):
+    """
+    根據游標ID獲取分頁數據摘要
+    """
+    cursor_id = request.query_params.get('cursorId')
+    page = int(request.query_params.get('page', 1))
+    page_size = int(request.query_params.get('pageSize', 10))
+    remove_cursor = request.query_params.get('removeCursor', 'false').lower() == 'true'
+
+    if not cursor_id:
+        return _error('Missing cursor ID', 400)
+
+    # 游標剛由主庫寫入，不從副本讀取
+    async with database.primary.connect() as conn:
+        cursor = (await conn.execute(
+            select(SearchCursor.result_ids, SearchCursor.total_count).where(SearchCursor.cursor_id == cursor_id)
+        )).first()
+
+    if not cursor:
+        return _error('Invalid cursor ID', 404)
+
+    start_idx = (page - 1) * page_size
+    end_idx = start_idx + page_size
+
+    cache_key = f'summary:{cursor_id}:{page}:{page_size}'
+    compressed_data = payload_cache.get(cache_key)
+
+    if compressed_data is None:
+        page_ids = [int(id) for id in json.loads(cursor.result_ids)[start_idx:end_idx]]
+
+        # 一次查詢整頁，再依游標中的順序排列
+        async with database.replica().connect() as conn:
+            result = await conn.execute(summary_page_statement(page_ids))
+            companies = summary_items(result, page_ids)
+        compressed_data = compress_data(companies)
+        # 以頁面中每家公司的統一編號標記，任一公司異動時整頁失效
+        payload_cache.set(cache_key, compressed_data, tags=[item['BusinessNo'] for item in companies])
+
+    if remove_cursor and end_idx >= cursor.total_count:
+        async with database.primary.begin() as conn:
+            await conn.execute(delete(SearchCursor.__table__).where(SearchCursor.cursor_id == cursor_id))
+
+    return _compressed_response(compressed_data)
+
+
+def _load_company(session, business_no):
+    """在 run_sync 中執行，沿用 Company.to_dict() 的關聯載入"""
+    company = session.query(Company).filter_by(business_no=business_no).first()
+    return company.to_dict() if company else None
+
+
+@endpoint('read')
+async def find_by_business_no(request):
+    """
+    根據統一編號查詢公司詳細信息
+    """
+    business_no = request.path_params['business_no']
+
+    cache_key = f'find:{business_no}'
+    compressed_data = payload_cache.get(cache_key)
+    if compressed_data is not None:
+        return _compressed_response(compressed_data)
+
+    async with AsyncSession(database.replica()) as session:
+        company_data = await session.run_sync(_load_company, business_no)
+
+    if company_data is None:
+        return _error('Company not found', 404)
+
+    compressed_data = compress_data(company_data)
+    payload_cache.set(cache_key, compressed_data, tag=business_no)
+
+    return _compressed_response(compressed_data)
+
+
+@endpoint('read')
+async def get_company_group(request):
+    """
+    根據統一編號查詢所屬集團: 總公司與所有分公司
+    """
+    business_no = request.path_params['business_no']
+
+    cache_key = f'group:{business_no}'
+    compressed_data = payload_cache.get(cache_key)
+    if compressed_data is not None:
+        return _compressed_response(compressed_data)
+
+    async with database.replica().connect() as conn:
+        members = (await conn.execute(company_group_statement(business_no))).all()
+
+    if not members:
+        return _error('Company not found', 404)
+
+    compressed_data = compress_data([group_item(member) for member in members])
+    payload_cache.set(cache_key, compressed_data, tag=business_no)
+
+    return _compressed_response(compressed_data)
+
+
+@endpoint('read')
+async def try_find_company(request):
+    """
+    嘗試根據公司部分名稱查找可能的企業
+    """
+    company_part_name = request.query_params.get('companyPartName')
+
+    if not company_part_name:
+        return _error('Missing company name', 400)
+
+    async with database.replica().connect() as conn:
+        result = await conn.execute(
+            select(Company.business_no, Company.company_name, Company.company_address)
+            .where(Company.company_name.ilike(f'%{company_part_name}%'))
+            .limit(TYPEAHEAD_LIMIT)
+        )
+        companies = result.all()
+
+    return JSONResponse([typeahead_item(company) for company in companies])
+
+
+# ---- 應用程式 ----
+
+def _closing_wsgi(wsgi_app):
+    """
+    Starlette 的 WSGIMiddleware 不會呼叫回應的 close()，
+    由這裡在傳送完畢後呼叫，讓限流的併發額度與串流的資源照常釋放
+    """
+    def wrapper(environ, start_response):
+        iterable = wsgi_app(environ, start_response)
+        try:
+            yield from iterable
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+    return wrapper
+
+
+@asynccontextmanager
+async def lifespan(_):
+    database.open(flask_app.config)
+    yield
+    await database.close()
+
+
+application = Starlette(
+    routes=[
+        _route('/DataAccess/CreateCursor', create_cursor),
+        _route('/DataAccess/GetSummary', get_summary),
+        _route('/DataAccess/FindByBusinessNo/{business_no}', find_by_business_no),
+        _route('/DataAccess/GetCompanyGroup/{business_no}', get_company_group),
+        _route('/DataAccess/TryFindCompanyBusinessNo', try_find_company),
+        # 其他路徑 (匯出、登入等) 仍由 Flask 處理
+        Mount('/', app=WSGIMiddleware(_closing_wsgi(flask_app))),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=flask_app.config['CORS_ORIGINS'], allow_methods=['*'], allow_headers=['*']),
+    ],
+    lifespan=lifespan,
+)
@@ -1,11 +1,113 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import create_access_token, get_jwt_identity
 from app.models import ApiKey
-from app import db
+from app import db, rate_limiter, deadlines
+from functools import wraps
 import datetime
+import secrets
+import time
+import click
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/Token')
 
+# 程序內的密鑰驗證快取
+# 雜湊值 -> (API 密鑰 ID, 世代值, 快取時間)
+_key_hash_cache = {}
+# API 密鑰 ID -> (是否啟用, 世代值, 快取時間)
+_key_active_cache = {}
+
+def _cache_valid(entry, ttl=None):
+    """快取項目需與共享世代值相同，且未超過 API_KEY_CACHE_TTL"""
+    _, generation, cached_at = entry
+    if ttl is None:
+        ttl = current_app.config.get('API_KEY_CACHE_TTL', 300)
+    return (
+        generation == rate_limiter.key_generation() and
+        time.time() - cached_at < ttl
+    )
+
+def verify_api_key(api_key):
+    """
+    驗證明文API密鑰，成功時回傳密鑰ID，失敗回傳 None
+    """
+    key_hash = ApiKey.hash_key(api_key)
+    
+    entry = _key_hash_cache.get(key_hash)
+    if entry and _cache_valid(entry):
+        return entry[0]
+    
+    generation = rate_limiter.key_generation()
+    key_record = ApiKey.query.filter_by(key=key_hash, is_active=True).first()
+    if not key_record:
+        _key_hash_cache.pop(key_hash, None)
+        return None
+    
+    _key_hash_cache[key_hash] = (key_record.id, generation, time.time())
+    return key_record.id
+
+def is_api_key_active(key_id):
+    """
+    檢查JWT中的API密鑰是否仍為啟用狀態
+    """
+    entry = _key_active_cache.get(key_id)
+    if entry and _cache_valid(entry):
+        return entry[0]
+    
+    generation = rate_limiter.key_generation()
+    key_record = ApiKey.query.get(int(key_id)) if str(key_id).isdigit() else None
+    active = bool(key_record and key_record.is_active)
+    
+    _key_active_cache[key_id] = (active, generation, time.time())
+    return active
+
+def deactivate_api_key(key_id):
+    """
+    停用API密鑰；after_update 事件會遞增共享世代值，讓所有 worker 的快取失效
+    """
+    key_record = ApiKey.query.get(key_id)
+    if not key_record:
+        return False
+    
+    key_record.is_active = False
+    db.session.commit()
+    return True
+
+def rate_limited(endpoint_class):
+    """
+    需放在 @jwt_required() 之後
+    檢查密鑰是否仍啟用，並套用該端點類別的 token bucket 與併發上限；
+    通過後開始計算該端點類別的請求時限 (app/deadline.py)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key_id = get_jwt_identity()
+            
+            if not is_api_key_active(key_id):
+                return jsonify({'error': 'API key has been deactivated'}), 401
+            
+            allowed, retry_after = rate_limiter.acquire(key_id, endpoint_class)
+            if not allowed:
+                return jsonify({'error': 'Too many requests'}), 429, {'Retry-After': str(retry_after)}
+            
+            deadline_token = deadlines.start(endpoint_class)
+            
+            def finish():
+                deadlines.finish(deadline_token)
+                rate_limiter.release(key_id, endpoint_class)
+            
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+            except Exception:
+                finish()
+                raise
+            
+            # 串流回應在傳送完畢後才釋放併發額度，時限也涵蓋串流期間的查詢
+            response.call_on_close(finish)
+            return response
+        return wrapper
+    return decorator
+
 @auth_bp.route('/Login', methods=['POST'])
 def login():
     """
@@ -18,16 +120,40 @@ def login():
     
     api_key = data['apiKey']
     
-    # 查詢API密鑰
-    key_record = ApiKey.query.filter_by(key=api_key, is_active=True).first()
+    # 以雜湊值驗證API密鑰
+    key_id = verify_api_key(api_key)
     
-    if not key_record:
+    if not key_id:
         return jsonify({'error': 'Invalid API key'}), 401
     
     # 創建JWT令牌
     access_token = create_access_token(
-        identity=str(key_record.id),
+        identity=str(key_id),
         expires_delta=datetime.timedelta(seconds=1209600)  # 14天
     )
     
-    return jsonify({'token': access_token}), 200
\ No newline at end of file
+    return jsonify({'token': access_token}), 200
+
+@auth_bp.cli.command('create-key')
+@click.option('--description', default=None, help='密鑰說明')
+def create_key_command(description):
+    """
+    建立新的API密鑰，明文只會顯示這一次
+    """
+    raw_key = secrets.token_urlsafe(32)
+    key_record = ApiKey(key=ApiKey.hash_key(raw_key), is_active=True, description=description)
+    db.session.add(key_record)
+    db.session.commit()
+    
+    print(f"已建立 API 密鑰 #{key_record.id}: {raw_key}")
+
+@auth_bp.cli.command('deactivate-key')
+@click.argument('key_id', type=int)
+def deactivate_key_command(key_id):
+    """
+    停用API密鑰
+    """
+    if deactivate_api_key(key_id):
+        print(f"已停用 API 密鑰 #{key_id}")
+    else:
+        print(f"找不到 API 密鑰 #{key_id}")
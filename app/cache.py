@@ -0,0 +1,291 @@
+# app/cache.py
+"""
+跨 worker 共用的壓縮回應快取
+
+同一台主機上的所有 gunicorn worker 透過 mmap 共用同一個檔案
+(預設放在 /dev/shm)，內容為 compress_data() 產生的壓縮字串。
+
+結構為 N 路組相聯 (set-associative) 雜湊表：
+- 每個 slot 大小固定，總容量 = slot 數量 * slot 大小 (位元組上限)
+- 同一組內以最後存取時間做 LRU 淘汰
+- 每筆資料帶有一或多個 tag (統一編號) 與匯入世代 (generation)，
+  可依統一編號失效，或遞增世代讓所有舊資料失效
+- slot 內依序為 slot 檔頭、各 tag 的雜湊值 (每個 8 位元組) 與資料本身
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# 檔頭: magic, version, slot_count, slot_size, generation, hits, misses, evictions, clock
+_HEADER = struct.Struct('<4sIIIQQQQQ')
+_HEADER_SIZE = 64
+_MAGIC = b'PCSH'
+_VERSION = 2
+
+# slot 檔頭: key_hash, generation, last_used, length, tag_count
+_SLOT = struct.Struct('<QQQII')
+_SLOT_HEADER_SIZE = 32
+_TAG = struct.Struct('<Q')
+
+# 每組 slot 數量
+_WAYS = 8
+
+
+class SharedMemoryFile:
+    """
+    以 mmap 映射的共享檔案
+    flock 鎖定的是開啟的檔案描述，fork 後 (例如 gunicorn --preload) 父子行程會共用同一個描述而失去互斥，
+    因此每個行程第一次上鎖時都重新開啟自己的檔案描述
+
+    同一行程內的執行緒共用同一個檔案描述，flock 對它們沒有互斥效果，
+    所以另外以 threading.Lock 讓行程內的執行緒依序進入
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._pid = os.getpid()
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self.lock():
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, size)
+            self.buf = mmap.mmap(self._fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    @contextmanager
+    def lock(self):
+        """先取得行程內的執行緒鎖，再以 flock 取得跨行程的互斥鎖"""
+        if self._pid != os.getpid():
+            # fork 時父行程其他執行緒可能正持有執行緒鎖，子行程改用新的鎖
+            self._thread_lock = threading.Lock()
+            self._fd = os.open(self.path, os.O_RDWR)
+            self._pid = os.getpid()
+
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+def shared_memory_path(app, config_key, filename):
+    """共享檔案路徑，預設放在 /dev/shm"""
+    default_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return app.config.get(config_key) or os.path.join(default_dir, filename)
+
+
+def stable_hash(value):
+    """將字串轉成非 0 的 64 位元雜湊值 (0 代表空 slot)"""
+    digest = hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class PayloadCache:
+    """
+    以 mmap 實作的跨 worker 讀取快取，用法與其他 Flask 擴展相同：
+    先建立實例，再於 create_app() 中呼叫 init_app(app)
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.path = None
+        self.slot_count = 0
+        self.slot_size = 0
+        self._shm = None
+        self._buf = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PAYLOAD_CACHE_ENABLED', True)
+        if not self.enabled:
+            return
+
+        self.path = shared_memory_path(app, 'PAYLOAD_CACHE_PATH', 'company_payload_cache')
+        self.slot_size = int(app.config.get('PAYLOAD_CACHE_SLOT_SIZE', 16 * 1024))
+        max_bytes = int(app.config.get('PAYLOAD_CACHE_SIZE_MB', 64)) * 1024 * 1024
+
+        # slot 數量需為組數的整數倍
+        sets = max(1, max_bytes // (self.slot_size * _WAYS))
+        self.slot_count = sets * _WAYS
+
+        self._open()
+
+    # ---- 共享記憶體管理 ----
+
+    def _open(self):
+        size = _HEADER_SIZE + self.slot_count * self.slot_size
+        self._shm = SharedMemoryFile(self.path, size)
+        self._buf = self._shm.buf
+
+        with self._shm.lock():
+            # 檔案不存在或幾何設定不同時重新初始化
+            magic, version, slot_count, slot_size = _HEADER.unpack_from(self._buf, 0)[:4]
+            if magic != _MAGIC or version != _VERSION or slot_count != self.slot_count or slot_size != self.slot_size:
+                self._buf[:size] = bytes(size)
+                _HEADER.pack_into(self._buf, 0, _MAGIC, _VERSION, self.slot_count, self.slot_size, 0, 0, 0, 0, 0)
+
+    def _read_header(self):
+        return list(_HEADER.unpack_from(self._buf, 0))
+
+    def _write_header(self, header):
+        _HEADER.pack_into(self._buf, 0, *header)
+
+    def _slot_offset(self, index):
+        return _HEADER_SIZE + index * self.slot_size
+
+    def _set_slots(self, key_hash):
+        first = (key_hash % (self.slot_count // _WAYS)) * _WAYS
+        return range(first, first + _WAYS)
+
+    # ---- 公開介面 ----
+
+    def get(self, key):
+        """讀取快取，未命中時回傳 None"""
+        if not self.enabled:
+            return None
+
+        key_hash = stable_hash(key)
+        with self._shm.lock():
+            header = self._read_header()
+            generation = header[4]
+            header[8] += 1  # clock
+
+            for index in self._set_slots(key_hash):
+                offset = self._slot_offset(index)
+                slot_key, slot_generation, _, length, tag_count = _SLOT.unpack_from(self._buf, offset)
+                if slot_key == key_hash and slot_generation == generation:
+                    _SLOT.pack_into(self._buf, offset, slot_key, slot_generation, header[8], length, tag_count)
+                    start = offset + _SLOT_HEADER_SIZE + tag_count * _TAG.size
+                    payload = self._buf[start:start + length].decode('utf-8')
+                    header[5] += 1
+                    self._write_header(header)
+                    return payload
+
+            header[6] += 1
+            self._write_header(header)
+        return None
+
+    def set(self, key, payload, tag=None, tags=()):
+        """
+        寫入快取；超過單一 slot 容量的資料直接略過
+        tag 通常為統一編號，供 invalidate_business_no() 使用；
+        包含多家公司的資料 (例如分頁摘要) 以 tags 傳入所有統一編號，任一公司異動時都會失效
+        """
+        if not self.enabled:
+            return False
+
+        tag_hashes = sorted({stable_hash(value) for value in ([tag] if tag else []) + list(tags) if value})
+        data = payload.encode('utf-8')
+        if len(data) + len(tag_hashes) * _TAG.size > self.slot_size - _SLOT_HEADER_SIZE:
+            return False
+
+        key_hash = stable_hash(key)
+        with self._shm.lock():
+            header = self._read_header()
+            generation = header[4]
+            header[8] += 1
+
+            # 優先使用相同 key、空的或過期世代的 slot，否則淘汰最久未使用者
+            target = None
+            target_used = None
+            evicting = False
+            for index in self._set_slots(key_hash):
+                slot_key, slot_generation, last_used = _SLOT.unpack_from(self._buf, self._slot_offset(index))[:3]
+                if slot_key == key_hash or slot_key == 0 or slot_generation != generation:
+                    target = index
+                    evicting = False
+                    break
+                if target_used is None or last_used < target_used:
+                    target = index
+                    target_used = last_used
+                    evicting = True
+
+            if evicting:
+                header[7] += 1
+
+            offset = self._slot_offset(target)
+            _SLOT.pack_into(self._buf, offset, key_hash, generation, header[8], len(data), len(tag_hashes))
+            start = offset + _SLOT_HEADER_SIZE
+            for tag_hash in tag_hashes:
+                _TAG.pack_into(self._buf, start, tag_hash)
+                start += _TAG.size
+            self._buf[start:start + len(data)] = data
+            self._write_header(header)
+        return True
+
+    def invalidate_business_no(self, business_no):
+        """讓指定統一編號的所有快取失效，回傳清除的筆數"""
+        return self.invalidate_business_nos([business_no])
+
+    def invalidate_business_nos(self, business_nos):
+        """讓多個統一編號的快取失效，只掃描一次所有 slot，回傳清除的筆數"""
+        if not self.enabled:
+            return 0
+
+        tag_hashes = {stable_hash(business_no) for business_no in business_nos}
+        if not tag_hashes:
+            return 0
+
+        removed = 0
+        with self._shm.lock():
+            for index in range(self.slot_count):
+                offset = self._slot_offset(index)
+                slot_key, _, _, _, tag_count = _SLOT.unpack_from(self._buf, offset)
+                if not slot_key:
+                    continue
+                start = offset + _SLOT_HEADER_SIZE
+                slot_tags = struct.unpack_from(f'<{tag_count}Q', self._buf, start)
+                if not tag_hashes.isdisjoint(slot_tags):
+                    _SLOT.pack_into(self._buf, offset, 0, 0, 0, 0, 0)
+                    removed += 1
+        return removed
+
+    def bump_generation(self):
+        """遞增匯入世代，讓目前所有快取資料失效"""
+        if not self.enabled:
+            return 0
+
+        with self._shm.lock():
+            header = self._read_header()
+            header[4] += 1
+            self._write_header(header)
+        return header[4]
+
+    def stats(self):
+        """回傳命中率與記憶體使用量"""
+        if not self.enabled:
+            return {'enabled': False}
+
+        with self._shm.lock():
+            header = self._read_header()
+            generation = header[4]
+            entries = 0
+            used_bytes = 0
+            for index in range(self.slot_count):
+                slot_key, slot_generation, _, length, _ = _SLOT.unpack_from(self._buf, self._slot_offset(index))
+                if slot_key and slot_generation == generation:
+                    entries += 1
+                    used_bytes += length
+
+        hits, misses, evictions = header[5], header[6], header[7]
+        lookups = hits + misses
+        return {
+            'enabled': True,
+            'generation': generation,
+            'hits': hits,
+            'misses': misses,
+            'hitRatio': round(hits / lookups, 4) if lookups else 0.0,
+            'evictions': evictions,
+            'entries': entries,
+            'slotCount': self.slot_count,
+            'slotSize': self.slot_size,
+            'usedBytes': used_bytes,
+            'capacityBytes': self.slot_count * self.slot_size,
+        }
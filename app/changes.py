@@ -0,0 +1,113 @@
+# app/changes.py
+"""
+登記資料的增量同步 (/DataAccess/Changes)
+
+異動資料依 company_govs 的 (data_last_modified_time, id) 排序，
+刪除紀錄依 company_gov_tombstones 的 (deleted_at, id) 排序，
+兩者各自以 keyset 分頁取出後依時間合併，讓下游依序套用新增、異動與刪除
+
+接續令牌記錄兩個來源各自已回傳到的位置，內容為 base64 編碼的 JSON，對下游而言不需解析
+"""
+import base64
+import datetime
+import json
+import re
+
+from sqlalchemy import and_, or_, true
+
+from app.models import CompanyGov, CompanyGovTombstone
+
+CHANGES_PAGE_SIZE = 1000
+CHANGES_MAX_PAGE_SIZE = 10000
+
+
+def encode_token(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def parse_limit(value):
+    """
+    limit 參數: 未提供時為 CHANGES_PAGE_SIZE，超過 CHANGES_MAX_PAGE_SIZE 時以上限計
+    不是正整數時拋出 ValueError (0 會讓下游以為永遠還有下一頁)
+    """
+    if value is None:
+        return CHANGES_PAGE_SIZE
+    if not re.fullmatch(r'[0-9]+', value.strip()) or int(value) < 1:
+        raise ValueError('limit 需為正整數')
+    return min(int(value), CHANGES_MAX_PAGE_SIZE)
+
+
+def decode_token(token):
+    """
+    回傳 {'changes': [時間, id] 或 None, 'deleted': [時間, id] 或 None}
+    未提供令牌時從頭開始，格式錯誤時拋出 ValueError
+    """
+    if not token:
+        return {'changes': None, 'deleted': None}
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return {
+            key: [datetime.datetime.fromisoformat(value[0]), int(value[1])] if value else None
+            for key, value in ((key, position.get(key)) for key in ('changes', 'deleted'))
+        }
+    except (ValueError, TypeError, AttributeError, IndexError):
+        raise ValueError('無效的 since 令牌')
+
+
+def _after(time_column, id_column, position):
+    """keyset 條件: (時間, id) > 上次位置"""
+    if position is None:
+        return true()
+    last_time, last_id = position
+    return or_(time_column > last_time, and_(time_column == last_time, id_column > last_id))
+
+
+def changes_page(session, token, limit=CHANGES_PAGE_SIZE):
+    """
+    取出令牌之後的一頁異動與刪除，回傳回應內容 (尚未壓縮)
+    兩個來源各取 limit 筆，依時間合併後只保留前 limit 筆，令牌只前進到實際回傳的位置；
+    未滿 limit 筆表示已同步到最新
+    """
+    position = decode_token(token)
+
+    changed = (
+        session.query(CompanyGov)
+        .filter(_after(CompanyGov.data_last_modified_time, CompanyGov.id, position['changes']))
+        .order_by(CompanyGov.data_last_modified_time, CompanyGov.id)
+        .limit(limit)
+        .all()
+    )
+    deleted = (
+        session.query(CompanyGovTombstone)
+        .filter(_after(CompanyGovTombstone.deleted_at, CompanyGovTombstone.id, position['deleted']))
+        .order_by(CompanyGovTombstone.deleted_at, CompanyGovTombstone.id)
+        .limit(limit)
+        .all()
+    )
+
+    # 同一時間點先套用刪除再套用新增，重新出現的統一編號不會被刪除蓋掉
+    events = sorted(
+        [(row.data_last_modified_time or datetime.datetime.min, 1, row.id, row) for row in changed] +
+        [(row.deleted_at, 0, row.id, row) for row in deleted],
+        key=lambda event: event[:3]
+    )[:limit]
+
+    changes, removals = [], []
+    for event_time, kind, row_id, row in events:
+        if kind == 1:
+            changes.append(row.to_dict())
+            position['changes'] = [event_time, row_id]
+        else:
+            removals.append({'BusinessNo': row.business_no, 'DeletedAt': row.deleted_at.isoformat()})
+            position['deleted'] = [event_time, row_id]
+
+    next_position = {
+        key: [value[0].isoformat(), value[1]] if value else None
+        for key, value in position.items()
+    }
+    return {
+        'Changes': changes,
+        'Deleted': removals,
+        'NextToken': encode_token(next_position),
+        'HasMore': len(events) == limit,
+    }
@@ -0,0 +1,159 @@
+# app/commands.py
+"""
+部署與維運用的 flask 指令
+"""
+import datetime
+import json
+import time
+
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """建立資料表並補上新增的欄位與索引"""
+    from app.schema import upgrade_schema
+
+    added = upgrade_schema()
+    for name in added:
+        print(f"已新增 {name}")
+    print("資料表已是最新版本")
+
+
+@click.command('backfill-typed-columns')
+@click.option('--batch-size', default=5000, show_default=True)
+@with_appcontext
+def backfill_typed_columns_command(batch_size):
+    """為既有資料補上數值資本額、西元設立日期與比對用的名稱分組鍵"""
+    from app.schema import backfill_typed_columns
+
+    processed = backfill_typed_columns(batch_size)
+    print(f"已處理 {processed} 筆")
+
+
+@click.command('refresh-branch-counts')
+@with_appcontext
+def refresh_branch_counts_command():
+    """重新計算登記資料的分公司數"""
+    from app.schema import refresh_branch_counts
+
+    updated = refresh_branch_counts()
+    print(f"已更新 {updated} 筆")
+
+
+@click.command('match-companies')
+@click.option('--workers', default=None, type=int, help='行程數，預設為 CPU 核心數；1 表示不使用行程池')
+@click.option('--chunk-size', default=500, show_default=True, help='每個工作處理的分組數')
+@click.option('--threshold', default=0.85, show_default=True, help='名稱相似度門檻')
+@with_appcontext
+def match_companies_command(workers, chunk_size, threshold):
+    """比對 Company 與登記資料，重建 company_links"""
+    from app.matching import match_companies
+
+    def on_progress(done, total):
+        print(f"名稱比對 {done}/{total}")
+
+    result = match_companies(workers, chunk_size, threshold, on_progress)
+    print(
+        f"統一編號相同 {result['exact']} 筆，名稱比對 {result['fuzzy']} 筆，"
+        f"未連結 {result['unmatched']} 筆"
+    )
+
+
+@click.command('build-business-no-index')
+@click.option('--if-missing', is_flag=True, help='索引檔已存在時不重建')
+@with_appcontext
+def build_business_no_index_command(if_missing):
+    """由登記資料重建統一編號點陣圖索引"""
+    from app import business_no_index
+
+    if if_missing and business_no_index.is_built():
+        print(f"索引已存在: {business_no_index.path}")
+        return
+    count = business_no_index.build()
+    print(f"已收錄 {count} 個統一編號: {business_no_index.path}")
+
+
+@click.command('build-snapshot')
+@click.option('--if-missing', is_flag=True, help='快照已存在時不重新輸出')
+@with_appcontext
+def build_snapshot_command(if_missing):
+    """由登記資料輸出欄式快照"""
+    from app import registry_snapshot
+
+    if if_missing and registry_snapshot.is_built():
+        print(f"快照已存在: {registry_snapshot.directory}")
+        return
+    count = registry_snapshot.build()
+    print(f"已輸出 {count} 筆: {registry_snapshot.directory}")
+
+
+@click.command('load-companies')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=1000, show_default=True, help='每個交易寫入的公司數')
+@with_appcontext
+def load_companies_command(path, batch_size):
+    """由 JSON Lines 檔 (每行一份公司文件) 批次寫入公司資料"""
+    from app.upsert import upsert_companies
+
+    def documents():
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    started = time.time()
+    result = upsert_companies(documents(), batch_size)
+    elapsed = time.time() - started
+    total = result['inserted'] + result['updated'] + result['unchanged']
+    print(
+        f"新增 {result['inserted']} 筆，更新 {result['updated']} 筆，未變動 {result['unchanged']} 筆，"
+        f"錯誤 {len(result['errors'])} 筆 ({elapsed:.1f} 秒，每秒 {total / elapsed if elapsed else 0:.0f} 筆)"
+    )
+    for error in result['errors'][:20]:
+        print(f"  第 {error['index'] + 1} 行: {error['error']}")
+
+
+@click.command('seed')
+@with_appcontext
+def seed_command():
+    """導入種子數據與政府登記資料"""
+    from app.seeds import seed_data
+
+    seed_data()
+
+
+@click.command('slow-query-report')
+@click.option('--hours', default=24, show_default=True, help='統計最近幾小時的記錄')
+@click.option('--top', default=20, show_default=True, help='顯示的分組數量')
+@click.option('--json', 'as_json', is_flag=True, help='以 JSON 輸出')
+@click.option('--explain', default=0, show_default=True,
+              help='每組最多以 EXPLAIN (ANALYZE, BUFFERS) 重新執行幾筆抽樣的查詢')
+@with_appcontext
+def slow_query_report_command(hours, top, as_json, explain):
+    """依關鍵字型態分組統計慢查詢，找出需要建立索引的查詢"""
+    from app import db, slow_query_log
+
+    since = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+    groups = slow_query_log.report(since, explain, db.engine if explain else None)[:top]
+
+    if as_json:
+        print(json.dumps(groups, ensure_ascii=False, indent=2))
+        return
+
+    if not groups:
+        print("沒有慢查詢記錄")
+        return
+
+    for group in groups:
+        print(f"[{group['endpoint']}] {group['pattern']}")
+        print(
+            f"  次數 {group['count']}  總耗時 {group['totalMs']}ms  "
+            f"p50 {group['p50Ms']}ms  p95 {group['p95Ms']}ms  最大 {group['maxMs']}ms  平均筆數 {group['avgRows']}"
+        )
+        if group['explained']:
+            print(f"  執行計畫 {group['explained']} 筆，其中 {group['seqScans']} 筆含 Seq Scan")
+        for keywords in group['examples']:
+            print(f"  例: {' '.join(keywords)}")
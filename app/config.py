@@ -1,14 +1,114 @@
 import os
 
+
+def _rate_limit(name, default):
+    """讀取 '每秒補充令牌數,令牌上限,同時執行上限' 格式的環境變數"""
+    rate, burst, concurrency = os.environ.get(name, default).split(',')
+    return float(rate), int(burst), int(concurrency)
+
+
+def _engine_options(uri):
+    """
+    連線池設定，主庫與唯讀副本共用
+    連線池參數只適用於 PostgreSQL，其他資料庫沿用 SQLAlchemy 預設值
+    """
+    if not uri.startswith('postgresql'):
+        return {}
+    
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true',
+    }
+    
+    # 每條連線的查詢逾時 (毫秒)，0 表示不限制
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if statement_timeout:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+def _deadline(name, default):
+    """讀取請求時限 (毫秒) 的環境變數，0 表示不限制"""
+    return int(os.environ.get(name, default))
+
+
 class Config:
     # 數據庫配置
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://postgres:postgres@db:5432/company_search')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
+    # 唯讀副本，以逗號分隔，未設定時所有查詢都使用主庫
+    SQLALCHEMY_REPLICA_URIS = [
+        uri.strip() for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri.strip()
+    ]
+    
+    # 每條連線的查詢逾時 (毫秒)，0 表示不限制；非同步模式以 asyncpg 的 server_settings 套用
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
     
     # JWT配置
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'dev_jwt_secret')
     JWT_ACCESS_TOKEN_EXPIRES = int(os.environ.get('JWT_ACCESS_TOKEN_EXPIRES', 1209600))  # 14天
     
+    # 共用回應快取配置
+    PAYLOAD_CACHE_ENABLED = os.environ.get('PAYLOAD_CACHE_ENABLED', 'true').lower() == 'true'
+    PAYLOAD_CACHE_PATH = os.environ.get('PAYLOAD_CACHE_PATH')  # 預設為 /dev/shm/company_payload_cache
+    PAYLOAD_CACHE_SIZE_MB = int(os.environ.get('PAYLOAD_CACHE_SIZE_MB', 64))
+    PAYLOAD_CACHE_SLOT_SIZE = int(os.environ.get('PAYLOAD_CACHE_SLOT_SIZE', 16384))
+    
+    # 非同步匯出工作配置
+    EXPORT_DIR = os.environ.get('EXPORT_DIR')  # 預設為系統暫存目錄下的 company_exports
+    EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', 2))  # 每個 web worker 的行程數
+    EXPORT_JOB_TTL = int(os.environ.get('EXPORT_JOB_TTL', 86400))  # 完成後保留1天
+    EXPORT_JOB_HEARTBEAT = int(os.environ.get('EXPORT_JOB_HEARTBEAT', 30))  # 秒
+    EXPORT_JOB_STALE_AFTER = int(os.environ.get('EXPORT_JOB_STALE_AFTER', 120))  # 超過此秒數未更新視為中斷
+    
+    # API 密鑰限流配置
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_PATH = os.environ.get('RATE_LIMIT_PATH')  # 預設為 /dev/shm/company_rate_limits
+    RATE_LIMITS = {
+        'search': _rate_limit('RATE_LIMIT_SEARCH', '1,10,2'),
+        'export': _rate_limit('RATE_LIMIT_EXPORT', '0.2,3,1'),
+        'read': _rate_limit('RATE_LIMIT_READ', '20,100,10'),
+    }
+    API_KEY_CACHE_TTL = int(os.environ.get('API_KEY_CACHE_TTL', 300))
+    
+    # 依端點類別設定的請求時限 (毫秒)，超過時中止查詢並回應 422
+    DEADLINE_ENABLED = os.environ.get('DEADLINE_ENABLED', 'true').lower() == 'true'
+    # gunicorn.conf.py 以最長的時限決定 worker 逾時，新增類別時一併更新
+    DEADLINES = {
+        'search': _deadline('DEADLINE_SEARCH_MS', 15000),
+        'export': _deadline('DEADLINE_EXPORT_MS', 300000),
+        'read': _deadline('DEADLINE_READ_MS', 5000),
+    }
+    
+    # 統一編號點陣圖索引，預設為 /dev/shm/company_business_no_index
+    BUSINESS_NO_INDEX_PATH = os.environ.get('BUSINESS_NO_INDEX_PATH')
+    VALIDATE_BUSINESS_NOS_LIMIT = int(os.environ.get('VALIDATE_BUSINESS_NOS_LIMIT', 100000))  # 單次驗證的筆數上限
+    
+    # 登記資料欄式快照目錄，預設為 instance 資料夾下的 registry_snapshot
+    SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR')
+    
+    # 公司資料批次寫入 (/DataAccess/UpsertCompanies)
+    UPSERT_MAX_COMPANIES = int(os.environ.get('UPSERT_MAX_COMPANIES', 10000))  # 單次請求的筆數上限
+    UPSERT_BATCH_SIZE = int(os.environ.get('UPSERT_BATCH_SIZE', 1000))  # 每個交易寫入的公司數
+    
+    # Prometheus 監控指標 (/metrics)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    
+    # 慢查詢記錄
+    SLOW_QUERY_ENABLED = os.environ.get('SLOW_QUERY_ENABLED', 'true').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 500))
+    SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', 0.1))  # 標記供 slow-query-report --explain 取得執行計畫的比例
+    SLOW_QUERY_LOG_DIR = os.environ.get('SLOW_QUERY_LOG_DIR')  # 預設為系統暫存目錄下的 slow_queries
+    SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get('SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024))
+    SLOW_QUERY_LOG_BACKUPS = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', 5))
+    
+    # 允許跨域請求的前端來源，以逗號分隔
+    CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:8080').split(',')
+    
     # 應用配置
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev_secret_key')
     DEBUG = os.environ.get('FLASK_ENV') == 'development'
\ No newline at end of file
@@ -0,0 +1,171 @@
+# app/deadline.py
+"""
+依端點類別設定的請求時限
+
+每個請求在通過限流後取得所屬端點類別 (search / export / read) 的時限，
+時限內執行的 SQL 以 PostgreSQL 的 SET LOCAL statement_timeout 限制為剩餘的時間，
+超過時由資料庫中止查詢，連線與 worker 隨即釋放；時限已用完時不再送出新的查詢
+
+- 每個交易只在第一個查詢前設定一次，交易結束後自動恢復連線預設值
+- 查詢被中止 (SQLSTATE 57014) 時改為拋出 QueryTooBroad，回應 422 並建議縮小查詢範圍
+- 非同步模式另在用戶端中斷連線或時限到期時取消執行中的查詢 (見 app/asgi.py)
+- 中止次數依端點與原因記錄於 request_deadline_exceeded_total，用來調整各類別的時限
+
+背景工作與 CLI 指令不在請求中執行，不受時限限制
+"""
+import contextvars
+import time
+
+from flask import jsonify
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.metrics import observe_deadline
+
+# 預設時限 (毫秒): 端點類別 -> 時限，0 表示不限制
+DEFAULT_DEADLINES = {
+    'search': 15000,
+    'export': 300000,
+    'read': 5000,
+}
+
+# PostgreSQL 的 query_canceled
+_QUERY_CANCELED = '57014'
+
+# 各端點類別的縮小範圍建議
+_SUGGESTIONS = {
+    'search': '請增加或加長關鍵字，或加上資本額、設立日期等範圍條件',
+    'export': '請縮小匯出範圍，或改用 /DataAccess/ExportJobs 在背景匯出',
+    'read': '請縮小查詢範圍後重試',
+}
+
+
+class QueryTooBroad(Exception):
+    """請求的查詢未能在時限內完成"""
+
+    def __init__(self, endpoint_class, budget_ms, reason='timeout'):
+        super().__init__(f'{endpoint_class} 查詢超過時限 {budget_ms}ms')
+        self.endpoint_class = endpoint_class
+        self.budget_ms = budget_ms
+        self.reason = reason
+
+    def to_dict(self):
+        return {
+            'error': '查詢範圍過大，未能在時限內完成',
+            'suggestion': _SUGGESTIONS.get(self.endpoint_class, _SUGGESTIONS['read']),
+            'reason': self.reason,
+            'deadlineMs': self.budget_ms,
+        }
+
+
+class _Budget:
+    __slots__ = ('endpoint_class', 'budget_ms', 'expires_at', 'exceeded')
+
+    def __init__(self, endpoint_class, budget_ms):
+        self.endpoint_class = endpoint_class
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000
+        self.exceeded = False
+
+    def remaining_ms(self):
+        return int((self.expires_at - time.monotonic()) * 1000)
+
+    def exceed(self, reason):
+        """回傳要拋出的 QueryTooBroad，同一個請求只記錄一次"""
+        if not self.exceeded:
+            self.exceeded = True
+            observe_deadline(self.endpoint_class, reason)
+        return QueryTooBroad(self.endpoint_class, self.budget_ms, reason)
+
+
+# 目前請求的時限，Flask 的執行緒與非同步模式的 task 各自獨立
+_current = contextvars.ContextVar('request_deadline', default=None)
+
+
+def current_budget():
+    """目前請求的時限，請求以外或未設定時限時回傳 None"""
+    return _current.get()
+
+
+def clear_budget():
+    """
+    清除目前 context 的時限
+    行程池在請求中以 fork 建立時，子行程會沿用該請求的時限，需在子行程初始化時清除
+    """
+    _current.set(None)
+
+
+def _sqlstate(error):
+    return getattr(error, 'pgcode', None) or getattr(error, 'sqlstate', None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    budget = _current.get()
+    if budget is None:
+        return
+
+    remaining = budget.remaining_ms()
+    if remaining <= 0:
+        raise budget.exceed('timeout')
+
+    if conn.dialect.name != 'postgresql':
+        return
+
+    # 同一個交易已設定過時就不再重複設定，省下一次來回
+    transaction = conn.get_transaction()
+    applied = conn.info.get('_deadline')
+    if transaction is not None and applied is not None and applied[0] is transaction and applied[1] is budget:
+        return
+
+    # 使用另一個 DBAPI 游標，伺服器端游標 (stream_results) 不能先執行其他語句
+    dbapi_cursor = conn.connection.cursor()
+    try:
+        dbapi_cursor.execute(f'SET LOCAL statement_timeout = {remaining}')
+    finally:
+        dbapi_cursor.close()
+    conn.info['_deadline'] = (transaction, budget) if transaction is not None else None
+
+
+def _handle_error(context):
+    budget = _current.get()
+    if budget is not None and _sqlstate(context.original_exception) == _QUERY_CANCELED:
+        raise budget.exceed('timeout') from context.original_exception
+
+
+class RequestDeadlines:
+    """請求時限，用法與其他 Flask 擴展相同"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.deadlines = dict(DEFAULT_DEADLINES)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('DEADLINE_ENABLED', True)
+        self.deadlines.update(app.config.get('DEADLINES', {}))
+        if not self.enabled:
+            return
+
+        # 監聽所有引擎 (主庫、副本與非同步模式的引擎)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+        app.register_error_handler(QueryTooBroad, lambda e: (jsonify(e.to_dict()), 422))
+
+    def start(self, endpoint_class):
+        """開始計時，回傳 finish() 需要的 token；未設定時限時回傳 None"""
+        budget_ms = self.deadlines.get(endpoint_class, 0) if self.enabled else 0
+        if not budget_ms:
+            return None
+        return _current.set(_Budget(endpoint_class, budget_ms))
+
+    def finish(self, token):
+        if token is None:
+            return
+        try:
+            _current.reset(token)
+        except ValueError:
+            # 串流回應可能在另一個 context 中結束 (例如非同步模式轉交的 Flask 請求)
+            _current.set(None)
@@ -0,0 +1,473 @@
+# app/exports.py
+"""
+匯出檔案產生工具
+
+以批次方式只查詢匯出需要的欄位，子表資料在資料庫端以 string_agg 串接，
+再逐列寫入檔案，讓記憶體用量不隨匯出筆數增加
+
+xlsxwriter / python-docx / pyarrow 只在實際匯出時才載入，不影響 worker 啟動時間
+"""
+import csv
+import datetime
+import functools
+import io
+import json
+import re
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+from sqlalchemy import DateTime, Integer, cast, func, literal, select
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+
+from app import db
+from app.models import (
+    Company, CompanyGov, SearchCursor,
+    Industrial, Contact, Telephone, Fax, Email, Website
+)
+
+# 每批查詢的統一編號數量
+EXPORT_BATCH_SIZE = 1000
+
+# 暫存檔超過此大小才寫入磁碟
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def _joined(model, column):
+    """子表欄位以 ', ' 串接的相關子查詢"""
+    return (
+        select(func.string_agg(column, aggregate_order_by(literal(', '), model.id)))
+        .where(model.company_id == Company.id)
+        .scalar_subquery()
+    )
+
+
+def _first(model, column):
+    """子表中第一筆資料的相關子查詢"""
+    return (
+        select(column)
+        .where(model.company_id == Company.id)
+        .order_by(model.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+# 企業資訊匯出欄位: (標題, 查詢欄位)
+COMPANY_INFO_COLUMNS = [
+    ('統一編號', Company.business_no),
+    ('公司名稱', Company.company_name),
+    ('地址', Company.company_address),
+    ('簡介', Company.business_description),
+    ('資本額', Company.capital_amount),
+    ('員工人數', Company.employee_count),
+    ('組織別', Company.organization_type),
+    ('產業類別', _joined(Industrial, Industrial.name)),
+    ('聯絡人', _joined(Contact, Contact.name)),
+    ('電話', _joined(Telephone, Telephone.number)),
+    ('傳真', _joined(Fax, Fax.number)),
+    ('電子信箱', _joined(Email, Email.address)),
+    ('企業網站', _joined(Website, Website.url)),
+]
+
+# 登記資料匯出欄位，標題與 CompanyGov.to_dict() 相同
+COMPANY_GOV_COLUMNS = [
+    ('_id', CompanyGov._id),
+    ('BusinessNo', CompanyGov.business_no),
+    ('CapitalAmount', CompanyGov.capital_amount),
+    ('CompanyAddress', CompanyGov.company_address),
+    ('CompanyAddressPart', CompanyGov.company_address_part),
+    ('CompanyName', CompanyGov.company_name),
+    ('CompanyNamePart', CompanyGov.company_name_part),
+    ('CreateDate', CompanyGov.create_date),
+    ('DataCreateTime', CompanyGov.data_create_time),
+    ('DataLastModifiedTime', CompanyGov.data_last_modified_time),
+    ('HeadOfficeBusinessNo', CompanyGov.head_office_business_no),
+    ('IndustrialCode1', CompanyGov.industrial_code1),
+    ('IndustrialCode2', CompanyGov.industrial_code2),
+    ('IndustrialCode3', CompanyGov.industrial_code3),
+    ('IndustrialCode4', CompanyGov.industrial_code4),
+    ('IndustrialName1', CompanyGov.industrial_name1),
+    ('IndustrialName2', CompanyGov.industrial_name2),
+    ('IndustrialName3', CompanyGov.industrial_name3),
+    ('IndustrialName4', CompanyGov.industrial_name4),
+    ('OrganizationType', CompanyGov.organization_type),
+    ('UseBusinessInvoice', CompanyGov.use_business_invoice),
+]
+
+
+def _iter_rows_by_business_no(columns, business_no_column, business_nos, batch_size, on_progress):
+    """
+    依輸入順序逐列產生資料，每批只發出一次查詢
+    找不到的統一編號直接略過；on_progress 於每批結束時收到已處理的統一編號數量
+    """
+    labeled = [column.label(f'c{i}') for i, (_, column) in enumerate(columns)]
+    key_index = [column for _, column in columns].index(business_no_column)
+
+    for start in range(0, len(business_nos), batch_size):
+        batch = business_nos[start:start + batch_size]
+        rows = db.session.execute(
+            select(*labeled).where(business_no_column.in_(batch))
+        ).all()
+
+        by_business_no = {row[key_index]: row for row in rows}
+        for business_no in batch:
+            row = by_business_no.get(business_no)
+            if row is not None:
+                yield tuple(row)
+
+        if on_progress:
+            on_progress(start + len(batch))
+
+
+def _iter_all_rows(columns, order_by, batch_size, join=None):
+    """
+    以伺服器端游標 (named cursor) 分批讀取資料
+    join 為 (子查詢, 連接條件)，用於只讀取搜尋游標中的結果
+    """
+    labeled = [column.label(f'c{i}') for i, (_, column) in enumerate(columns)]
+    stmt = select(*labeled)
+    if join is not None:
+        stmt = stmt.join(*join)
+
+    result = db.session.execute(
+        stmt.order_by(order_by),
+        execution_options={'stream_results': True}
+    )
+    for rows in result.partitions(batch_size):
+        for row in rows:
+            yield tuple(row)
+
+
+def cursor_results(cursor_id):
+    """
+    搜尋游標結果的子查詢 (business_no, position)
+    直接在資料庫端展開 search_cursors.result_ids，結果ID不必經過應用程式；
+    結果ID為 CompanyGov.id，與 GetSummary (app/search.py 的 summary_page_statement) 同樣經由統一編號對應
+    """
+    ids = (
+        func.json_array_elements_text(
+            select(cast(SearchCursor.result_ids, JSON))
+            .where(SearchCursor.cursor_id == cursor_id)
+            .scalar_subquery()
+        )
+        .table_valued('value', with_ordinality='position')
+        .render_derived(name='cursor_ids')
+    )
+    return (
+        select(CompanyGov.business_no, ids.c.position)
+        .join_from(ids, CompanyGov, CompanyGov.id == cast(ids.c.value, Integer))
+        .subquery('cursor_results')
+    )
+
+
+def _iter_rows_by_cursor(columns, business_no_column, cursor_id, batch_size, on_progress):
+    """依搜尋游標的結果順序逐列產生資料"""
+    results = cursor_results(cursor_id)
+    rows = _iter_all_rows(
+        columns, results.c.position, batch_size,
+        join=(results, business_no_column == results.c.business_no)
+    )
+    for i, row in enumerate(rows, start=1):
+        yield row
+        if on_progress and i % batch_size == 0:
+            on_progress(i)
+
+
+def iter_company_info_rows(business_nos=None, cursor_id=None, batch_size=EXPORT_BATCH_SIZE, on_progress=None):
+    """依統一編號清單或搜尋游標的順序逐列產生企業資訊"""
+    if cursor_id is not None:
+        return _iter_rows_by_cursor(
+            COMPANY_INFO_COLUMNS, Company.business_no, cursor_id, batch_size, on_progress
+        )
+    return _iter_rows_by_business_no(
+        COMPANY_INFO_COLUMNS, Company.business_no, business_nos, batch_size, on_progress
+    )
+
+
+def iter_company_gov_rows(business_nos=None, cursor_id=None, batch_size=EXPORT_BATCH_SIZE, on_progress=None):
+    """
+    逐列產生登記資料
+    未指定統一編號或搜尋游標時以伺服器端游標匯出整張 company_govs
+    """
+    if cursor_id is not None:
+        return _iter_rows_by_cursor(
+            COMPANY_GOV_COLUMNS, CompanyGov.business_no, cursor_id, batch_size, on_progress
+        )
+    if business_nos is None:
+        return _iter_all_rows(COMPANY_GOV_COLUMNS, CompanyGov.id, batch_size)
+    return _iter_rows_by_business_no(
+        COMPANY_GOV_COLUMNS, CompanyGov.business_no, business_nos, batch_size, on_progress
+    )
+
+
+def _to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(headers, rows, flush_rows=EXPORT_BATCH_SIZE):
+    """逐批產生 UTF-8 編碼的 CSV 內容，供串流回應使用"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+
+    for i, row in enumerate(rows, start=1):
+        writer.writerow([_to_text(value) for value in row])
+        if i % flush_rows == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_jsonl(headers, rows, flush_rows=EXPORT_BATCH_SIZE):
+    """逐批產生 JSON Lines 內容，每列一個物件"""
+    lines = []
+    for row in rows:
+        record = {header: value for header, value in zip(headers, row)}
+        lines.append(json.dumps(record, ensure_ascii=False, default=_to_text))
+        if len(lines) == flush_rows:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _arrow_type(sql_type):
+    """依 SQLAlchemy 欄位型別決定 Parquet 欄位型別"""
+    import pyarrow as pa
+
+    if isinstance(sql_type, Integer):
+        return pa.int64()
+    if isinstance(sql_type, DateTime):
+        return pa.timestamp('us')
+    return pa.string()
+
+
+def write_parquet(columns, rows, output=None, row_group_size=50000):
+    """
+    以 pyarrow 分 row group 寫入 Parquet，記憶體中最多只保留一個 row group
+    未指定 output 時寫入暫存檔並回傳檔案物件
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(header, _arrow_type(column.type)) for header, column in columns])
+    if output is None:
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+    def flush(batch):
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    with pq.ParquetWriter(output, schema, compression='snappy') as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == row_group_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+    if hasattr(output, 'seek'):
+        output.seek(0)
+    return output
+
+
+def write_xlsx(headers, rows, sheet_name, output=None):
+    """
+    以 xlsxwriter 的 constant_memory 模式逐列寫入
+    未指定 output 時寫入暫存檔，回傳已移到開頭、可直接交給 send_file 的檔案物件
+    """
+    import xlsxwriter
+
+    if output is None:
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    worksheet = workbook.add_worksheet(sheet_name)
+
+    # 與 pandas to_excel 相同的標題樣式
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    worksheet.write_row(0, 0, headers, header_format)
+
+    for row_idx, row in enumerate(rows, start=1):
+        worksheet.write_row(row_idx, 0, row)
+
+    workbook.close()
+    if hasattr(output, 'seek'):
+        output.seek(0)
+    return output
+
+
+def export_company_infos_xlsx(business_nos=None, output=None, on_progress=None, cursor_id=None):
+    """產生企業資訊 Excel 檔"""
+    headers = [header for header, _ in COMPANY_INFO_COLUMNS]
+    rows = iter_company_info_rows(business_nos, cursor_id, on_progress=on_progress)
+    return write_xlsx(headers, rows, '企業資訊', output)
+
+
+# 企業名條欄位: 名稱、地址、第一支電話、第一支傳真
+LABEL_COLUMNS = [
+    ('統一編號', Company.business_no),
+    ('公司名稱', Company.company_name),
+    ('地址', Company.company_address),
+    ('電話', _first(Telephone, Telephone.number)),
+    ('傳真', _first(Fax, Fax.number)),
+]
+
+# 每頁名條表格的欄數
+LABEL_COLUMNS_PER_ROW = 3
+
+# 不允許出現在 XML 中的控制字元
+_XML_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+@functools.lru_cache(maxsize=1)
+def _label_template():
+    """
+    以 python-docx 預先建立一次空白範本 (含邊距與 Table Grid 樣式)
+    回傳 (其他檔案內容, document.xml 開頭, document.xml 結尾, 欄寬)
+    """
+    from docx import Document
+    from docx.shared import Pt
+
+    doc = Document()
+    for section in doc.sections:
+        section.top_margin = Pt(36)
+        section.bottom_margin = Pt(36)
+        section.left_margin = Pt(36)
+        section.right_margin = Pt(36)
+
+    section = doc.sections[0]
+    block_width = section.page_width - section.left_margin - section.right_margin
+    column_width = int(block_width / LABEL_COLUMNS_PER_ROW / 635)  # EMU 轉 twips
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+
+    parts = {}
+    with zipfile.ZipFile(buffer) as package:
+        for name in package.namelist():
+            parts[name] = package.read(name)
+
+    document_xml = parts.pop('word/document.xml').decode('utf-8')
+    body_start = document_xml.index('<w:body>') + len('<w:body>')
+    body_end = document_xml.index('<w:sectPr')
+    return parts, document_xml[:body_start], document_xml[body_end:], column_width
+
+
+def _label_run(text, size, bold=False):
+    """單一文字段落，結尾換行 (等同 python-docx 的 add_run(text + '\\n'))"""
+    text = escape(_XML_INVALID_CHARS.sub('', str(text)))
+    bold_xml = '<w:b/>' if bold else ''
+    return (
+        f'<w:r><w:rPr>{bold_xml}<w:sz w:val="{size}"/></w:rPr>'
+        f'<w:t xml:space="preserve">{text}</w:t><w:br/></w:r>'
+    )
+
+
+def _label_cell(row, font_size, column_width):
+    """名條儲存格 XML"""
+    runs = ''
+    if row is not None:
+        _, name, address, telephone, fax = row
+        title_size = int(round(font_size * 2))
+        text_size = int(round((font_size - 2) * 2))
+
+        runs = _label_run(name, title_size, bold=True)
+        runs += _label_run(f'地址: {address}', text_size)
+        if telephone:
+            runs += _label_run(f'電話: {telephone}', text_size)
+        if fax:
+            runs += _label_run(f'傳真: {fax}', text_size)
+
+    return (
+        f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{column_width}"/></w:tcPr>'
+        f'<w:p>{runs}</w:p></w:tc>'
+    )
+
+
+def _label_table(rows, font_size, column_width):
+    """一頁名條的表格 XML，不足一列的部分以空白儲存格補齊"""
+    grid = ''.join(f'<w:gridCol w:w="{column_width}"/>' for _ in range(LABEL_COLUMNS_PER_ROW))
+    parts = [
+        '<w:tbl><w:tblPr><w:tblStyle w:val="TableGrid"/><w:tblW w:type="auto" w:w="0"/>'
+        '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+        'w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr>',
+        f'<w:tblGrid>{grid}</w:tblGrid>',
+    ]
+
+    rows_count = max(1, -(-len(rows) // LABEL_COLUMNS_PER_ROW))  # 向上取整
+    for row_idx in range(rows_count):
+        cells = rows[row_idx * LABEL_COLUMNS_PER_ROW:(row_idx + 1) * LABEL_COLUMNS_PER_ROW]
+        cells += [None] * (LABEL_COLUMNS_PER_ROW - len(cells))
+        parts.append('<w:tr>' + ''.join(_label_cell(cell, font_size, column_width) for cell in cells) + '</w:tr>')
+
+    parts.append('</w:tbl>')
+    return ''.join(parts)
+
+
+def export_company_labels_docx(business_nos=None, font_size=12, count_per_page=9, output=None, on_progress=None,
+                               cursor_id=None):
+    """
+    產生企業名條 Word 檔
+    一次查詢整批公司的名稱、地址與第一支電話/傳真，
+    再直接把 document.xml 寫入預先建立的範本，每 count_per_page 筆換一頁
+    未指定 output 時寫入暫存檔並回傳檔案物件
+    """
+    font_size = float(font_size)
+    count_per_page = max(1, int(count_per_page))
+    parts, document_head, document_tail, column_width = _label_template()
+
+    if output is None:
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+    if cursor_id is not None:
+        rows = _iter_rows_by_cursor(LABEL_COLUMNS, Company.business_no, cursor_id, EXPORT_BATCH_SIZE, on_progress)
+    else:
+        rows = _iter_rows_by_business_no(
+            LABEL_COLUMNS, Company.business_no, business_nos, EXPORT_BATCH_SIZE, on_progress
+        )
+
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as package:
+        for name, content in parts.items():
+            package.writestr(name, content)
+
+        with package.open('word/document.xml', 'w') as document:
+            document.write(document_head.encode('utf-8'))
+
+            # 每頁一個表格，頁與頁之間以分頁符號分隔
+            page = []
+            pages_written = 0
+            for row in rows:
+                page.append(row)
+                if len(page) == count_per_page:
+                    if pages_written:
+                        document.write(b'<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+                    document.write(_label_table(page, font_size, column_width).encode('utf-8'))
+                    pages_written += 1
+                    page = []
+
+            if page or not pages_written:
+                if pages_written:
+                    document.write(b'<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+                document.write(_label_table(page, font_size, column_width).encode('utf-8'))
+
+            document.write(document_tail.encode('utf-8'))
+
+    if hasattr(output, 'seek'):
+        output.seek(0)
+    return output
@@ -0,0 +1,218 @@
+# app/jobs.py
+"""
+非同步匯出工作
+
+大量匯出改由背景行程產生檔案，請求端只負責提交工作、查詢進度與下載：
+- 工作狀態存放在 export_jobs 資料表，所有 worker 都能查詢
+- 每個 web worker 擁有一個有上限的行程池，實際產生檔案，
+  整台主機同時執行的匯出數量為 gunicorn workers * EXPORT_JOB_WORKERS
+- 完成的檔案存放在 EXPORT_DIR，超過 TTL 後連同工作記錄一併清除
+
+工作排在 web worker 的行程池中，worker 重新啟動 (max_requests、部署或當機) 時未完成的工作隨之遺失；
+擁有行程池的 worker 定期更新自己工作的 heartbeat_at，提交或查詢工作時
+將超過 EXPORT_JOB_STALE_AFTER 未更新的 pending / running 工作標記為失敗，讓用戶端重新提交
+"""
+import datetime
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from app import db
+from app.deadline import clear_budget
+from app.exports import export_company_infos_xlsx, export_company_labels_docx
+from app.models import ExportJob
+
+# 匯出類型: (產生函數, 副檔名, MIME 類型)
+EXPORT_TYPES = {
+    'CompanyInfos': (
+        lambda params, path, on_progress: export_company_infos_xlsx(
+            params['businessNos'], output=path, on_progress=on_progress, cursor_id=params.get('cursorId')
+        ),
+        'xlsx',
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    ),
+    'CompanyLabels': (
+        lambda params, path, on_progress: export_company_labels_docx(
+            params['businessNos'],
+            params.get('fontSize', 12),
+            params.get('countPerPage', 9),
+            output=path,
+            on_progress=on_progress,
+            cursor_id=params.get('cursorId'),
+        ),
+        'docx',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    ),
+}
+
+
+class ExportJobRunner:
+    """
+    匯出工作執行器，用法與其他 Flask 擴展相同
+    行程池在第一次提交工作時才以 fork 建立
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.export_dir = None
+        self.max_workers = 2
+        self.ttl = datetime.timedelta(hours=24)
+        self.heartbeat_interval = 30
+        self.stale_after = datetime.timedelta(seconds=120)
+        self.runner_id = None
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.export_dir = app.config.get('EXPORT_DIR') or os.path.join(tempfile.gettempdir(), 'company_exports')
+        self.max_workers = int(app.config.get('EXPORT_JOB_WORKERS', 2))
+        self.ttl = datetime.timedelta(seconds=int(app.config.get('EXPORT_JOB_TTL', 86400)))
+        self.heartbeat_interval = int(app.config.get('EXPORT_JOB_HEARTBEAT', 30))
+        self.stale_after = datetime.timedelta(seconds=int(app.config.get('EXPORT_JOB_STALE_AFTER', 120)))
+        os.makedirs(self.export_dir, exist_ok=True)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=_init_worker,
+            )
+            # 每個行程池 (即每個 web worker) 一個識別碼，heartbeat 只更新自己的工作
+            self.runner_id = str(uuid.uuid4())
+            threading.Thread(target=self._heartbeat_loop, args=(self.runner_id,), daemon=True).start()
+        return self._executor
+
+    def _heartbeat_loop(self, runner_id):
+        while self.runner_id == runner_id:
+            time.sleep(self.heartbeat_interval)
+            with self.app.app_context():
+                try:
+                    self.heartbeat(runner_id)
+                except Exception:
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def heartbeat(self, runner_id):
+        """更新此行程池中尚未完成的工作的 heartbeat_at"""
+        ExportJob.query.filter(
+            ExportJob.runner_id == runner_id, ExportJob.status.in_(('pending', 'running'))
+        ).update({'heartbeat_at': datetime.datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+
+    def fail_stale(self):
+        """將 heartbeat_at (尚未更新時為 created_at) 超過 EXPORT_JOB_STALE_AFTER 的 pending / running 工作標記為失敗，回傳筆數"""
+        now = datetime.datetime.utcnow()
+        stale = ExportJob.query.filter(
+            ExportJob.status.in_(('pending', 'running')),
+            db.func.coalesce(ExportJob.heartbeat_at, ExportJob.created_at) < now - self.stale_after,
+        ).update({
+            'status': 'failed',
+            'error': '匯出工作因伺服器重新啟動而中斷，請重新提交',
+            'finished_at': now,
+        }, synchronize_session=False)
+        if stale:
+            db.session.commit()
+        return stale
+
+    def submit(self, export_type, params, total_count, owner_id=None):
+        """建立工作記錄並交給行程池，回傳 ExportJob"""
+        self.cleanup_expired()
+        self.fail_stale()
+        executor = self._get_executor()
+
+        job = ExportJob(
+            job_id=str(uuid.uuid4()),
+            owner_id=owner_id,
+            export_type=export_type,
+            params=json.dumps(params),
+            status='pending',
+            total_count=total_count,
+            runner_id=self.runner_id,
+            heartbeat_at=datetime.datetime.utcnow(),
+            expires_at=datetime.datetime.utcnow() + self.ttl
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        executor.submit(_run_job, job.job_id)
+        return job
+
+    def file_path(self, job):
+        _, extension, _ = EXPORT_TYPES[job.export_type]
+        return os.path.join(self.export_dir, f'{job.job_id}.{extension}')
+
+    def cleanup_expired(self):
+        """刪除過期的工作記錄與檔案，回傳清除的筆數"""
+        expired = ExportJob.query.filter(ExportJob.expires_at < datetime.datetime.utcnow()).all()
+        for job in expired:
+            path = self.file_path(job)
+            if os.path.exists(path):
+                os.remove(path)
+            db.session.delete(job)
+
+        if expired:
+            db.session.commit()
+        return len(expired)
+
+
+def _init_worker():
+    """
+    子行程初始化：fork 後不可沿用父行程的資料庫連線
+    close=False 只丟棄連線池，不關閉父行程仍在使用的連線
+    行程池在 POST /ExportJobs 請求中建立，子行程也會沿用該請求的時限，背景工作不受時限限制
+    """
+    clear_budget()
+    with export_jobs.app.app_context():
+        db.dispose_engines(close=False)
+
+
+def _transition(job_id, status, values):
+    """工作仍為 status 時才更新為 values，回傳是否有更新；已被 fail_stale() 標記為失敗的工作不會被覆寫"""
+    updated = ExportJob.query.filter_by(job_id=job_id, status=status).update(values, synchronize_session=False)
+    db.session.commit()
+    return updated > 0
+
+
+def _run_job(job_id):
+    """
+    在子行程中產生匯出檔案並更新工作狀態
+    狀態只依 pending -> running -> done / failed 前進；執行期間被標記為失敗的工作維持失敗並刪除檔案
+    """
+    with export_jobs.app.app_context():
+        job = ExportJob.query.filter_by(job_id=job_id).first()
+        if not job or not _transition(job_id, 'pending', {'status': 'running'}):
+            db.session.remove()
+            return
+
+        def on_progress(done):
+            ExportJob.query.filter_by(job_id=job_id, status='running').update({'progress': done})
+            db.session.commit()
+
+        render, _, _ = EXPORT_TYPES[job.export_type]
+        path = export_jobs.file_path(job)
+        try:
+            render(json.loads(job.params), path, on_progress)
+        except Exception as e:
+            db.session.rollback()
+            result = {'status': 'failed', 'error': str(e)}
+        else:
+            result = {'status': 'done', 'progress': job.total_count, 'file_path': path}
+        result['finished_at'] = datetime.datetime.utcnow()
+
+        if not _transition(job_id, 'running', result) or result['status'] == 'failed':
+            if os.path.exists(path):
+                os.remove(path)
+        db.session.remove()
+
+
+# 於 create_app() 中初始化
+export_jobs = ExportJobRunner()
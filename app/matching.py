@@ -0,0 +1,171 @@
+# app/matching.py
+"""
+Company 與登記資料 (CompanyGov) 的批次比對
+
+結果寫入 company_links，每家 Company 最多一筆：
+1. 統一編號相同者以單一 INSERT ... SELECT 直接連結，confidence 為 1
+2. 其餘依 (正規化名稱前 3 字, 縣市) 分組，只和登記資料中同一組的候選比較名稱相似度，
+   比較次數與資料量大致成線性；各組分批交給行程池計算，結果由主行程寫入
+   登記資料的分組鍵在匯入時存入 company_govs.match_name_part / county 並建立索引
+
+以 `flask match-companies` 執行，每次執行會重建整份 company_links
+"""
+import difflib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from flask import current_app
+from sqlalchemy import func, insert, literal, select, tuple_
+
+from app import db
+from app.models import Company, CompanyGov, CompanyLink
+from app.normalize import match_name_part, normalize_county, normalize_name
+
+# 名稱相似度的門檻 (0 ~ 1)
+FUZZY_THRESHOLD = 0.85
+# 名稱比對的 confidence 上限，與統一編號相同的 1 區分
+FUZZY_WEIGHT = 0.95
+
+# 由 match_companies() 於建立行程池前設定，fork 後的子行程沿用
+_worker_app = None
+
+
+def best_candidate(name, candidates, threshold=FUZZY_THRESHOLD):
+    """
+    candidates 為 [(統一編號, 正規化名稱)]，回傳 (統一編號, confidence) 或 None
+    最高分有多筆時 confidence 依筆數遞減
+    """
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    matcher.set_seq2(normalize_name(name))
+
+    best_score, best = 0.0, []
+    for business_no, candidate in candidates:
+        matcher.set_seq1(candidate)
+        # 先以上限值篩掉不可能超過門檻的候選
+        if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+            continue
+        score = matcher.ratio()
+        if score < threshold or score < best_score:
+            continue
+        if score > best_score:
+            best_score, best = score, []
+        best.append(business_no)
+
+    if not best:
+        return None
+    return min(best), round(best_score * FUZZY_WEIGHT / len(best), 3)
+
+
+def link_exact():
+    """統一編號相同的資料直接連結，回傳新增的筆數"""
+    result = db.session.execute(
+        insert(CompanyLink.__table__).from_select(
+            ['company_id', 'gov_business_no', 'method', 'confidence', 'matched_at'],
+            select(Company.id, CompanyGov.business_no, literal('business_no'), literal(1.0), func.now())
+            .join(CompanyGov, CompanyGov.business_no == Company.business_no)
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def unmatched_blocks():
+    """尚未連結的 Company 依 (正規化名稱前 3 字, 縣市) 分組，回傳 {分組鍵: [(company_id, 名稱)]}"""
+    rows = db.session.execute(
+        select(Company.id, Company.company_name, Company.company_address)
+        .outerjoin(CompanyLink, CompanyLink.company_id == Company.id)
+        .where(CompanyLink.id.is_(None))
+    )
+    blocks = {}
+    for row in rows:
+        key = (match_name_part(row.company_name), normalize_county(row.company_address))
+        blocks.setdefault(key, []).append((row.id, row.company_name))
+    return blocks
+
+
+def match_blocks(blocks, threshold=FUZZY_THRESHOLD):
+    """
+    比對一批分組，回傳 company_links 的資料列
+    候選資料以 (match_name_part, county) 索引一次取出
+    """
+    candidates = {}
+    rows = db.session.execute(
+        select(CompanyGov.business_no, CompanyGov.company_name, CompanyGov.match_name_part, CompanyGov.county)
+        .where(tuple_(CompanyGov.match_name_part, CompanyGov.county).in_(list(blocks)))
+    )
+    for row in rows:
+        candidates.setdefault((row.match_name_part, row.county), []).append(
+            (row.business_no, normalize_name(row.company_name))
+        )
+
+    links = []
+    for key, companies in blocks.items():
+        for company_id, name in companies:
+            match = best_candidate(name, candidates.get(key, ()), threshold)
+            if match:
+                links.append({
+                    'company_id': company_id,
+                    'gov_business_no': match[0],
+                    'method': 'fuzzy',
+                    'confidence': match[1],
+                })
+    return links
+
+
+def _init_worker():
+    """fork 後不沿用父行程的資料庫連線"""
+    with _worker_app.app_context():
+        db.dispose_engines(close=False)
+
+
+def _match_chunk(chunk, threshold):
+    with _worker_app.app_context():
+        try:
+            return match_blocks(dict(chunk), threshold)
+        finally:
+            db.session.remove()
+
+
+def match_companies(workers=None, chunk_size=500, threshold=FUZZY_THRESHOLD, on_progress=None):
+    """
+    重建 company_links，回傳 {'exact': 筆數, 'fuzzy': 筆數, 'unmatched': 筆數}
+    workers 為 1 時在目前行程中比對
+    """
+    global _worker_app
+
+    db.session.query(CompanyLink).delete()
+    db.session.commit()
+
+    exact = link_exact()
+    blocks = unmatched_blocks()
+    remaining = sum(len(companies) for companies in blocks.values())
+
+    items = list(blocks.items())
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    def save(links):
+        if links:
+            db.session.bulk_insert_mappings(CompanyLink, links)
+            db.session.commit()
+        return len(links)
+
+    fuzzy = 0
+    if workers == 1:
+        for done, chunk in enumerate(chunks, 1):
+            fuzzy += save(match_blocks(dict(chunk), threshold))
+            if on_progress:
+                on_progress(done, len(chunks))
+    elif chunks:
+        _worker_app = current_app._get_current_object()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker,
+        ) as executor:
+            futures = [executor.submit(_match_chunk, chunk, threshold) for chunk in chunks]
+            for done, future in enumerate(as_completed(futures), 1):
+                fuzzy += save(future.result())
+                if on_progress:
+                    on_progress(done, len(chunks))
+
+    return {'exact': exact, 'fuzzy': fuzzy, 'unmatched': remaining - fuzzy}
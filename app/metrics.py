@@ -0,0 +1,169 @@
+# app/metrics.py
+"""
+Prometheus 監控指標
+
+- 每個端點的延遲分布與狀態碼計數
+- compress_data() 壓縮前後的資料大小
+- 每個請求執行的 SQL 數量與總耗時 (透過 SQLAlchemy 引擎事件)
+- 超過請求時限而中止的次數 (app/deadline.py)
+
+gunicorn 以多個 worker 執行時，需設定 PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py 會自動設定)，
+各 worker 將數值寫入該目錄，/metrics 讀取時再合併；未設定時只回報目前行程的數值
+"""
+import contextvars
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', '請求處理時間', ['endpoint', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+REQUEST_COUNT = Counter(
+    'http_requests_total', '請求數量', ['endpoint', 'method', 'status']
+)
+PAYLOAD_BYTES = Histogram(
+    'payload_bytes', 'compress_data() 壓縮前 (raw) 與壓縮後 (compressed) 的資料大小', ['endpoint', 'stage'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+)
+SQL_QUERIES = Histogram(
+    'db_queries_per_request', '每個請求執行的 SQL 數量', ['endpoint'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500, 1000)
+)
+SQL_SECONDS = Histogram(
+    'db_query_seconds_per_request', '每個請求執行 SQL 的總耗時', ['endpoint'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+DEADLINE_EXCEEDED = Counter(
+    'request_deadline_exceeded_total',
+    '超過請求時限而中止的次數 (timeout: 查詢逾時, disconnected: 用戶端中斷連線)',
+    ['endpoint', 'endpoint_class', 'reason']
+)
+
+
+class _RequestStats:
+    __slots__ = ('endpoint', 'started', 'queries', 'query_seconds')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+# 目前請求的統計，Flask 的執行緒與非同步模式的 task 各自獨立
+_current = contextvars.ContextVar('metrics_request', default=None)
+
+
+def start_request(endpoint):
+    """開始統計一個請求，回傳 finish_request() 需要的 token"""
+    return _current.set(_RequestStats(endpoint))
+
+
+def finish_request(token, method, status):
+    """記錄請求的延遲、狀態碼與 SQL 統計"""
+    stats = _current.get()
+    _current.reset(token)
+    if stats is None:
+        return
+
+    REQUEST_LATENCY.labels(stats.endpoint, method).observe(time.perf_counter() - stats.started)
+    REQUEST_COUNT.labels(stats.endpoint, method, str(status)).inc()
+    SQL_QUERIES.labels(stats.endpoint).observe(stats.queries)
+    SQL_SECONDS.labels(stats.endpoint).observe(stats.query_seconds)
+
+
+def current_endpoint():
+    """目前請求的端點標籤，請求以外回傳 None"""
+    stats = _current.get()
+    return stats.endpoint if stats else None
+
+
+def observe_payload(raw_bytes, compressed_bytes):
+    """由 compress_data() 呼叫，請求以外 (例如 CLI) 不記錄"""
+    stats = _current.get()
+    if stats is None:
+        return
+
+    PAYLOAD_BYTES.labels(stats.endpoint, 'raw').observe(raw_bytes)
+    PAYLOAD_BYTES.labels(stats.endpoint, 'compressed').observe(compressed_bytes)
+
+
+def observe_deadline(endpoint_class, reason):
+    """由 app/deadline.py 與非同步模式呼叫，請求以外的端點標籤記為 unknown"""
+    DEADLINE_EXCEEDED.labels(current_endpoint() or 'unknown', endpoint_class, reason).inc()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None or context is None:
+        return
+
+    stats.queries += 1
+    stats.query_seconds += time.perf_counter() - getattr(context, '_metrics_started', time.perf_counter())
+
+
+def render_latest():
+    """回傳 (內容, Content-Type)，多行程模式下合併所有 worker 的數值"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class Metrics:
+    """請求監控，用法與其他 Flask 擴展相同"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        if not self.enabled:
+            return
+
+        # 監聽所有引擎 (主庫、副本與非同步模式的引擎)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+
+    def _before_request(self):
+        # 以路由規則作為標籤，避免路徑參數造成過多時間序列
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        g._metrics_token = start_request(endpoint)
+
+    def _after_request(self, response):
+        g._metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        # 串流回應的 teardown 在傳送完畢後才執行，延遲包含傳送時間
+        token = g.pop('_metrics_token', None)
+        if token is not None:
+            status = g.pop('_metrics_status', 500 if exc else 200)
+            finish_request(token, request.method, status)
+
+    def _metrics_view(self):
+        content, content_type = render_latest()
+        return Response(content, content_type=content_type)
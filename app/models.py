@@ -1,28 +1,58 @@
-from app import db
+from app import db, payload_cache, rate_limiter
+from app.normalize import match_name_part, parse_capital_amount, roc_to_date
+from app.schema import create_county_partitions
 from datetime import datetime
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+import hashlib
+import re
 
 class ApiKey(db.Model):
     __tablename__ = 'api_keys'
     
     id = db.Column(db.Integer, primary_key=True)
-    key = db.Column(db.String(64), unique=True, nullable=False)
+    key = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 雜湊值，不存明文
     is_active = db.Column(db.Boolean, default=True)
     description = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
         return f'<ApiKey {self.id}>'
+    
+    @staticmethod
+    def hash_key(raw_key):
+        return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def is_hashed(value):
+        return bool(re.fullmatch(r'[0-9a-f]{64}', value or ''))
+
+def _pending_invalidations(target):
+    """
+    目前交易中待失效的快取，交易提交後才實際失效 (見 run_pending_invalidations)
+    flush 時就失效的話，其他 worker 可能在提交前重新讀到舊資料並寫回快取
+    """
+    session = object_session(target)
+    return session.info.setdefault('pending_invalidations', {'business_nos': set(), 'api_keys': False})
+
+# API 密鑰異動時遞增共享世代值，讓所有 worker 的驗證快取失效
+@db.event.listens_for(ApiKey, 'after_update')
+@db.event.listens_for(ApiKey, 'after_delete')
+def invalidate_api_key_cache(mapper, connection, target):
+    _pending_invalidations(target)['api_keys'] = True
 
 class Company(db.Model):
     __tablename__ = 'companies'
     
     id = db.Column(db.Integer, primary_key=True)
-    business_no = db.Column(db.String(20), unique=True, nullable=False)
+    # active_history: 變更前先載入舊值，讓舊統一編號的快取也能失效
+    business_no = db.column_property(db.Column(db.String(20), unique=True, nullable=False), active_history=True)
     company_name = db.Column(db.String(200), nullable=False)
     company_address = db.Column(db.String(500))
     business_description = db.Column(db.Text)
     introduction = db.Column(db.Text)
     capital_amount = db.Column(db.String(50))
+    capital_amount_num = db.Column(db.BigInteger, index=True)  # 由 capital_amount 轉換，供範圍查詢與排序
     employee_count = db.Column(db.Integer, default=0)
     organization_type = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -37,6 +67,7 @@ class Company(db.Model):
     websites = db.relationship('Website', backref='company', lazy=True, cascade="all, delete-orphan")
     factory_infos = db.relationship('FactoryInfo', backref='company', lazy=True, cascade="all, delete-orphan")
     use_keywords = db.relationship('UseKeyword', backref='company', lazy=True, cascade="all, delete-orphan")
+    gov_link = db.relationship('CompanyLink', backref='company', lazy=True, uselist=False, cascade="all, delete-orphan")
     
     def __repr__(self):
         return f'<Company {self.business_no}>'
@@ -65,22 +96,68 @@ class Company(db.Model):
             'DataLastModifiedTime': self.updated_at.isoformat()
         }
     
+# 公司資料異動時讓共用快取中的詳細資料失效
+@db.event.listens_for(Company, 'after_update')
+@db.event.listens_for(Company, 'after_delete')
+def invalidate_company_cache(mapper, connection, target):
+    business_nos = _pending_invalidations(target)['business_nos']
+    business_nos.add(target.business_no)
+    # 統一編號變更時，舊編號的快取也要失效
+    business_nos.update(get_history(target, 'business_no').deleted)
+
+@db.event.listens_for(Session, 'after_commit')
+def run_pending_invalidations(session):
+    pending = session.info.pop('pending_invalidations', None)
+    if pending is None:
+        return
+    if pending['business_nos']:
+        payload_cache.invalidate_business_nos(pending['business_nos'])
+    if pending['api_keys']:
+        rate_limiter.bump_key_generation()
+
+@db.event.listens_for(Session, 'after_soft_rollback')
+def discard_pending_invalidations(session, previous_transaction):
+    # 只在最外層交易回復時捨棄，SAVEPOINT 回復後外層交易仍可能提交
+    if previous_transaction.parent is None:
+        session.info.pop('pending_invalidations', None)
+
+# 寫入前由字串欄位產生數值欄位
+@db.event.listens_for(Company, 'before_insert')
+@db.event.listens_for(Company, 'before_update')
+def fill_company_typed_columns(mapper, connection, target):
+    target.capital_amount_num = parse_capital_amount(target.capital_amount)
+
 # 新增 CompanyGov 表格
+# PostgreSQL 上依 county 分區 (LIST)，分區鍵必須包含在主鍵與唯一限制中；
+# id 由序列產生仍不重複，ORM 仍以 id 識別資料；統一編號跨分區的唯一性由觸發程序檢查 (app/schema.py)
 class CompanyGov(db.Model):
     __tablename__ = 'company_govs'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    _id = db.Column(db.String(20), unique=True, nullable=False)
-    business_no = db.Column(db.String(20), unique=True, nullable=False)
+    __table_args__ = (
+        db.PrimaryKeyConstraint('id', 'county', name='company_govs_pkey'),
+        db.UniqueConstraint('business_no', 'county', name='uq_company_govs_business_no_county'),
+        db.UniqueConstraint('_id', 'county', name='uq_company_govs__id_county'),
+        # Company 比對時依 (正規化名稱前 3 字, 縣市) 分組取得候選資料
+        db.Index('ix_company_govs_match_name_part_county', 'match_name_part', 'county'),
+        # /DataAccess/Changes 依 (修改時間, id) 分頁
+        db.Index('ix_company_govs_modified_id', 'data_last_modified_time', 'id'),
+        {'postgresql_partition_by': 'LIST (county)'},
+    )
+    
+    id = db.Column(db.Integer, autoincrement=True)
+    __mapper_args__ = {'primary_key': [id]}
+    county = db.Column(db.String(10), nullable=False, default='', server_default='')  # 正規化後的縣市，匯入時產生
+    _id = db.Column(db.String(20), nullable=False)
+    business_no = db.Column(db.String(20), nullable=False)
     capital_amount = db.Column(db.String(50))
     company_address = db.Column(db.String(500))
     company_address_part = db.Column(db.String(100))
     company_name = db.Column(db.String(200), nullable=False)
     company_name_part = db.Column(db.String(100))
+    match_name_part = db.Column(db.String(20))  # 正規化後的名稱前 3 字，匯入時產生，供 Company 比對分組
     create_date = db.Column(db.String(20))
     data_create_time = db.Column(db.DateTime)
     data_last_modified_time = db.Column(db.DateTime)
-    head_office_business_no = db.Column(db.String(20))
+    head_office_business_no = db.Column(db.String(20), index=True)  # 分公司所屬總公司，供集團查詢
     industrial_code1 = db.Column(db.String(20))
     industrial_code2 = db.Column(db.String(20))
     industrial_code3 = db.Column(db.String(20))
@@ -91,6 +168,9 @@ class CompanyGov(db.Model):
     industrial_name4 = db.Column(db.String(100))
     organization_type = db.Column(db.String(50))
     use_business_invoice = db.Column(db.String(1))
+    capital_amount_num = db.Column(db.BigInteger, index=True)  # 由 capital_amount 轉換
+    established_on = db.Column(db.Date, index=True)  # 由民國年 create_date 轉換為西元日期
+    branch_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # 分公司數，匯入後重新計算
     
     def __repr__(self):
         return f'<CompanyGov {self.business_no}>'
@@ -125,6 +205,7 @@ class CompanyGovStaging(db.Model):
     __tablename__ = 'company_gov_staging'
     
     id = db.Column(db.Integer, primary_key=True)
+    county = db.Column(db.String(10), nullable=False, default='', server_default='')  # 正規化後的縣市，對應 company_govs 的分區
     _id = db.Column(db.String(20), nullable=False)   # ⚠️ staging 不設 unique
     business_no = db.Column(db.String(20), nullable=False)
     capital_amount = db.Column(db.String(50))
@@ -132,6 +213,7 @@ class CompanyGovStaging(db.Model):
     company_address_part = db.Column(db.String(100))
     company_name = db.Column(db.String(200), nullable=False)
     company_name_part = db.Column(db.String(100))
+    match_name_part = db.Column(db.String(20))
     create_date = db.Column(db.String(20))
     data_create_time = db.Column(db.DateTime)
     data_last_modified_time = db.Column(db.DateTime)
@@ -146,6 +228,8 @@ class CompanyGovStaging(db.Model):
     industrial_name4 = db.Column(db.String(100))
     organization_type = db.Column(db.String(50))
     use_business_invoice = db.Column(db.String(1))
+    capital_amount_num = db.Column(db.BigInteger, index=True)  # 由 capital_amount 轉換
+    established_on = db.Column(db.Date, index=True)  # 由民國年 create_date 轉換為西元日期
     
     def __repr__(self):
         return f'<CompanyGovStaging {self.business_no}>'
@@ -175,12 +259,38 @@ class CompanyGovStaging(db.Model):
             'UseBusinessInvoice': self.use_business_invoice
         }
 
+db.event.listen(CompanyGov.__table__, 'after_create', create_county_partitions)
+
+# 匯入時自 company_govs 移除的統一編號，供增量同步取得刪除紀錄
+class CompanyGovTombstone(db.Model):
+    __tablename__ = 'company_gov_tombstones'
+    __table_args__ = (
+        db.Index('ix_company_gov_tombstones_deleted_id', 'deleted_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    business_no = db.Column(db.String(20), nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<CompanyGovTombstone {self.business_no}>'
+
+# 匯入時由資本額與民國年設立日期產生數值與西元日期欄位，並產生比對用的名稱分組鍵
+@db.event.listens_for(CompanyGov, 'before_insert')
+@db.event.listens_for(CompanyGov, 'before_update')
+@db.event.listens_for(CompanyGovStaging, 'before_insert')
+@db.event.listens_for(CompanyGovStaging, 'before_update')
+def fill_company_gov_typed_columns(mapper, connection, target):
+    target.capital_amount_num = parse_capital_amount(target.capital_amount)
+    target.established_on = roc_to_date(target.create_date)
+    target.match_name_part = match_name_part(target.company_name)
+
 class Industrial(db.Model):
     __tablename__ = 'industrials'
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False, index=True)
     
     def __repr__(self):
         return f'<Industrial {self.name}>'
@@ -190,7 +300,7 @@ class Contact(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False, index=True)
     
     def __repr__(self):
         return f'<Contact {self.name}>'
@@ -200,7 +310,7 @@ class Telephone(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     number = db.Column(db.String(20), nullable=False)
-    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False, index=True)
     
     def __repr__(self):
         return f'<Telephone {self.number}>'
@@ -210,7 +320,7 @@ class Fax(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     number = db.Column(db.String(20), nullable=False)
-    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False, index=True)
     
     def __repr__(self):
         return f'<Fax {self.number}>'
@@ -220,7 +330,7 @@ class Email(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     address = db.Column(db.String(100), nullable=False)
-    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False, index=True)
     
     def __repr__(self):
         return f'<Email {self.address}>'
@@ -230,7 +340,7 @@ class Website(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     url = db.Column(db.String(200), nullable=False)
-    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False, index=True)
     
     def __repr__(self):
         return f'<Website {self.url}>'
@@ -243,7 +353,7 @@ class FactoryInfo(db.Model):
     factory_name = db.Column(db.String(200), nullable=False)
     factory_address = db.Column(db.String(500))
     contact = db.Column(db.String(100))
-    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False, index=True)
     
     # 關聯
     products = db.relationship('Product', backref='factory_info', lazy=True, cascade="all, delete-orphan")
@@ -267,7 +377,7 @@ class Product(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    factory_info_id = db.Column(db.Integer, db.ForeignKey('factory_infos.id'), nullable=False)
+    factory_info_id = db.Column(db.Integer, db.ForeignKey('factory_infos.id'), nullable=False, index=True)
     
     def __repr__(self):
         return f'<Product {self.name}>'
@@ -277,7 +387,7 @@ class UsedMaterial(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    factory_info_id = db.Column(db.Integer, db.ForeignKey('factory_infos.id'), nullable=False)
+    factory_info_id = db.Column(db.Integer, db.ForeignKey('factory_infos.id'), nullable=False, index=True)
     
     def __repr__(self):
         return f'<UsedMaterial {self.name}>'
@@ -287,11 +397,24 @@ class UseKeyword(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     keyword = db.Column(db.String(100), nullable=False)
-    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False, index=True)
     
     def __repr__(self):
         return f'<UseKeyword {self.keyword}>'
 
+class CompanyLink(db.Model):
+    __tablename__ = 'company_links'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False, unique=True)
+    gov_business_no = db.Column(db.String(20), nullable=False, index=True)  # 不設外鍵，company_govs 由匯入重建
+    method = db.Column(db.String(20), nullable=False)  # business_no / fuzzy
+    confidence = db.Column(db.Float, nullable=False)  # 統一編號相同為 1，名稱比對最高 0.95
+    matched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CompanyLink {self.company_id} -> {self.gov_business_no}>'
+
 class SearchCursor(db.Model):
     __tablename__ = 'search_cursors'
     
@@ -304,4 +427,39 @@ class SearchCursor(db.Model):
     expires_at = db.Column(db.DateTime)
     
     def __repr__(self):
-        return f'<SearchCursor {self.cursor_id}>'
\ No newline at end of file
+        return f'<SearchCursor {self.cursor_id}>'
+
+class ExportJob(db.Model):
+    __tablename__ = 'export_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(36), unique=True, nullable=False)
+    owner_id = db.Column(db.String(36))  # 提交工作的 API 密鑰 ID
+    export_type = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False)  # 存儲為JSON字符串
+    status = db.Column(db.String(20), default='pending')  # pending / running / done / failed
+    progress = db.Column(db.Integer, default=0)  # 已處理的統一編號數量
+    total_count = db.Column(db.Integer, default=0)
+    file_path = db.Column(db.String(500))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True)
+    runner_id = db.Column(db.String(36))  # 執行工作的行程池 (web worker)
+    heartbeat_at = db.Column(db.DateTime)  # 行程池最後一次回報工作仍在進行的時間
+    
+    def __repr__(self):
+        return f'<ExportJob {self.job_id}>'
+    
+    def to_dict(self):
+        return {
+            'jobId': self.job_id,
+            'type': self.export_type,
+            'status': self.status,
+            'progress': self.progress,
+            'totalCount': self.total_count,
+            'error': self.error,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'finishedAt': self.finished_at.isoformat() if self.finished_at else None,
+            'expiresAt': self.expires_at.isoformat() if self.expires_at else None
+        }
@@ -0,0 +1,104 @@
+# app/normalize.py
+"""
+政府登記資料的欄位正規化
+
+原始資料的資本額與設立日期都是字串 (設立日期為民國年，例如 '1040413')，
+匯入時另外轉成數值與西元日期存入 capital_amount_num / established_on，
+讓範圍查詢與排序可以使用索引
+
+company_name_part / company_address_part 由名稱與地址產生，保留原始資料的寫法；
+county 為正規化後的縣市，company_govs 依此分區；
+Company 比對 (app/matching.py) 以 (match_name_part, county) 分組，兩者都經過正規化，
+同一家公司的全半形、臺/台或組織型態寫法不同時仍會分到同一組
+"""
+import datetime
+import re
+import unicodedata
+
+# 民國元年 = 西元 1912 年
+ROC_YEAR_OFFSET = 1911
+
+# 縣市 -> company_govs 分區名稱的後綴，其他值 (空字串、舊縣市名稱) 歸入 company_govs_other
+COUNTIES = {
+    '台北市': 'taipei', '新北市': 'new_taipei', '桃園市': 'taoyuan', '台中市': 'taichung',
+    '台南市': 'tainan', '高雄市': 'kaohsiung', '基隆市': 'keelung', '新竹市': 'hsinchu_city',
+    '嘉義市': 'chiayi_city', '新竹縣': 'hsinchu_county', '苗栗縣': 'miaoli', '彰化縣': 'changhua',
+    '南投縣': 'nantou', '雲林縣': 'yunlin', '嘉義縣': 'chiayi_county', '屏東縣': 'pingtung',
+    '宜蘭縣': 'yilan', '花蓮縣': 'hualien', '台東縣': 'taitung', '澎湖縣': 'penghu',
+    '金門縣': 'kinmen', '連江縣': 'lienchiang',
+}
+
+# 比較名稱前去除的組織型態
+_LEGAL_SUFFIXES = ('股份有限公司', '有限公司', '無限公司', '兩合公司', '企業社', '工作室', '商行', '商號', '公司')
+
+
+def _clean(value):
+    if value is None:
+        return ''
+    text = unicodedata.normalize('NFKC', str(value)).strip()
+    return '' if text.lower() in ('', 'nan', 'none') else text
+
+
+def parse_capital_amount(value):
+    """'10,000,000' / '10000000.0' -> 10000000，無法解析時回傳 None"""
+    text = _clean(value).replace(',', '')
+    match = re.fullmatch(r'(\d+)(?:\.\d*)?', text)
+    return int(match.group(1)) if match else None
+
+
+def roc_to_date(value):
+    """
+    民國年日期 -> datetime.date
+    '1040413' -> 2015-04-13；以數字讀入而遺失前導 0 的 '940406' 視為 '0940406'
+    無法解析或日期不存在時回傳 None
+    """
+    text = _clean(value)
+    if text.endswith('.0'):
+        text = text[:-2]
+    if not text.isdigit() or not 6 <= len(text) <= 7:
+        return None
+
+    text = text.zfill(7)
+    try:
+        return datetime.date(int(text[:3]) + ROC_YEAR_OFFSET, int(text[3:5]), int(text[5:7]))
+    except ValueError:
+        return None
+
+
+def normalize_name(name):
+    """全半形、臺/台統一，去除空白、標點與組織型態"""
+    name = unicodedata.normalize('NFKC', name or '').replace('臺', '台')
+    name = re.sub(r'[\s()\[\]（）「」、,.\-]', '', name)
+    for suffix in _LEGAL_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            name = name[:-len(suffix)]
+            break
+    return name
+
+
+def match_name_part(name):
+    """正規化後的公司名稱前 3 個字，Company 比對的分組鍵"""
+    return normalize_name(name)[:3]
+
+
+def company_name_part(name):
+    """公司名稱前 3 個字"""
+    return (name or '')[:3]
+
+
+def company_address_part(address):
+    """地址中的縣市，'南投縣中寮鄉...' -> '南投縣'；找不到縣市時回傳整個地址"""
+    address = address or ''
+    suffix = '縣' if '縣' in address else '市'
+    parts = address.split(suffix)
+    return parts[0] + suffix if len(parts) > 1 else address
+
+
+def normalize_county(value):
+    """
+    縣市名稱正規化，去除前綴的郵遞區號後取前 3 個字，臺/台統一為「台」
+    '臺北市' -> '台北市'，'220新北市板橋區縣民大道…' -> '新北市'
+    地址也可直接傳入；前 3 個字不是縣市名稱時回傳空字串
+    """
+    text = re.sub(r'^\d+\s*', '', _clean(value)).replace('臺', '台')[:3]
+    return text if len(text) == 3 and text[-1] in '縣市' else ''
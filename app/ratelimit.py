@@ -0,0 +1,140 @@
+# app/ratelimit.py
+"""
+跨 worker 共用的 API 密鑰限流
+
+每個 (API 密鑰, 端點類別) 在共享記憶體中佔一個 slot，記錄：
+- token bucket 目前的令牌數與最後更新時間 (每秒補充 rate 個，最多 burst 個)
+- 目前執行中的請求數 (超過 concurrency 時拒絕)
+
+另外在檔頭保存 API 密鑰的世代值，密鑰停用時遞增，
+讓各 worker 的驗證快取同步失效
+"""
+import struct
+import time
+
+from app.cache import SharedMemoryFile, shared_memory_path, stable_hash
+
+# 檔頭: magic, version, slot_count, key_generation
+_HEADER = struct.Struct('<4sIIQ')
+_HEADER_SIZE = 32
+_MAGIC = b'RLIM'
+_VERSION = 1
+
+# slot: key_hash, tokens, updated, inflight
+_SLOT = struct.Struct('<QddI4x')
+
+# 線性探測的最大距離
+_PROBES = 16
+
+# 預設限制: 端點類別 -> (每秒補充令牌數, 令牌上限, 同時執行上限)
+DEFAULT_RATE_LIMITS = {
+    'search': (1.0, 10, 2),
+    'export': (0.2, 3, 1),
+    'read': (20.0, 100, 10),
+}
+
+
+class RateLimiter:
+    """以 mmap 實作的 token bucket 與併發上限，用法與其他 Flask 擴展相同"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.limits = dict(DEFAULT_RATE_LIMITS)
+        self.slot_count = 4096
+        self.inflight_lease = 600
+        self._shm = None
+        self._buf = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        self.limits.update(app.config.get('RATE_LIMITS', {}))
+        self.inflight_lease = int(app.config.get('RATE_LIMIT_INFLIGHT_LEASE', 600))
+
+        path = shared_memory_path(app, 'RATE_LIMIT_PATH', 'company_rate_limits')
+        size = _HEADER_SIZE + self.slot_count * _SLOT.size
+        self._shm = SharedMemoryFile(path, size)
+        self._buf = self._shm.buf
+
+        with self._shm.lock():
+            magic, version, slot_count, _ = _HEADER.unpack_from(self._buf, 0)
+            if magic != _MAGIC or version != _VERSION or slot_count != self.slot_count:
+                self._buf[:size] = bytes(size)
+                _HEADER.pack_into(self._buf, 0, _MAGIC, _VERSION, self.slot_count, 0)
+
+    def _find_slot(self, key_hash):
+        """找出 key 的 slot；找不到時使用空 slot 或探測範圍內最久未更新者"""
+        start = key_hash % self.slot_count
+        oldest = None
+        oldest_updated = None
+        for probe in range(_PROBES):
+            index = (start + probe) % self.slot_count
+            offset = _HEADER_SIZE + index * _SLOT.size
+            slot_key, _, updated, _ = _SLOT.unpack_from(self._buf, offset)
+            if slot_key == key_hash:
+                return offset, True
+            if slot_key == 0:
+                return offset, False
+            if oldest_updated is None or updated < oldest_updated:
+                oldest, oldest_updated = offset, updated
+        return oldest, False
+
+    def acquire(self, key_id, endpoint_class):
+        """
+        嘗試取得一次請求額度
+        回傳 (是否允許, 建議重試秒數)；允許時呼叫端必須在請求結束後呼叫 release()
+        """
+        if not self.enabled or endpoint_class not in self.limits:
+            return True, 0
+
+        rate, burst, concurrency = self.limits[endpoint_class]
+        key_hash = stable_hash(f'{key_id}:{endpoint_class}')
+        now = time.time()
+
+        with self._shm.lock():
+            offset, found = self._find_slot(key_hash)
+            if found:
+                _, tokens, updated, inflight = _SLOT.unpack_from(self._buf, offset)
+                tokens = min(burst, tokens + (now - updated) * rate)
+                # 長時間沒有新請求時視為 worker 已異常結束，重設執行中數量
+                if now - updated > self.inflight_lease:
+                    inflight = 0
+            else:
+                tokens, inflight = float(burst), 0
+
+            # 被拒絕時不寫回，令牌數下次依最後一次成功的時間重新計算
+            if inflight >= concurrency:
+                return False, 1
+
+            if tokens < 1:
+                return False, max(1, int((1 - tokens) / rate + 0.999))
+
+            _SLOT.pack_into(self._buf, offset, key_hash, tokens - 1, now, inflight + 1)
+        return True, 0
+
+    def release(self, key_id, endpoint_class):
+        """請求結束，釋放併發額度"""
+        if not self.enabled or endpoint_class not in self.limits:
+            return
+
+        key_hash = stable_hash(f'{key_id}:{endpoint_class}')
+        with self._shm.lock():
+            offset, found = self._find_slot(key_hash)
+            if found:
+                _, tokens, updated, inflight = _SLOT.unpack_from(self._buf, offset)
+                _SLOT.pack_into(self._buf, offset, key_hash, tokens, updated, max(0, inflight - 1))
+
+    def key_generation(self):
+        """API 密鑰世代值，停用密鑰時遞增"""
+        if self._buf is None:
+            return 0
+        return _HEADER.unpack_from(self._buf, 0)[3]
+
+    def bump_key_generation(self):
+        if self._buf is None:
+            return 0
+        with self._shm.lock():
+            magic, version, slot_count, generation = _HEADER.unpack_from(self._buf, 0)
+            _HEADER.pack_into(self._buf, 0, magic, version, slot_count, generation + 1)
+        return generation + 1
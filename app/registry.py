@@ -0,0 +1,223 @@
+# app/registry.py
+"""
+統一編號點陣圖索引
+
+統一編號為 8 位數字，整份登記資料以 1 億個位元 (12.5MB) 的點陣圖表示是否存在，
+大量統一編號的驗證與存在查詢完全在記憶體中完成，不需逐筆查詢資料庫
+
+檔案結構 (以 mmap 唯讀映射，所有 worker 共用同一份分頁快取):
+- 檔頭: magic, version, 筆數, 建立時間
+- 點陣圖: 第 n 個位元表示統一編號 n 是否存在
+- rank 表: 每 512 位元一個 uint32，記錄之前的位元數，用來計算統一編號在旗標陣列中的位置
+- 旗標陣列: 每個存在的統一編號 1 個位元組 (總/分公司、是否仍在登記資料中、是否使用統一發票)，
+  已移除的統一編號 (company_gov_tombstones) 也收錄，但不帶 FLAG_ACTIVE
+
+索引於匯入完成後重建，先寫入暫存檔再以 os.replace 替換；
+各 worker 讀取時比對檔案 inode，發現替換後重新映射
+
+建立需要掃描整份登記資料，只在匯入後與 `flask build-business-no-index` 中進行，不在請求中建立；
+索引檔不存在時 (例如主機重新開機清空 /dev/shm) 查詢拋出 IndexNotBuilt，回應 503，
+容器啟動時以 `flask build-business-no-index --if-missing` 補建
+"""
+import mmap
+import os
+import re
+import struct
+import time
+
+from app.cache import shared_memory_path
+
+_HEADER = struct.Struct('<4sIQQ')
+_HEADER_SIZE = 64
+_MAGIC = b'UBNI'
+_VERSION = 1
+
+# 統一編號範圍 0 ~ 99999999
+_BITS = 100_000_000
+_BITMAP_SIZE = _BITS // 8
+# rank 表每個區塊的位元數 (64 位元組)
+_BLOCK_BITS = 512
+_BLOCK_BYTES = _BLOCK_BITS // 8
+_BLOCK_COUNT = (_BITS + _BLOCK_BITS - 1) // _BLOCK_BITS
+_RANK = struct.Struct(f'<{_BLOCK_COUNT}I')
+
+_BITMAP_OFFSET = _HEADER_SIZE
+_RANK_OFFSET = _BITMAP_OFFSET + _BITMAP_SIZE
+_FLAGS_OFFSET = _RANK_OFFSET + _RANK.size
+
+# 旗標位元
+FLAG_BRANCH = 0x01    # 有總公司統一編號 (分公司)
+FLAG_ACTIVE = 0x02    # 仍在登記資料中
+FLAG_INVOICE = 0x04   # 使用統一發票
+
+# 檢查碼權重
+_CHECKSUM_WEIGHTS = (1, 2, 1, 2, 1, 2, 4, 1)
+
+
+class IndexNotBuilt(Exception):
+    """統一編號索引檔不存在"""
+
+
+def _is_business_no_format(value):
+    """8 位 ASCII 數字；str.isdigit() 也接受 '²' 等字元，int() 轉換時會失敗"""
+    return isinstance(value, str) and re.fullmatch(r'[0-9]{8}', value) is not None
+
+
+def is_valid_business_no(business_no):
+    """
+    統一編號檢查碼
+    各位數乘上權重後將乘積的十位與個位相加，總和需被 5 整除
+    (財政部自 2023 年起由 10 放寬為 5，被 10 整除的舊編號同樣通過)；
+    第 7 位為 7 時乘積 28 的 2+8=10 可視為 0 或 1，總和加 1 後整除亦可
+    """
+    if not _is_business_no_format(business_no):
+        return False
+
+    total = 0
+    for digit, weight in zip(business_no, _CHECKSUM_WEIGHTS):
+        product = int(digit) * weight
+        total += product // 10 + product % 10
+
+    if total % 5 == 0:
+        return True
+    return business_no[6] == '7' and (total + 1) % 5 == 0
+
+
+class BusinessNoIndex:
+    """統一編號點陣圖索引，用法與其他 Flask 擴展相同"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.path = None
+        self._buf = None
+        self._identity = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.path = shared_memory_path(app, 'BUSINESS_NO_INDEX_PATH', 'company_business_no_index')
+
+    # ---- 建立 ----
+
+    def build(self):
+        """由 company_govs 重建索引，回傳收錄的筆數 (需在 app context 中執行)"""
+        from app import db
+        from app.models import CompanyGov, CompanyGovTombstone
+
+        entries = []
+        rows = db.session.query(
+            CompanyGov.business_no, CompanyGov.head_office_business_no, CompanyGov.use_business_invoice
+        ).yield_per(50000)
+        for business_no, head_office_business_no, use_business_invoice in rows:
+            if not _is_business_no_format(business_no):
+                continue
+            flags = FLAG_ACTIVE
+            if head_office_business_no and head_office_business_no != business_no:
+                flags |= FLAG_BRANCH
+            if use_business_invoice == 'Y':
+                flags |= FLAG_INVOICE
+            # 統一編號與旗標合併為一個整數，排序後即為 rank 順序
+            entries.append(int(business_no) << 8 | flags)
+
+        # 已自登記資料移除的統一編號仍視為曾登記，但不帶 FLAG_ACTIVE
+        tombstones = db.session.query(CompanyGovTombstone.business_no).distinct().yield_per(50000)
+        for (business_no,) in tombstones:
+            if _is_business_no_format(business_no):
+                entries.append(int(business_no) << 8)
+        entries.sort()
+
+        bitmap = bytearray(_BITMAP_SIZE)
+        flag_array = bytearray()
+        previous = None
+        for entry in entries:
+            number = entry >> 8
+            if number == previous:
+                # 移除後又重新出現的統一編號，合併旗標
+                flag_array[-1] |= entry & 0xFF
+                continue
+            previous = number
+            bitmap[number >> 3] |= 1 << (number & 7)
+            flag_array.append(entry & 0xFF)
+
+        ranks = []
+        count = 0
+        for block in range(_BLOCK_COUNT):
+            ranks.append(count)
+            start = block * _BLOCK_BYTES
+            count += int.from_bytes(bitmap[start:start + _BLOCK_BYTES], 'little').bit_count()
+
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            header = bytearray(_HEADER_SIZE)
+            _HEADER.pack_into(header, 0, _MAGIC, _VERSION, len(flag_array), int(time.time()))
+            f.write(header)
+            f.write(bitmap)
+            f.write(_RANK.pack(*ranks))
+            f.write(flag_array)
+        os.replace(temp_path, self.path)
+        return len(flag_array)
+
+    def is_built(self):
+        return os.path.exists(self.path)
+
+    # ---- 查詢 ----
+
+    def _current(self):
+        """回傳目前的映射，索引檔被替換時重新映射；索引檔不存在時拋出 IndexNotBuilt"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            raise IndexNotBuilt(f'統一編號索引尚未建立: {self.path}')
+        identity = (stat.st_ino, stat.st_mtime_ns)
+        if identity != self._identity:
+            with open(self.path, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version = _HEADER.unpack_from(buf, 0)[:2]
+            if magic != _MAGIC or version != _VERSION:
+                buf.close()
+                raise RuntimeError(f'統一編號索引格式不符: {self.path}')
+            # 舊的映射可能仍在其他執行緒中使用，不主動關閉，沒有參照後由 GC 釋放
+            self._buf, self._identity = buf, identity
+        return self._buf
+
+    def _flags(self, buf, number):
+        """統一編號不存在時回傳 None，存在時回傳旗標"""
+        byte_index = number >> 3
+        byte = buf[_BITMAP_OFFSET + byte_index]
+        bit = 1 << (number & 7)
+        if not byte & bit:
+            return None
+
+        # rank = 區塊之前的位元數 + 區塊內此位元之前的位元數
+        block = number // _BLOCK_BITS
+        rank = struct.unpack_from('<I', buf, _RANK_OFFSET + block * 4)[0]
+        block_start = _BITMAP_OFFSET + block * _BLOCK_BYTES
+        rank += int.from_bytes(buf[block_start:_BITMAP_OFFSET + byte_index], 'little').bit_count()
+        rank += (byte & (bit - 1)).bit_count()
+        return buf[_FLAGS_OFFSET + rank]
+
+    def lookup(self, business_nos):
+        """檢查碼驗證與存在查詢，依輸入順序回傳結果"""
+        buf = self._current()
+        results = []
+        for business_no in business_nos:
+            business_no = str(business_no).strip()
+            flags = self._flags(buf, int(business_no)) if _is_business_no_format(business_no) else None
+            results.append({
+                'BusinessNo': business_no,
+                'ValidChecksum': is_valid_business_no(business_no),
+                'Registered': flags is not None,
+                'IsBranch': bool(flags & FLAG_BRANCH) if flags is not None else None,
+                'Active': bool(flags & FLAG_ACTIVE) if flags is not None else None,
+                'UseBusinessInvoice': bool(flags & FLAG_INVOICE) if flags is not None else None,
+            })
+        return results
+
+    def stats(self):
+        count, built_at = _HEADER.unpack_from(self._current(), 0)[2:]
+        return {
+            'count': count,
+            'builtAt': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(built_at)),
+            'path': self.path,
+        }
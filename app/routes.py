@@ -1,16 +1,30 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, current_app, request, jsonify, send_file, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import Company,CompanyGovStaging, SearchCursor
-from app import db
+from app.models import Company, CompanyGov, SearchCursor, ExportJob
+from app import db, payload_cache, business_no_index, registry_snapshot
+from app.auth import rate_limited
+from app.routing import read_replica
+from app.metrics import observe_payload
+from app.search import (
+    company_aggregation_filter, company_group_statement, range_filters,
+    group_item, summary_items, summary_page_statement, typeahead_item, TYPEAHEAD_LIMIT
+)
+from app.exports import (
+    COMPANY_INFO_COLUMNS, COMPANY_GOV_COLUMNS,
+    export_company_infos_xlsx, export_company_labels_docx,
+    iter_company_info_rows, iter_company_gov_rows, iter_csv, iter_jsonl, write_parquet
+)
+from app.jobs import export_jobs, EXPORT_TYPES
+from app.changes import changes_page, parse_limit
+from app.upsert import upsert_companies
+from app.registry import IndexNotBuilt
+from app.snapshot import SnapshotNotBuilt
 import json
+import os
 import uuid
 import datetime
-import io
 import gzip
 import base64
-import pandas as pd
-from docx import Document
-from docx.shared import Pt
 
 main_bp = Blueprint('main', __name__, url_prefix='/DataAccess')
 
@@ -28,44 +42,91 @@ def test_route():
 
 # 壓縮JSON數據的輔助函數
 def compress_data(data):
-    json_str = json.dumps(data)
-    compressed = gzip.compress(json_str.encode('utf-8'))
-    return base64.b64encode(compressed).decode('utf-8')
+    json_bytes = json.dumps(data).encode('utf-8')
+    compressed = base64.b64encode(gzip.compress(json_bytes)).decode('utf-8')
+    observe_payload(len(json_bytes), len(compressed))
+    return compressed
+
+# 扁平匯出格式對應的 MIME 類型
+FLAT_EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# 以指定格式回傳扁平匯出資料的輔助函數
+def flat_export_response(columns, rows, export_format, download_name):
+    headers = [header for header, _ in columns]
+    filename = f'{download_name}.{export_format}'
+    
+    # Parquet 需要寫入檔尾，先分 row group 寫入暫存檔再回傳
+    if export_format == 'parquet':
+        output = write_parquet(columns, rows)
+        return send_file(
+            output,
+            mimetype=FLAT_EXPORT_FORMATS['parquet'],
+            as_attachment=True,
+            download_name=filename
+        )
+    
+    # CSV / JSONL 直接由資料庫游標串流輸出
+    generate = iter_csv if export_format == 'csv' else iter_jsonl
+    return Response(
+        stream_with_context(generate(headers, rows)),
+        mimetype=FLAT_EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+# 解析匯出來源: 統一編號清單或搜尋游標ID
+# 回傳 (business_nos, cursor, 錯誤回應)
+def resolve_export_source(data):
+    cursor_id = data.get('cursorId') or request.args.get('cursorId')
+    
+    if cursor_id:
+        cursor = SearchCursor.query.filter_by(cursor_id=cursor_id).first()
+        if not cursor:
+            return None, None, (jsonify({'error': 'Invalid cursor ID'}), 404)
+        return None, cursor, None
+    
+    if 'businessNos' not in data:
+        return None, None, (jsonify({'error': 'Missing business numbers or cursor ID'}), 400)
+    
+    return data['businessNos'], None, None
 
 @main_bp.route('/CreateCursor', methods=['GET'])
 @jwt_required()
+@rate_limited('search')
+@read_replica
 def search_company_aggregation():
     """
     搜尋 CompanyGov 資料表中的公司資料
-    根據關鍵字在多個欄位中進行模糊搜尋
+    根據關鍵字在多個欄位中進行模糊搜尋，
+    可另以 regions (縣市) 與 minCapital / maxCapital / foundedFrom / foundedTo 限定範圍，並以 sort 排序
     """
     collection = request.args.get('collection')
     keywords = request.args.getlist('keywords')
     
-    if not collection or not keywords:
+    # 資本額、設立日期範圍與排序
+    try:
+        conditions, order_by = range_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not collection or not (keywords or conditions):
         return jsonify({'error': '缺少必要參數'}), 400
     
     # 根據 collection 參數決定要查詢的資料表
     if collection == 'CompanyAggregation':
-        # 根據關鍵字搜尋公司
-        query = CompanyGovStaging.query
-        
-        for keyword in keywords:
-            # 在多個字段中搜索關鍵字
-            query = query.filter(
-                (CompanyGovStaging.company_address_part.ilike(f'%{keyword}%')) |
-                (CompanyGovStaging.company_name.ilike(f'%{keyword}%')) |
-                (CompanyGovStaging.industrial_name1.ilike(f'%{keyword}%')) |
-                (CompanyGovStaging.industrial_name2.ilike(f'%{keyword}%')) |
-                (CompanyGovStaging.industrial_name3.ilike(f'%{keyword}%')) |
-                (CompanyGovStaging.industrial_name4.ilike(f'%{keyword}%'))
-            )
+        # 根據關鍵字與範圍條件搜尋公司，只需取得ID
+        query = db.session.query(CompanyGov.id).filter(*conditions).order_by(*order_by)
+        if keywords:
+            query = query.filter(company_aggregation_filter(keywords))
     else:
         return jsonify({'error': f'不支援的資料集: {collection}'}), 400
     
     # 獲取結果
     results = query.all()
-    result_ids = [str(company.id) for company in results]
+    result_ids = [str(row.id) for row in results]
     total_count = len(results)
     
     # 創建游標記錄
@@ -90,6 +151,8 @@ def search_company_aggregation():
 
 @main_bp.route('/CreateCursor', methods=['GET'])
 @jwt_required()
+@rate_limited('search')
+@read_replica
 def create_cursor():
     """
     根據關鍵字創建搜索游標
@@ -138,6 +201,8 @@ def create_cursor():
 
 @main_bp.route('/GetSummary', methods=['GET'])
 @jwt_required()
+@rate_limited('read')
+@read_replica
 def get_summary():
     """
     根據游標ID獲取分頁數據摘要
@@ -156,43 +221,45 @@ def get_summary():
     if not cursor:
         return jsonify({'error': 'Invalid cursor ID'}), 404
     
-    # 解析結果ID
-    result_ids = json.loads(cursor.result_ids)
-    
     # 計算分頁
     start_idx = (page - 1) * page_size
     end_idx = start_idx + page_size
-    page_ids = result_ids[start_idx:end_idx]
-    
-    # 獲取公司數據
-    companies = []
-    for id in page_ids:
-        company = Company.query.get(id)
-        if company:
-            companies.append({
-                'BusinessNo': company.business_no,
-                'CompanyName': company.company_name,
-                'CompanyAddress': company.company_address,
-                'BusinessDescription': company.business_description,
-                'AddToCollector': True
-            })
+    
+    # 游標結果固定不變，分頁內容可直接使用共用快取
+    cache_key = f'summary:{cursor_id}:{page}:{page_size}'
+    compressed_data = payload_cache.get(cache_key)
+    
+    if compressed_data is None:
+        # 結果ID為 CompanyGov.id，一次查詢整頁並對應到 Company
+        page_ids = [int(id) for id in json.loads(cursor.result_ids)[start_idx:end_idx]]
+        rows = db.session.execute(summary_page_statement(page_ids))
+        companies = summary_items(rows, page_ids)
+        
+        # 壓縮數據
+        compressed_data = compress_data(companies)
+        # 以頁面中每家公司的統一編號標記，任一公司異動時整頁失效
+        payload_cache.set(cache_key, compressed_data, tags=[item['BusinessNo'] for item in companies])
     
     # 如果是最後一頁且需要刪除游標
-    if remove_cursor and end_idx >= len(result_ids):
+    if remove_cursor and end_idx >= cursor.total_count:
         db.session.delete(cursor)
         db.session.commit()
     
-    # 壓縮數據
-    compressed_data = compress_data(companies)
-    
     return compressed_data, 200, {'Content-Type': 'text/plain'}
 
 @main_bp.route('/FindByBusinessNo/<business_no>', methods=['GET'])
 @jwt_required()
+@rate_limited('read')
+@read_replica
 def find_by_business_no(business_no):
     """
     根據統一編號查詢公司詳細信息
     """
+    cache_key = f'find:{business_no}'
+    compressed_data = payload_cache.get(cache_key)
+    if compressed_data is not None:
+        return compressed_data, 200, {'Content-Type': 'text/plain'}
+    
     company = Company.query.filter_by(business_no=business_no).first()
     
     if not company:
@@ -203,11 +270,38 @@ def find_by_business_no(business_no):
     
     # 壓縮數據
     compressed_data = compress_data(company_data)
+    payload_cache.set(cache_key, compressed_data, tag=business_no)
+    
+    return compressed_data, 200, {'Content-Type': 'text/plain'}
+
+@main_bp.route('/GetCompanyGroup/<business_no>', methods=['GET'])
+@jwt_required()
+@rate_limited('read')
+@read_replica
+def get_company_group(business_no):
+    """
+    根據統一編號查詢所屬集團: 總公司與所有分公司，總公司排在第一筆
+    每筆附上預先計算的分公司數
+    """
+    cache_key = f'group:{business_no}'
+    compressed_data = payload_cache.get(cache_key)
+    if compressed_data is not None:
+        return compressed_data, 200, {'Content-Type': 'text/plain'}
+    
+    members = db.session.execute(company_group_statement(business_no)).all()
+    
+    if not members:
+        return jsonify({'error': 'Company not found'}), 404
+    
+    compressed_data = compress_data([group_item(member) for member in members])
+    payload_cache.set(cache_key, compressed_data, tag=business_no)
     
     return compressed_data, 200, {'Content-Type': 'text/plain'}
 
 @main_bp.route('/TryFindCompanyBusinessNo', methods=['GET'])
 @jwt_required()
+@rate_limited('read')
+@read_replica
 def try_find_company():
     """
     嘗試根據公司部分名稱查找可能的企業
@@ -218,61 +312,135 @@ def try_find_company():
         return jsonify({'error': 'Missing company name'}), 400
     
     # 模糊搜索公司
-    companies = Company.query.filter(Company.company_name.ilike(f'%{company_part_name}%')).limit(10).all()
+    companies = Company.query.filter(Company.company_name.ilike(f'%{company_part_name}%')).limit(TYPEAHEAD_LIMIT).all()
+    
+    result = [typeahead_item(company) for company in companies]
+    
+    return jsonify(result), 200
+
+@main_bp.route('/Changes', methods=['GET'])
+@jwt_required()
+@rate_limited('read')
+@read_replica
+def get_changes():
+    """
+    登記資料的增量同步: 回傳 since 令牌之後新增、異動與移除的資料，以及下一頁的令牌
+    未提供 since 時從頭開始；HasMore 為 false 時保存 NextToken，下次由此繼續
+    """
+    since = request.args.get('since')
+    
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        page = changes_page(db.session, since, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # 壓縮數據
+    compressed_data = compress_data(page)
+    
+    return compressed_data, 200, {'Content-Type': 'text/plain'}
+
+@main_bp.route('/Stats', methods=['GET'])
+@jwt_required()
+@rate_limited('read')
+def get_stats():
+    """
+    登記資料的篩選與分組統計，例如各縣市的獨資行業代碼 4729 開頭公司數:
+    /Stats?organizationType=獨資&industrialCode=4729&groupBy=county
+    以欄式快照計算，不存取資料庫
+    """
+    try:
+        result = registry_snapshot.stats(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except SnapshotNotBuilt:
+        return jsonify({'error': 'Statistics snapshot is not available yet'}), 503
+    
+    return jsonify(result), 200
+
+@main_bp.route('/ValidateBusinessNos', methods=['POST'])
+@jwt_required()
+@rate_limited('search')
+def validate_business_nos():
+    """
+    批次驗證統一編號: 檢查碼、是否登記、總/分公司與是否仍在登記資料中
+    以記憶體中的點陣圖索引查詢，不存取資料庫
+    """
+    data = request.get_json(silent=True) or {}
+    business_nos = data.get('businessNos')
+    
+    if not isinstance(business_nos, list):
+        return jsonify({'error': 'Missing business numbers'}), 400
+    
+    limit = current_app.config.get('VALIDATE_BUSINESS_NOS_LIMIT', 100000)
+    if len(business_nos) > limit:
+        return jsonify({'error': f'一次最多驗證 {limit} 筆'}), 400
+    
+    try:
+        results = business_no_index.lookup(business_nos)
+    except IndexNotBuilt:
+        return jsonify({'error': 'Business number index is not available yet'}), 503
     
-    result = []
-    for company in companies:
-        result.append({
-            'businessNo': company.business_no,
-            'companyName': company.company_name,
-            'city': company.company_address.split('市')[0] + '市' if '市' in company.company_address else company.company_address
-        })
+    compressed_data = compress_data(results)
+    
+    return compressed_data, 200, {'Content-Type': 'text/plain'}
+
+@main_bp.route('/UpsertCompanies', methods=['POST'])
+@jwt_required()
+@rate_limited('export')
+def upsert_company_documents():
+    """
+    批次新增或更新公司資料，文件格式與 FindByBusinessNo 的回應相同
+    子資料 (電話、網站、工廠等) 以文件內容為準，文件中沒有的欄位不變動
+    """
+    data = request.get_json(silent=True)
+    companies = data.get('companies') if isinstance(data, dict) else data
+    
+    if not isinstance(companies, list):
+        return jsonify({'error': 'Missing companies'}), 400
+    
+    limit = current_app.config.get('UPSERT_MAX_COMPANIES', 10000)
+    if len(companies) > limit:
+        return jsonify({'error': f'一次最多寫入 {limit} 筆'}), 400
+    
+    result = upsert_companies(companies, current_app.config.get('UPSERT_BATCH_SIZE', 1000))
     
     return jsonify(result), 200
 
+@main_bp.route('/CacheStats', methods=['GET'])
+@jwt_required()
+@rate_limited('read')
+def cache_stats():
+    """
+    查詢共用回應快取的命中率與記憶體使用量
+    """
+    return jsonify(payload_cache.stats()), 200
+
 @main_bp.route('/DownloadCompanyInfos', methods=['POST'])
 @jwt_required()
+@rate_limited('export')
 def download_company_infos():
     """
     下載選定企業的詳細信息(Excel格式)
     """
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     
-    if not data or 'businessNos' not in data:
-        return jsonify({'error': 'Missing business numbers'}), 400
+    business_nos, cursor, error = resolve_export_source(data)
+    if error:
+        return error
     
-    business_nos = data['businessNos']
-    
-    # 獲取公司數據
-    companies = []
-    for business_no in business_nos:
-        company = Company.query.filter_by(business_no=business_no).first()
-        if company:
-            companies.append(company.to_dict())
-    
-    # 創建Excel文件
-    df = pd.DataFrame([{
-        '統一編號': c['BusinessNo'],
-        '公司名稱': c['CompanyName'],
-        '地址': c['CompanyAddress'],
-        '簡介': c['BusinessDescription'],
-        '資本額': c['CapitalAmount'],
-        '員工人數': c['EmployeeCount'],
-        '組織別': c['OrganizationType'],
-        '產業類別': ', '.join(c['Industrials']),
-        '聯絡人': ', '.join(c['Contacts']),
-        '電話': ', '.join(c['Telephones']),
-        '傳真': ', '.join(c['Faxes']),
-        '電子信箱': ', '.join(c['Emails']),
-        '企業網站': ', '.join(c['Websites'])
-    } for c in companies])
-    
-    # 創建一個BytesIO對象
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='企業資訊')
-    
-    output.seek(0)
+    cursor_id = cursor.cursor_id if cursor else None
+    export_format = data.get('format') or request.args.get('format', 'xlsx')
+    
+    if export_format in FLAT_EXPORT_FORMATS:
+        rows = iter_company_info_rows(business_nos, cursor_id)
+        return flat_export_response(COMPANY_INFO_COLUMNS, rows, export_format, 'company_infos')
+    
+    if export_format != 'xlsx':
+        return jsonify({'error': f'Unsupported format: {export_format}'}), 400
+    
+    # 分批查詢並以 constant_memory 模式寫入暫存檔
+    output = export_company_infos_xlsx(business_nos, cursor_id=cursor_id)
     
     return send_file(
         output,
@@ -281,79 +449,127 @@ def download_company_infos():
         download_name='company_infos.xlsx'
     )
 
+@main_bp.route('/DownloadCompanyGovs', methods=['POST'])
+@jwt_required()
+@rate_limited('export')
+def download_company_govs():
+    """
+    下載登記資料(CSV / JSONL / Parquet 格式)
+    未提供 businessNos 或 cursorId 時匯出整份 company_govs
+    """
+    data = request.get_json(silent=True) or {}
+    
+    business_nos, cursor_id = data.get('businessNos'), None
+    if data.get('cursorId') or request.args.get('cursorId'):
+        _, cursor, error = resolve_export_source(data)
+        if error:
+            return error
+        cursor_id = cursor.cursor_id
+    
+    export_format = data.get('format') or request.args.get('format', 'csv')
+    
+    if export_format not in FLAT_EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format: {export_format}'}), 400
+    
+    rows = iter_company_gov_rows(business_nos, cursor_id)
+    return flat_export_response(COMPANY_GOV_COLUMNS, rows, export_format, 'company_govs')
+
 @main_bp.route('/DownloadCompanyLabels', methods=['POST'])
 @jwt_required()
+@rate_limited('export')
 def download_company_labels():
     """
     下載企業名條(Word格式)
     """
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     
-    if not data or 'businessNos' not in data:
-        return jsonify({'error': 'Missing business numbers'}), 400
+    business_nos, cursor, error = resolve_export_source(data)
+    if error:
+        return error
     
-    business_nos = data['businessNos']
     font_size = data.get('fontSize', 12)
     count_per_page = data.get('countPerPage', 9)
     
-    # 獲取公司數據
-    companies = []
-    for business_no in business_nos:
-        company = Company.query.filter_by(business_no=business_no).first()
-        if company:
-            companies.append(company)
-    
-    # 創建Word文檔
-    doc = Document()
-    
-    # 設置頁面邊距
-    sections = doc.sections
-    for section in sections:
-        section.top_margin = Pt(36)
-        section.bottom_margin = Pt(36)
-        section.left_margin = Pt(36)
-        section.right_margin = Pt(36)
-    
-    # 創建表格
-    rows_count = (len(companies) + 2) // 3  # 每行3個，向上取整
-    if rows_count == 0:
-        rows_count = 1
-    
-    table = doc.add_table(rows=rows_count, cols=3)
-    table.style = 'Table Grid'
-    
-    # 填充表格
-    for i, company in enumerate(companies):
-        row_idx = i // 3
-        col_idx = i % 3
-        
-        cell = table.cell(row_idx, col_idx)
-        paragraph = cell.paragraphs[0]
-        
-        # 添加公司信息
-        run = paragraph.add_run(company.company_name + '\n')
-        run.font.size = Pt(font_size)
-        run.font.bold = True
-        
-        run = paragraph.add_run(f"地址: {company.company_address}\n")
-        run.font.size = Pt(font_size - 2)
-        
-        if company.telephones:
-            run = paragraph.add_run(f"電話: {company.telephones[0].number}\n")
-            run.font.size = Pt(font_size - 2)
-        
-        if company.faxes:
-            run = paragraph.add_run(f"傳真: {company.faxes[0].number}\n")
-            run.font.size = Pt(font_size - 2)
-    
-    # 創建一個BytesIO對象
-    output = io.BytesIO()
-    doc.save(output)
-    output.seek(0)
+    output = export_company_labels_docx(
+        business_nos, font_size, count_per_page,
+        cursor_id=cursor.cursor_id if cursor else None
+    )
     
     return send_file(
         output,
         mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
         as_attachment=True,
         download_name='company_labels.docx'
-    )
\ No newline at end of file
+    )
+
+@main_bp.route('/ExportJobs', methods=['POST'])
+@jwt_required()
+@rate_limited('export')
+def submit_export_job():
+    """
+    提交非同步匯出工作，立即回傳工作ID
+    type 為 CompanyInfos 或 CompanyLabels，其餘參數與同步下載相同
+    """
+    data = request.get_json(silent=True) or {}
+    
+    business_nos, cursor, error = resolve_export_source(data)
+    if error:
+        return error
+    
+    export_type = data.get('type', 'CompanyInfos')
+    if export_type not in EXPORT_TYPES:
+        return jsonify({'error': f'Unsupported export type: {export_type}'}), 400
+    
+    params = {
+        'businessNos': business_nos,
+        'cursorId': cursor.cursor_id if cursor else None,
+        'fontSize': data.get('fontSize', 12),
+        'countPerPage': data.get('countPerPage', 9)
+    }
+    total_count = cursor.total_count if cursor else len(business_nos)
+    job = export_jobs.submit(export_type, params, total_count, owner_id=get_jwt_identity())
+    
+    return jsonify(job.to_dict()), 202
+
+@main_bp.route('/ExportJobs/<job_id>', methods=['GET'])
+@jwt_required()
+@rate_limited('read')
+def get_export_job(job_id):
+    """
+    查詢匯出工作的狀態與進度
+    """
+    export_jobs.fail_stale()
+    job = ExportJob.query.filter_by(job_id=job_id, owner_id=get_jwt_identity()).first()
+    
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    
+    return jsonify(job.to_dict()), 200
+
+@main_bp.route('/ExportJobs/<job_id>/Download', methods=['GET'])
+@jwt_required()
+@rate_limited('read')
+def download_export_job(job_id):
+    """
+    下載已完成的匯出檔案
+    """
+    job = ExportJob.query.filter_by(job_id=job_id, owner_id=get_jwt_identity()).first()
+    
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    
+    if job.status != 'done':
+        return jsonify({'error': f'Export job is {job.status}'}), 409
+    
+    # 檔案可能已被清除 (EXPORT_DIR 在暫存目錄或另一台主機上)
+    if not job.file_path or not os.path.exists(job.file_path):
+        return jsonify({'error': 'Export file is no longer available, please resubmit the job'}), 410
+    
+    _, extension, mimetype = EXPORT_TYPES[job.export_type]
+    
+    return send_file(
+        job.file_path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=f'{job.export_type}.{extension}'
+    )
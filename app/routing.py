@@ -0,0 +1,100 @@
+# app/routing.py
+"""
+讀寫分離的資料庫路由
+
+- 主庫連線池參數由 SQLALCHEMY_ENGINE_OPTIONS 設定，唯讀副本沿用相同參數
+- 以 @read_replica 標記的唯讀端點，查詢會輪流送往 SQLALCHEMY_REPLICA_URIS 中的副本
+- flush (新增、修改、刪除) 一律送往主庫
+- 服務本身會寫入並立即讀取的資料表 (API 密鑰、游標、匯出工作) 不能容忍複寫延遲，一律使用主庫
+- 匯入、CLI 指令與背景工作不在請求中執行，一律使用主庫
+"""
+import itertools
+from functools import wraps
+
+from flask import g, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, orm
+from sqlalchemy.sql.util import find_tables
+
+# 一律使用主庫的資料表
+PRIMARY_ONLY_TABLES = {'api_keys', 'search_cursors', 'export_jobs'}
+
+
+def read_replica(view):
+    """標記唯讀端點，需放在 @rate_limited() 之後"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _touches_primary_only(mapper, clause):
+    tables = []
+    if mapper is not None:
+        tables.append(mapper.persist_selectable)
+    if clause is not None:
+        tables.extend(find_tables(clause, include_crud=True, include_joins=True))
+    return any(getattr(table, 'name', None) in PRIMARY_ONLY_TABLES for table in tables)
+
+
+class RoutingSession(SignallingSession):
+    """依請求是否唯讀選擇主庫或副本的 session"""
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if (
+            not self._flushing and
+            has_request_context() and g.get('read_replica') and
+            not _touches_primary_only(mapper, clause)
+        ):
+            replica = self.db.replica_engine(self.app)
+            if replica is not None:
+                return replica
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """支援唯讀副本的 SQLAlchemy 擴展"""
+
+    def init_app(self, app):
+        super().init_app(app)
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def _replica_state(self, app):
+        """副本引擎在第一次使用時才建立，每個行程各自擁有連線池"""
+        state = app.extensions.get('db_replicas')
+        if state is None:
+            engines = [
+                create_engine(uri, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+                for uri in app.config['SQLALCHEMY_REPLICA_URIS']
+            ]
+            state = app.extensions['db_replicas'] = {
+                'engines': engines,
+                'cycle': itertools.cycle(engines) if engines else None,
+            }
+        return state
+
+    def replica_engine(self, app=None):
+        """輪流回傳唯讀副本引擎，未設定副本時回傳 None"""
+        app = self.get_app(app)
+        cycle = self._replica_state(app)['cycle']
+        return next(cycle) if cycle else None
+
+    def dispose_engines(self, app=None, close=True):
+        """
+        丟棄主庫與所有副本的連線池
+        fork 後使用 close=False，只丟棄連線池，不關閉父行程仍在使用的連線
+        """
+        app = self.get_app(app)
+        self.get_engine(app).dispose(close=close)
+        state = app.extensions.get('db_replicas')
+        if state is not None:
+            for engine in state['engines']:
+                engine.dispose(close=close)
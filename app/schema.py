@@ -0,0 +1,246 @@
+# app/schema.py
+"""
+資料表建立與升級
+
+db.create_all() 只會建立不存在的資料表，既有資料表新增的欄位與索引
+由 upgrade_schema() 補上，於部署時以 `flask init-db` 執行一次，
+不在 worker 啟動流程中進行
+
+PostgreSQL 上 company_govs 依縣市分區 (LIST)，每個縣市一個分區，其他值歸入 company_govs_other；
+舊版建立的未分區資料表由 upgrade_schema() 轉換
+分區資料表的唯一限制必須包含分區鍵，統一編號只在 (business_no, county) 上唯一，
+另以觸發程序確保同一個統一編號不會同時出現在兩個縣市的分區
+"""
+from sqlalchemy import func, inspect, or_, select, update
+
+from app import db
+from app.normalize import COUNTIES, match_name_part, parse_capital_amount, roc_to_date
+
+# 已改用其他索引、升級時移除的舊索引
+_DROPPED_INDEXES = ('ix_company_govs_name_address_part',)
+
+# 與 normalize_county() 相同的規則: 去除前綴的郵遞區號後取地址前 3 個字、臺 -> 台，不是縣市名稱時為空字串
+_COUNTY_SQL = "CASE WHEN char_length(county.c) = 3 AND right(county.c, 1) IN ('縣', '市') THEN county.c ELSE '' END"
+_COUNTY_FROM = """
+    CROSS JOIN LATERAL (
+        SELECT left(replace(regexp_replace(
+            btrim(normalize(coalesce(company_address, ''), NFKC)), '^[0-9]+\\s*', ''
+        ), '臺', '台'), 3) AS c
+    ) AS county
+"""
+
+
+def create_county_partitions(target, connection, **kw):
+    """company_govs 建立後建立各縣市的分區與統一編號檢查 (after_create 事件)"""
+    if connection.dialect.name != 'postgresql':
+        return
+    for county, suffix in COUNTIES.items():
+        connection.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS {target.name}_{suffix} PARTITION OF {target.name} FOR VALUES IN ('{county}')"
+        )
+    connection.exec_driver_sql(f'CREATE TABLE IF NOT EXISTS {target.name}_other PARTITION OF {target.name} DEFAULT')
+    create_business_no_guard(target.name, connection)
+
+
+def create_business_no_guard(table_name, connection):
+    """
+    新增或修改後檢查統一編號是否已存在於其他縣市的分區，違反時以 unique_violation 中止 (IntegrityError)
+    以陳述式層級的觸發程序與轉換資料表 (transition table) 一次檢查整批資料，匯入時不必逐列檢查；
+    轉換資料表的觸發程序只能對應一種事件，新增與修改各建立一個
+    """
+    connection.exec_driver_sql(f"""
+        CREATE OR REPLACE FUNCTION {table_name}_check_business_no() RETURNS trigger AS $$
+        DECLARE
+            duplicate text;
+        BEGIN
+            SELECT changed_rows.business_no INTO duplicate
+            FROM changed_rows
+            JOIN {table_name} other
+              ON other.business_no = changed_rows.business_no AND other.county <> changed_rows.county
+            LIMIT 1;
+            IF duplicate IS NOT NULL THEN
+                RAISE EXCEPTION USING
+                    MESSAGE = '統一編號 ' || duplicate || ' 已存在於其他縣市的分區',
+                    ERRCODE = 'unique_violation';
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for event in ('insert', 'update'):
+        trigger = f'{table_name}_business_no_{event}'
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {trigger} ON {table_name}')
+        connection.exec_driver_sql(f"""
+            CREATE TRIGGER {trigger} AFTER {event.upper()} ON {table_name}
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION {table_name}_check_business_no()
+        """)
+
+
+def _partition_company_govs(engine):
+    """
+    將舊版未分區的 company_govs 轉換為分區資料表，已分區或不是 PostgreSQL 時不處理
+    在同一個交易中改名舊表、建立分區資料表、依地址縣市複製資料並沿用原本的 id 序列，
+    轉換期間 company_govs 無法讀寫，回傳是否有轉換
+    """
+    from app.models import CompanyGov
+
+    if engine.dialect.name != 'postgresql':
+        return False
+
+    table = CompanyGov.__table__
+    with engine.begin() as conn:
+        kind = conn.exec_driver_sql(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(%(name)s)", {'name': table.name}
+        ).scalar()
+        if kind != 'r':
+            return False
+
+        old = f'{table.name}_unpartitioned'
+        old_columns = {column['name'] for column in inspect(conn).get_columns(table.name)}
+        conn.exec_driver_sql(f'ALTER TABLE {table.name} RENAME TO {old}')
+
+        # 限制、索引與序列的名稱與新資料表相同，先移除或改名
+        constraints = conn.exec_driver_sql(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %(name)s::regclass", {'name': old}
+        ).scalars().all()
+        for name in constraints:
+            conn.exec_driver_sql(f'ALTER TABLE {old} DROP CONSTRAINT "{name}"')
+        indexes = conn.exec_driver_sql(
+            "SELECT indexname FROM pg_indexes WHERE tablename = %(name)s", {'name': old}
+        ).scalars().all()
+        for name in indexes:
+            conn.exec_driver_sql(f'DROP INDEX "{name}"')
+        conn.exec_driver_sql(f'ALTER SEQUENCE {table.name}_id_seq RENAME TO {old}_id_seq')
+
+        table.create(conn)
+
+        columns = ', '.join(column.name for column in table.columns if column.name in old_columns - {'county'})
+        conn.exec_driver_sql(f"""
+            INSERT INTO {table.name} ({columns}, county)
+            SELECT {columns}, {_COUNTY_SQL} FROM {old} {_COUNTY_FROM}
+        """)
+        conn.exec_driver_sql(
+            f"SELECT setval('{table.name}_id_seq', coalesce((SELECT max(id) FROM {table.name}), 0) + 1, false)"
+        )
+        conn.exec_driver_sql(f'DROP TABLE {old}')
+    return True
+
+
+def upgrade_schema():
+    """建立缺少的資料表、欄位與索引，回傳新增的項目名稱"""
+    db.create_all()
+
+    engine = db.engine
+    added = []
+    if _partition_company_govs(engine):
+        added.append('company_govs 縣市分區')
+
+    # 既有的分區資料表補上 (或更新) 統一編號檢查
+    if engine.dialect.name == 'postgresql':
+        from app.models import CompanyGov
+
+        with engine.begin() as conn:
+            create_business_no_guard(CompanyGov.__tablename__, conn)
+
+    inspector = inspect(engine)
+
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            # 有 server_default 的欄位讓既有資料直接取得預設值
+            default = ''
+            if column.server_default is not None:
+                value = column.server_default.arg
+                default = " DEFAULT '{}'".format(value.replace("'", "''")) if isinstance(value, str) else f' DEFAULT {value}'
+            with engine.begin() as conn:
+                conn.exec_driver_sql(
+                    f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {column.name} {column_type}{default}'
+                )
+            added.append(f'{table.name}.{column.name}')
+
+        for index in table.indexes:
+            existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            if index.name not in existing_indexes:
+                index.create(engine, checkfirst=True)
+                added.append(index.name)
+
+    with engine.begin() as conn:
+        for name in _DROPPED_INDEXES:
+            conn.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+
+    return added
+
+
+def backfill_typed_columns(batch_size=5000):
+    """
+    為既有資料補上 capital_amount_num / established_on / match_name_part，回傳處理的筆數
+    新匯入的資料由 before_insert 事件產生，已存在的正式表資料不會被匯入覆寫，需執行一次
+    """
+    from app.models import Company, CompanyGov, CompanyGovStaging
+
+    processed = 0
+    for model in (CompanyGov, CompanyGovStaging, Company):
+        has_date = hasattr(model, 'established_on')
+        has_match = hasattr(model, 'match_name_part')
+        columns = [model.id, model.capital_amount] + ([model.create_date] if has_date else [])
+        columns += [model.company_name] if has_match else []
+        missing = [model.capital_amount_num.is_(None)] + ([model.established_on.is_(None)] if has_date else [])
+        missing += [model.match_name_part.is_(None)] if has_match else []
+
+        last_id = 0
+        while True:
+            rows = (
+                db.session.query(*columns)
+                .filter(model.id > last_id, or_(*missing))
+                .order_by(model.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+
+            mappings = []
+            for row in rows:
+                mapping = {'id': row.id, 'capital_amount_num': parse_capital_amount(row.capital_amount)}
+                if has_date:
+                    mapping['established_on'] = roc_to_date(row.create_date)
+                if has_match:
+                    mapping['match_name_part'] = match_name_part(row.company_name)
+                mappings.append(mapping)
+
+            db.session.bulk_update_mappings(model, mappings)
+            db.session.commit()
+            processed += len(rows)
+            last_id = rows[-1].id
+
+    return processed
+
+
+def refresh_branch_counts():
+    """
+    重新計算 company_govs.branch_count (直屬分公司數)，回傳更新的筆數
+    子查詢使用 head_office_business_no 索引，只更新數量有變動的資料
+    """
+    from app.models import CompanyGov
+
+    companies = CompanyGov.__table__
+    branches = companies.alias('branches')
+    branch_count = (
+        select(func.count())
+        .where(
+            branches.c.head_office_business_no == companies.c.business_no,
+            branches.c.business_no != companies.c.business_no
+        )
+        .scalar_subquery()
+    )
+    result = db.session.execute(
+        update(companies)
+        .where(companies.c.branch_count.is_distinct_from(branch_count))
+        .values(branch_count=branch_count)
+    )
+    db.session.commit()
+    return result.rowcount
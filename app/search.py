@@ -0,0 +1,215 @@
+# app/search.py
+"""
+搜尋條件與回應格式
+
+Flask 路由 (app/routes.py) 與非同步服務 (app/asgi.py) 共用，
+兩種服務模式產生相同的 SQL 與相同的回應內容
+"""
+import datetime
+
+from sqlalchemy import and_, func, literal_column, or_, select
+
+from app.models import Company, CompanyGov
+from app.normalize import normalize_county
+
+# CreateCursor 關鍵字比對的欄位
+KEYWORD_COLUMNS = (
+    CompanyGov.company_address_part,
+    CompanyGov.company_name,
+    CompanyGov.industrial_name1,
+    CompanyGov.industrial_name2,
+    CompanyGov.industrial_name3,
+    CompanyGov.industrial_name4,
+)
+
+# CreateCursor 的 sort 參數 -> (排序欄位, 是否遞減)
+SORT_OPTIONS = {
+    'capitalAsc': (CompanyGov.capital_amount_num, False),
+    'capitalDesc': (CompanyGov.capital_amount_num, True),
+    'foundedAsc': (CompanyGov.established_on, False),
+    'foundedDesc': (CompanyGov.established_on, True),
+}
+
+# TryFindCompanyBusinessNo 回傳的筆數上限
+TYPEAHEAD_LIMIT = 10
+
+# GetCompanyGroup 向上、向下追溯的層數上限，避免資料中的循環參照造成無限遞迴
+GROUP_MAX_DEPTH = 5
+
+
+def company_aggregation_filter(keywords):
+    """每個關鍵字需出現在任一比對欄位中"""
+    return and_(*[
+        or_(*[column.ilike(f'%{keyword}%') for column in KEYWORD_COLUMNS])
+        for keyword in keywords
+    ])
+
+
+def _parse_date(value, end_of_year=False):
+    """'2015' 或 '2015-04-13'；只給年份時 foundedFrom 取 1/1、foundedTo 取 12/31"""
+    if len(value) == 4 and value.isdigit():
+        return datetime.date(int(value), 12, 31) if end_of_year else datetime.date(int(value), 1, 1)
+    return datetime.date.fromisoformat(value)
+
+
+def _regions(args):
+    """regions 可重複或以逗號分隔，'臺北市' 與 '台北市' 視為相同"""
+    regions = []
+    for value in args.getlist('regions'):
+        for region in value.split(','):
+            if not region.strip():
+                continue
+            county = normalize_county(region)
+            if not county:
+                raise ValueError(f'無效的縣市: {region.strip()}')
+            regions.append(county)
+    return regions
+
+
+def range_filters(args):
+    """
+    解析 CreateCursor 的 regions / minCapital / maxCapital / foundedFrom / foundedTo / sort 參數
+    回傳 (條件列表, 排序)，參數格式錯誤時拋出 ValueError
+    regions 比對分區鍵 county，PostgreSQL 只掃描指定縣市的分區；
+    其他條件與排序都落在 capital_amount_num / established_on 的 B-tree 索引上；
+    依某欄位排序時只包含該欄位有值的資料
+    """
+    conditions = []
+    regions = _regions(args)
+    if regions:
+        conditions.append(CompanyGov.county.in_(regions))
+
+    try:
+        if args.get('minCapital'):
+            conditions.append(CompanyGov.capital_amount_num >= int(args.get('minCapital')))
+        if args.get('maxCapital'):
+            conditions.append(CompanyGov.capital_amount_num <= int(args.get('maxCapital')))
+        if args.get('foundedFrom'):
+            conditions.append(CompanyGov.established_on >= _parse_date(args.get('foundedFrom')))
+        if args.get('foundedTo'):
+            conditions.append(CompanyGov.established_on <= _parse_date(args.get('foundedTo'), end_of_year=True))
+    except ValueError:
+        raise ValueError('資本額需為整數，日期格式為 YYYY 或 YYYY-MM-DD')
+
+    order_by = []
+    sort = args.get('sort')
+    if sort:
+        if sort not in SORT_OPTIONS:
+            raise ValueError(f"sort 需為 {' / '.join(SORT_OPTIONS)}")
+        column, descending = SORT_OPTIONS[sort]
+        conditions.append(column.isnot(None))
+        order_by = [column.desc() if descending else column.asc(), CompanyGov.id]
+    return conditions, order_by
+
+
+def company_group_statement(business_no):
+    """
+    以單一查詢取得統一編號所屬的集團: 先沿 head_office_business_no 向上找到總公司，
+    再由總公司向下取得所有分公司，兩段遞迴 CTE 都使用 business_no / head_office_business_no 索引
+    回傳依層級與統一編號排序的 (集團成員欄位..., depth)，depth 0 為總公司
+    """
+    companies = CompanyGov.__table__
+
+    # 向上: 自身 -> 總公司 -> ...
+    parent = companies.alias('parent')
+    ancestors = (
+        select(companies.c.business_no, companies.c.head_office_business_no, literal_column('0').label('depth'))
+        .where(companies.c.business_no == business_no)
+        .cte('ancestors', recursive=True)
+    )
+    ancestors = ancestors.union_all(
+        select(parent.c.business_no, parent.c.head_office_business_no, ancestors.c.depth + 1)
+        .where(
+            parent.c.business_no == ancestors.c.head_office_business_no,
+            parent.c.business_no != ancestors.c.business_no,
+            ancestors.c.depth < GROUP_MAX_DEPTH
+        )
+    )
+    root = select(ancestors.c.business_no).order_by(ancestors.c.depth.desc()).limit(1).scalar_subquery()
+
+    # 向下: 總公司 -> 分公司 -> ...
+    child = companies.alias('child')
+    members = (
+        select(companies.c.business_no, literal_column('0').label('depth'))
+        .where(companies.c.business_no == root)
+        .cte('members', recursive=True)
+    )
+    members = members.union_all(
+        select(child.c.business_no, members.c.depth + 1)
+        .where(
+            child.c.head_office_business_no == members.c.business_no,
+            child.c.business_no != members.c.business_no,
+            members.c.depth < GROUP_MAX_DEPTH
+        )
+    )
+
+    # 循環參照時同一家公司會出現多次，只保留最淺的層級
+    members = (
+        select(members.c.business_no, func.min(members.c.depth).label('depth'))
+        .group_by(members.c.business_no)
+        .subquery('group_members')
+    )
+
+    return (
+        select(
+            CompanyGov.business_no, CompanyGov.company_name, CompanyGov.company_address,
+            CompanyGov.head_office_business_no, CompanyGov.branch_count, members.c.depth
+        )
+        .join(members, CompanyGov.business_no == members.c.business_no)
+        .order_by(members.c.depth, CompanyGov.business_no)
+    )
+
+
+def group_item(row):
+    """GetCompanyGroup 每筆集團成員"""
+    return {
+        'BusinessNo': row.business_no,
+        'CompanyName': row.company_name,
+        'CompanyAddress': row.company_address,
+        'HeadOfficeBusinessNo': row.head_office_business_no or None,
+        'IsHeadOffice': row.depth == 0,
+        'BranchCount': row.branch_count or 0
+    }
+
+
+def summary_page_statement(page_ids):
+    """
+    GetSummary 一頁的公司資料
+    游標的 result_ids 為 CreateCursor 查到的 CompanyGov.id，與游標匯出 (app/exports.py 的 cursor_results) 相同，
+    經由 CompanyGov.business_no 對應到 Company；回傳的 gov_id 供呼叫端依游標順序排列
+    """
+    return (
+        select(
+            CompanyGov.id.label('gov_id'), Company.business_no, Company.company_name,
+            Company.company_address, Company.business_description
+        )
+        .join(Company, Company.business_no == CompanyGov.business_no)
+        .where(CompanyGov.id.in_(page_ids))
+    )
+
+
+def summary_items(rows, page_ids):
+    """依游標順序排列 summary_page_statement() 的結果，找不到的 ID 直接略過"""
+    by_gov_id = {row.gov_id: row for row in rows}
+    return [summary_item(by_gov_id[id]) for id in page_ids if id in by_gov_id]
+
+
+def summary_item(company):
+    """GetSummary 每筆公司的摘要"""
+    return {
+        'BusinessNo': company.business_no,
+        'CompanyName': company.company_name,
+        'CompanyAddress': company.company_address,
+        'BusinessDescription': company.business_description,
+        'AddToCollector': True
+    }
+
+
+def typeahead_item(company):
+    """TryFindCompanyBusinessNo 每筆候選公司"""
+    address = company.company_address
+    return {
+        'businessNo': company.business_no,
+        'companyName': company.company_name,
+        'city': address.split('市')[0] + '市' if '市' in address else address
+    }
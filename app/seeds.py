@@ -1,10 +1,13 @@
 # app/seeds.py
-from app import db
+from app import db, payload_cache, business_no_index, registry_snapshot
 from app.models import ApiKey, Company, CompanyGov, CompanyGovStaging  # 添加 CompanyGov 導入
+from app.normalize import company_name_part, company_address_part, normalize_county
+from app.schema import refresh_branch_counts
 from datetime import datetime
 import pandas as pd
 import os
 import gc  # 添加垃圾回收模組
+from sqlalchemy import text
 
 CHECKPOINT_FILE = "checkpoint.txt"  # 存放進度的檔案
 
@@ -20,6 +23,73 @@ def save_checkpoint(total_imported):
     with open(CHECKPOINT_FILE, "w") as f:
         f.write(str(total_imported))
 
+# staging 搬移到正式表的欄位，除建立與修改時間外都用來判斷資料是否異動
+GOV_DATA_COLUMNS = [
+    '_id', 'business_no', 'county', 'capital_amount', 'company_address', 'company_address_part',
+    'company_name', 'company_name_part', 'match_name_part', 'create_date', 'head_office_business_no',
+    'industrial_code1', 'industrial_code2', 'industrial_code3', 'industrial_code4',
+    'industrial_name1', 'industrial_name2', 'industrial_name3', 'industrial_name4',
+    'organization_type', 'use_business_invoice', 'capital_amount_num', 'established_on',
+]
+
+# staging 筆數低於正式表的這個比例時視為匯入不完整，不移除資料
+TOMBSTONE_MIN_RATIO = 0.5
+
+def merge_staging():
+    """
+    將 staging 合併到 company_govs，回傳 (新增或異動筆數, 移除筆數)
+    - 新增與內容有變動的資料將 data_last_modified_time 設為本次匯入時間，未變動的資料不更新
+    - 不在本次匯入中的統一編號自 company_govs 移除，並記錄到 company_gov_tombstones
+    - 縣市改變的資料需搬到另一個分區，先刪除舊分區中的資料再以新的 id 新增
+    兩者皆供 /DataAccess/Changes 增量同步
+    """
+    now = datetime.utcnow()
+    columns = ', '.join(GOV_DATA_COLUMNS)
+    changed = ', '.join(f'{column} = EXCLUDED.{column}' for column in GOV_DATA_COLUMNS)
+    current = ', '.join(f'company_govs.{column}' for column in GOV_DATA_COLUMNS)
+    incoming = ', '.join(f'EXCLUDED.{column}' for column in GOV_DATA_COLUMNS)
+
+    # staging 未設 unique，同一統一編號取最後匯入的一筆
+    latest = "SELECT DISTINCT ON (business_no) * FROM company_gov_staging ORDER BY business_no, id DESC"
+
+    # 分區資料表的唯一限制包含縣市，縣市改變時 ON CONFLICT 不會命中舊分區中的資料
+    db.session.execute(text(f"""
+        DELETE FROM company_govs
+        USING ({latest}) AS latest
+        WHERE latest.business_no = company_govs.business_no AND latest.county <> company_govs.county
+    """))
+
+    moved = db.session.execute(text(f"""
+        INSERT INTO company_govs ({columns}, data_create_time, data_last_modified_time)
+        SELECT {columns}, data_create_time, :now
+        FROM ({latest}) AS latest
+        ON CONFLICT (business_no, county) DO UPDATE
+        SET {changed}, data_last_modified_time = EXCLUDED.data_last_modified_time
+        WHERE ({current}) IS DISTINCT FROM ({incoming});
+    """), {'now': now}).rowcount
+
+    staging_count = db.session.execute(text("SELECT count(DISTINCT business_no) FROM company_gov_staging")).scalar()
+    gov_count = db.session.execute(text("SELECT count(*) FROM company_govs")).scalar()
+
+    deleted = 0
+    if staging_count >= gov_count * TOMBSTONE_MIN_RATIO:
+        missing = """
+            FROM company_govs
+            WHERE NOT EXISTS (
+                SELECT 1 FROM company_gov_staging WHERE company_gov_staging.business_no = company_govs.business_no
+            )
+        """
+        db.session.execute(text(f"""
+            INSERT INTO company_gov_tombstones (business_no, deleted_at)
+            SELECT business_no, :now {missing}
+        """), {'now': now})
+        deleted = db.session.execute(text(f"DELETE {missing}")).rowcount
+    else:
+        print(f"staging 只有 {staging_count} 筆 (正式表 {gov_count} 筆)，略過移除")
+
+    db.session.commit()
+    return moved, deleted
+
 def seed_data():
     """
     添加初始數據到數據庫
@@ -29,8 +99,15 @@ def seed_data():
     # 檢查是否已經有 API 密鑰，如果沒有則添加
     if ApiKey.query.count() == 0:
         print("添加默認 API 密鑰...")
-        default_api_key = ApiKey(key='admin123', is_active=True)
+        default_api_key = ApiKey(key=ApiKey.hash_key('admin123'), is_active=True)
         db.session.add(default_api_key)
+    
+    # 舊版以明文存放的密鑰改存雜湊值
+    for api_key in ApiKey.query.all():
+        if not ApiKey.is_hashed(api_key.key):
+            print(f"將 API 密鑰 #{api_key.id} 改存為雜湊值...")
+            api_key.key = ApiKey.hash_key(api_key.key)
+    db.session.commit()
         
     # 添加一些示例公司數據
     if Company.query.count() == 0:
@@ -113,19 +190,19 @@ def seed_data():
             try:
                 current_time = datetime.utcnow()
                 company_name = row['company_name']
-                company_name_part = company_name[:3] if len(company_name) > 3 else company_name
-                address = row['company_address']
-                address_parts = address.split('縣') if '縣' in address else address.split('市')
-                company_address_part = address_parts[0] + ('縣' if '縣' in address else '市') if len(address_parts) > 1 else address
+                name_part = company_name_part(company_name)
+                address_part = company_address_part(row['company_address'])
+                county = normalize_county(row['company_address'])
 
                 company_gov = CompanyGovStaging(
                     _id=row['business_no'],
                     business_no=row['business_no'],
+                    county=county,
                     capital_amount=str(row['capital_amount']),
                     company_address=row['company_address'],
-                    company_address_part=company_address_part,
+                    company_address_part=address_part,
                     company_name=row['company_name'],
-                    company_name_part=company_name_part,
+                    company_name_part=name_part,
                     create_date=str(row['create_date']),
                     data_create_time=current_time,
                     data_last_modified_time=current_time,
@@ -141,6 +218,7 @@ def seed_data():
                     organization_type=row['organization_type'],
                     use_business_invoice=row['use_business_invoice']
                 )
+                # capital_amount_num / established_on 由 before_insert 事件產生
                 batch_records.append(company_gov)
             except Exception as e:
                 print(f"處理時出錯: {e}")
@@ -164,27 +242,21 @@ def seed_data():
 
     # --- 搬移到正式表 ---
     try:
-        db.session.execute("""
-            INSERT INTO company_govs (
-                _id, business_no, capital_amount, company_address, company_address_part,
-                company_name, company_name_part, create_date, data_create_time, 
-                data_last_modified_time, head_office_business_no,
-                industrial_code1, industrial_code2, industrial_code3, industrial_code4,
-                industrial_name1, industrial_name2, industrial_name3, industrial_name4,
-                organization_type, use_business_invoice
-            )
-            SELECT 
-                _id, business_no, capital_amount, company_address, company_address_part,
-                company_name, company_name_part, create_date, data_create_time, 
-                data_last_modified_time, head_office_business_no,
-                industrial_code1, industrial_code2, industrial_code3, industrial_code4,
-                industrial_name1, industrial_name2, industrial_name3, industrial_name4,
-                organization_type, use_business_invoice
-            FROM company_gov_staging
-            ON CONFLICT (business_no) DO NOTHING;
-        """)
-        db.session.commit()
-        print("✅ 已搬移到正式表 CompanyGov")
+        moved, deleted = merge_staging()
+        print(f"✅ 已搬移到正式表 CompanyGov: 新增或異動 {moved} 筆，移除 {deleted} 筆")
+
+        updated = refresh_branch_counts()
+        print(f"已更新 {updated} 筆分公司數")
+
+        count = business_no_index.build()
+        print(f"統一編號索引已重建，共 {count} 筆")
+
+        count = registry_snapshot.build()
+        print(f"欄式快照已輸出，共 {count} 筆")
+
+        # 新的匯入世代，讓共用快取中的舊資料全部失效
+        generation = payload_cache.bump_generation()
+        print(f"快取匯入世代已更新為 {generation}")
     except Exception as e:
         db.session.rollback()
         print(f"搬移正式表時出錯: {e}")
@@ -0,0 +1,248 @@
+# app/slowlog.py
+"""
+慢查詢記錄
+
+執行時間超過 SLOW_QUERY_THRESHOLD_MS 的 SQL 會以 JSON Lines 寫入 SLOW_QUERY_LOG_DIR，
+內容包含 SQL 與參數、模糊比對的關鍵字、耗時、筆數與端點；
+其中 SLOW_QUERY_EXPLAIN_RATE 比例的 SELECT 標記為 explain，
+`flask slow-query-report --explain N` 在請求以外以 EXPLAIN (ANALYZE, BUFFERS) 重新執行取得實際執行計畫，
+已經很慢的查詢不會在請求中再執行一次
+
+每個行程寫入自己的檔案並各自輪替，避免多個 worker 同時輪替同一個檔案；
+`flask slow-query-report` 讀取所有檔案，依關鍵字型態分組統計
+"""
+import datetime
+import glob
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.metrics import current_endpoint
+
+_FILE_PREFIX = 'slow_queries'
+
+
+def _keywords(parameters):
+    """從綁定參數中取出 ilike 的關鍵字 ('%關鍵字%')"""
+    if isinstance(parameters, dict):
+        values = parameters.values()
+    elif isinstance(parameters, (list, tuple)):
+        values = parameters
+    else:
+        return []
+    # 同一個關鍵字會比對多個欄位，去除重複並保留順序
+    return list(dict.fromkeys(
+        value.strip('%') for value in values
+        if isinstance(value, str) and len(value) > 2 and value.startswith('%') and value.endswith('%')
+    ))
+
+
+def _json_safe(parameters):
+    if isinstance(parameters, dict):
+        return {str(key): _json_safe(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_json_safe(value) for value in parameters]
+    if parameters is None or isinstance(parameters, (str, int, float, bool)):
+        return parameters
+    return str(parameters)
+
+
+def keyword_shape(keyword):
+    """
+    關鍵字型態，例如 '台北' -> 'cjk2'、'12345675' -> 'digit8'
+    少於 3 個字的關鍵字無法使用 pg_trgm 索引，分組時可直接看出
+    """
+    if re.fullmatch(r'\d+', keyword):
+        kind = 'digit'
+    elif re.fullmatch(r'[㐀-鿿豈-﫿]+', keyword):
+        kind = 'cjk'
+    elif re.fullmatch(r'[A-Za-z]+', keyword):
+        kind = 'latin'
+    else:
+        kind = 'mixed'
+    return f'{kind}{len(keyword)}'
+
+
+def keyword_pattern(keywords):
+    """關鍵字組合的型態，與順序無關"""
+    return ' + '.join(sorted(keyword_shape(keyword) for keyword in keywords)) or '-'
+
+
+def normalize_sql(statement):
+    """去除字面值與多餘空白，讓相同結構的 SQL 歸為同一組"""
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'\b\d+\b', '?', statement)
+    statement = re.sub(r'%\(\w+\)s|\$\d+', '?', statement)
+    return re.sub(r'\s+', ' ', statement).strip()
+
+
+class SlowQueryLog:
+    """慢查詢記錄，用法與其他 Flask 擴展相同"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.threshold = 0.5
+        self.explain_rate = 0.0
+        self.log_dir = None
+        self.max_bytes = 10 * 1024 * 1024
+        self.backup_count = 5
+        self._logger = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.log_dir = app.config.get('SLOW_QUERY_LOG_DIR') or os.path.join(tempfile.gettempdir(), 'slow_queries')
+        self.enabled = app.config.get('SLOW_QUERY_ENABLED', True)
+        if not self.enabled:
+            return
+
+        self.threshold = int(app.config.get('SLOW_QUERY_THRESHOLD_MS', 500)) / 1000
+        self.explain_rate = float(app.config.get('SLOW_QUERY_EXPLAIN_RATE', 0.1))
+        self.max_bytes = int(app.config.get('SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024))
+        self.backup_count = int(app.config.get('SLOW_QUERY_LOG_BACKUPS', 5))
+
+        if not event.contains(Engine, 'after_cursor_execute', self._after_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _get_logger(self):
+        """第一次寫入時才開檔，fork 後的行程改寫自己的檔案"""
+        if self._logger is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            os.makedirs(self.log_dir, exist_ok=True)
+            handler = RotatingFileHandler(
+                os.path.join(self.log_dir, f'{_FILE_PREFIX}-{self._pid}.jsonl'),
+                maxBytes=self.max_bytes, backupCount=self.backup_count, encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger = logging.getLogger(f'{__name__}.{self._pid}')
+            logger.handlers = [handler]
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            self._logger = logger
+        return self._logger
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slowlog_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_slowlog_started', None)
+        if started is None:
+            return
+
+        duration = time.perf_counter() - started
+        if duration < self.threshold:
+            return
+
+        entry = {
+            'time': datetime.datetime.utcnow().isoformat(),
+            'endpoint': current_endpoint(),
+            'durationMs': round(duration * 1000, 1),
+            'rowCount': cursor.rowcount,
+            'keywords': _keywords(parameters),
+            'sql': statement,
+            'parameters': _json_safe(parameters),
+        }
+
+        # 只標記抽樣的 SELECT，執行計畫由報表指令在請求以外取得
+        if (
+            conn.dialect.name == 'postgresql' and not executemany and
+            statement.lstrip().upper().startswith('SELECT') and
+            random.random() < self.explain_rate
+        ):
+            entry['explain'] = True
+
+        self._get_logger().info(json.dumps(entry, ensure_ascii=False))
+
+    def explain(self, engine, entry, timeout_ms=30000):
+        """
+        重新執行記錄中的查詢取得執行計畫，EXPLAIN ANALYZE 會實際執行查詢
+        以 DBAPI 連線的唯讀交易執行，不觸發引擎事件，結束後一律回復
+        """
+        raw = engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            try:
+                cursor.execute('SET TRANSACTION READ ONLY')
+                cursor.execute(f'SET LOCAL statement_timeout = {int(timeout_ms)}')
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {entry['sql']}", entry['parameters'])
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            except Exception as e:
+                return f'EXPLAIN 失敗: {e}'
+            finally:
+                cursor.close()
+                raw.rollback()
+        finally:
+            raw.close()
+
+    # ---- 報表 ----
+
+    def iter_entries(self, since=None):
+        """讀取所有行程的記錄 (含已輪替的檔案)"""
+        for path in sorted(glob.glob(os.path.join(self.log_dir, f'{_FILE_PREFIX}-*.jsonl*'))):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if since is None or entry['time'] >= since.isoformat():
+                        yield entry
+
+    def report(self, since=None, explain=0, engine=None):
+        """
+        依 (端點, 關鍵字型態) 分組；沒有關鍵字的查詢改依正規化後的 SQL 分組
+        explain 大於 0 時，每組最多對 explain 筆標記的查詢以 engine 取得執行計畫
+        回傳依總耗時排序的分組統計
+        """
+        groups = {}
+        for entry in self.iter_entries(since):
+            if entry['keywords']:
+                key = (entry['endpoint'], keyword_pattern(entry['keywords']))
+            else:
+                key = (entry['endpoint'], normalize_sql(entry['sql']))
+
+            group = groups.setdefault(key, {
+                'endpoint': key[0],
+                'pattern': key[1],
+                'durations': [],
+                'rows': [],
+                'examples': [],
+                'seqScans': 0,
+                'explained': 0,
+                'plans': [],
+            })
+            group['durations'].append(entry['durationMs'])
+            group['rows'].append(entry['rowCount'])
+            if entry['keywords'] and len(group['examples']) < 5 and entry['keywords'] not in group['examples']:
+                group['examples'].append(entry['keywords'])
+            if entry.get('explain') and engine is not None and len(group['plans']) < explain:
+                group['plans'].append(self.explain(engine, entry))
+
+        result = []
+        for group in groups.values():
+            durations = sorted(group.pop('durations'))
+            rows = group.pop('rows')
+            plans = group.pop('plans')
+            group.update({
+                'explained': len(plans),
+                'seqScans': sum('Seq Scan' in plan for plan in plans),
+                'count': len(durations),
+                'totalMs': round(sum(durations), 1),
+                'p50Ms': durations[len(durations) // 2],
+                'p95Ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                'maxMs': durations[-1],
+                'avgRows': round(sum(rows) / len(rows), 1),
+            })
+            result.append(group)
+        return sorted(result, key=lambda group: group['totalMs'], reverse=True)
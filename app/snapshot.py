@@ -0,0 +1,257 @@
+# app/snapshot.py
+"""
+登記資料的欄式快照
+
+匯入完成後將 company_govs 輸出為每欄一個 .npy 檔，worker 以 np.load(mmap_mode='r') 映射，
+/DataAccess/Stats 的篩選與分組統計以 NumPy 向量運算完成，不存取資料庫
+
+- 縣市、組織型態以字典編碼存成 uint16，字典存在 meta.json
+- 行業代碼為 6 位數字，直接存成 int32 (缺值為 -1)，前綴篩選即為數值範圍
+- 資本額存成 int64 (缺值為 -1)，設立年份存成 int16 (缺值為 0)
+
+每次輸出寫入新的版本目錄，完成後替換 current 符號連結；worker 發現連結指向新版本時重新映射
+輸出只在匯入後與 `flask build-snapshot` 中進行，快照不存在時查詢拋出 SnapshotNotBuilt，回應 503；
+預設目錄在 Flask 的 instance 資料夾，重新開機後仍保留
+
+numpy 在使用時才載入，不在 worker 啟動流程中 (benchmarks/startup.py)
+"""
+import json
+import os
+import shutil
+import time
+
+from app.normalize import normalize_county
+
+# 分類欄位: 欄位名稱 -> 字典編碼
+CATEGORICAL_COLUMNS = ('county', 'organization_type')
+INDUSTRIAL_COLUMNS = ('industrial_code1', 'industrial_code2', 'industrial_code3', 'industrial_code4')
+
+# groupBy 參數 -> 快照欄位
+GROUP_BY_OPTIONS = {
+    'county': 'county',
+    'organizationType': 'organization_type',
+    'industry': 'industrial_code1',
+    'foundedYear': 'established_year',
+    'isBranch': 'is_branch',
+}
+
+# 保留的舊版本數量，正在讀取舊版本的 worker 不會因目錄被刪除而失敗
+_KEEP_VERSIONS = 2
+
+
+class SnapshotNotBuilt(Exception):
+    """欄式快照尚未輸出"""
+
+
+def _industrial_code(value):
+    return int(value) if value and len(value) == 6 and value.isdigit() else -1
+
+
+class RegistrySnapshot:
+    """登記資料欄式快照，用法與其他 Flask 擴展相同"""
+
+    def __init__(self, app=None):
+        self.directory = None
+        self._version = None
+        self._columns = None
+        self._meta = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('SNAPSHOT_DIR') or os.path.join(app.instance_path, 'registry_snapshot')
+
+    @property
+    def _current_link(self):
+        return os.path.join(self.directory, 'current')
+
+    # ---- 輸出 ----
+
+    def build(self):
+        """由 company_govs 輸出新版本的快照，回傳筆數 (需在 app context 中執行)"""
+        import numpy as np
+
+        from app import db
+        from app.models import CompanyGov
+
+        dictionaries = {column: {'': 0} for column in CATEGORICAL_COLUMNS}
+        values = {column: [] for column in (
+            *CATEGORICAL_COLUMNS, *INDUSTRIAL_COLUMNS, 'capital_amount', 'established_year', 'is_branch'
+        )}
+
+        rows = db.session.query(
+            CompanyGov.business_no, CompanyGov.county, CompanyGov.organization_type,
+            *[getattr(CompanyGov, column) for column in INDUSTRIAL_COLUMNS],
+            CompanyGov.capital_amount_num, CompanyGov.established_on, CompanyGov.head_office_business_no
+        ).yield_per(50000)
+        for row in rows:
+            for column, value in (('county', row.county),
+                                  ('organization_type', row.organization_type or '')):
+                codes = dictionaries[column]
+                values[column].append(codes.setdefault(value, len(codes)))
+            for column in INDUSTRIAL_COLUMNS:
+                values[column].append(_industrial_code(getattr(row, column)))
+            values['capital_amount'].append(row.capital_amount_num if row.capital_amount_num is not None else -1)
+            values['established_year'].append(row.established_on.year if row.established_on else 0)
+            head_office = row.head_office_business_no
+            values['is_branch'].append(bool(head_office) and head_office != row.business_no)
+
+        dtypes = {
+            **{column: np.uint16 for column in CATEGORICAL_COLUMNS},
+            **{column: np.int32 for column in INDUSTRIAL_COLUMNS},
+            'capital_amount': np.int64,
+            'established_year': np.int16,
+            'is_branch': np.bool_,
+        }
+
+        os.makedirs(self.directory, exist_ok=True)
+        version = f'{int(time.time() * 1000)}-{os.getpid()}'
+        version_dir = os.path.join(self.directory, version)
+        os.makedirs(version_dir)
+        for column, dtype in dtypes.items():
+            np.save(os.path.join(version_dir, f'{column}.npy'), np.asarray(values[column], dtype=dtype))
+
+        count = len(values['is_branch'])
+        with open(os.path.join(version_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'count': count,
+                'builtAt': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()),
+                # 依編碼排列的字典，index 即為編碼
+                'dictionaries': {
+                    column: sorted(codes, key=codes.get) for column, codes in dictionaries.items()
+                },
+            }, f, ensure_ascii=False)
+
+        # 以新的符號連結替換 current，讀取端不會看到寫到一半的版本
+        temp_link = f'{self._current_link}.{os.getpid()}.tmp'
+        os.symlink(version, temp_link)
+        os.replace(temp_link, self._current_link)
+
+        versions = sorted(
+            name for name in os.listdir(self.directory)
+            if name != 'current' and os.path.isdir(os.path.join(self.directory, name))
+        )
+        for name in versions[:-_KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+        return count
+
+    def is_built(self):
+        return os.path.exists(self._current_link)
+
+    # ---- 讀取 ----
+
+    def load(self):
+        """回傳 (欄位, meta)，current 指向新版本時重新映射；快照不存在時拋出 SnapshotNotBuilt"""
+        import numpy as np
+
+        try:
+            version = os.readlink(self._current_link)
+        except FileNotFoundError:
+            raise SnapshotNotBuilt(f'欄式快照尚未輸出: {self.directory}')
+        if version != self._version:
+            version_dir = os.path.join(self.directory, version)
+            with open(os.path.join(version_dir, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            columns = {
+                name[:-len('.npy')]: np.load(os.path.join(version_dir, name), mmap_mode='r')
+                for name in os.listdir(version_dir) if name.endswith('.npy')
+            }
+            self._columns, self._meta, self._version = columns, meta, version
+        return self._columns, self._meta
+
+    def stats(self, args):
+        """
+        依查詢參數篩選並分組統計，參數格式錯誤時拋出 ValueError
+        篩選: county、organizationType (可重複)、industrialCode (行業代碼前綴，比對 4 個行業代碼欄位)、
+              minCapital / maxCapital、foundedFrom / foundedTo (年份)
+        分組: groupBy 為 county / organizationType / industry / foundedYear / isBranch，
+              industry 依主要行業代碼的前 codeDigits 碼 (預設 2) 分組
+        """
+        import numpy as np
+
+        started = time.perf_counter()
+        columns, meta = self.load()
+        dictionaries = meta['dictionaries']
+        mask = np.ones(meta['count'], dtype=bool)
+
+        for param, column in (('county', 'county'), ('organizationType', 'organization_type')):
+            wanted = args.getlist(param)
+            if not wanted:
+                continue
+            if param == 'county':
+                wanted = [normalize_county(value) for value in wanted]
+            codes = [dictionaries[column].index(value) for value in wanted if value in dictionaries[column]]
+            mask &= np.isin(columns[column], codes)
+
+        industrial_code = args.get('industrialCode')
+        if industrial_code:
+            if not industrial_code.isdigit() or len(industrial_code) > 6:
+                raise ValueError('industrialCode 需為 1 到 6 位數字')
+            # 前綴 4729 -> 472900 <= 代碼 < 473000
+            scale = 10 ** (6 - len(industrial_code))
+            low, high = int(industrial_code) * scale, (int(industrial_code) + 1) * scale
+            matched = np.zeros(meta['count'], dtype=bool)
+            for column in INDUSTRIAL_COLUMNS:
+                codes = columns[column]
+                matched |= (codes >= low) & (codes < high)
+            mask &= matched
+
+        try:
+            if args.get('minCapital'):
+                mask &= columns['capital_amount'] >= int(args.get('minCapital'))
+            if args.get('maxCapital'):
+                capital = columns['capital_amount']
+                mask &= (capital >= 0) & (capital <= int(args.get('maxCapital')))
+            if args.get('foundedFrom'):
+                mask &= columns['established_year'] >= int(args.get('foundedFrom'))
+            if args.get('foundedTo'):
+                year = columns['established_year']
+                mask &= (year > 0) & (year <= int(args.get('foundedTo')))
+        except ValueError:
+            raise ValueError('資本額與設立年份需為整數')
+
+        capital = np.where(columns['capital_amount'] >= 0, columns['capital_amount'], 0)
+        result = {
+            'total': int(mask.sum()),
+            'capitalSum': int(capital[mask].sum()),
+            'snapshotBuiltAt': meta['builtAt'],
+        }
+
+        group_by = args.get('groupBy')
+        if group_by:
+            if group_by not in GROUP_BY_OPTIONS:
+                raise ValueError(f"groupBy 需為 {' / '.join(GROUP_BY_OPTIONS)}")
+            keys = np.asarray(columns[GROUP_BY_OPTIONS[group_by]][mask])
+            if group_by == 'industry':
+                code_digits = args.get('codeDigits', '2')
+                if not code_digits.isdigit() or not 1 <= int(code_digits) <= 6:
+                    raise ValueError('codeDigits 需為 1 到 6')
+                code_digits = int(code_digits)
+                keys = np.where(keys >= 0, keys // 10 ** (6 - code_digits), -1)
+
+            groups, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            sums = np.bincount(inverse.ravel(), weights=capital[mask], minlength=len(groups))
+
+            column = GROUP_BY_OPTIONS[group_by]
+
+            def label(key):
+                if column in dictionaries:
+                    return dictionaries[column][key] or None
+                if group_by == 'isBranch':
+                    return bool(key)
+                if group_by == 'industry':
+                    return str(key).zfill(code_digits) if key >= 0 else None
+                return key or None
+
+            result['groups'] = sorted(
+                [
+                    {'key': label(key), 'count': int(count), 'capitalSum': int(total)}
+                    for key, count, total in zip(groups.tolist(), counts.tolist(), sums.tolist())
+                ],
+                key=lambda group: group['count'],
+                reverse=True
+            )
+
+        result['elapsedMs'] = round((time.perf_counter() - started) * 1000, 2)
+        return result
@@ -0,0 +1,382 @@
+# app/upsert.py
+"""
+Company 補充資料的批次寫入
+
+文件格式與 Company.to_dict() 相同 (BusinessNo、CompanyName、Telephones、FactoryInfos ...)，
+以統一編號對應既有資料：
+- 不存在的公司新增，存在的公司只更新內容有變動的欄位
+- 文件中出現的子資料欄位 (電話、網站、工廠等) 與既有資料比對，只刪除多出的列、新增缺少的列；
+  文件中沒有的欄位維持不變
+- 每批在同一個交易中以多列 INSERT 與依 id 的 DELETE 寫入，不經過 ORM 的逐筆 cascade
+
+供 POST /DataAccess/UpsertCompanies 與 `flask load-companies` 使用
+"""
+import datetime
+
+from sqlalchemy import bindparam, delete, insert, select, tuple_, update
+
+from app import db, payload_cache
+from app.models import (
+    Company, Industrial, Contact, Telephone, Fax, Email, Website,
+    FactoryInfo, Product, UsedMaterial, UseKeyword
+)
+from app.normalize import parse_capital_amount
+
+UPSERT_BATCH_SIZE = 1000
+
+# 文件欄位 -> companies 欄位
+COMPANY_FIELDS = {
+    'CompanyName': 'company_name',
+    'CompanyAddress': 'company_address',
+    'BusinessDescription': 'business_description',
+    'Introduction': 'introduction',
+    'CapitalAmount': 'capital_amount',
+    'EmployeeCount': 'employee_count',
+    'OrganizationType': 'organization_type',
+}
+
+# 文件欄位 -> (子資料表, 值欄位)
+COMPANY_CHILDREN = {
+    'Industrials': (Industrial.__table__, 'name'),
+    'Contacts': (Contact.__table__, 'name'),
+    'Telephones': (Telephone.__table__, 'number'),
+    'Faxes': (Fax.__table__, 'number'),
+    'Emails': (Email.__table__, 'address'),
+    'Websites': (Website.__table__, 'url'),
+    'UseKeywords': (UseKeyword.__table__, 'keyword'),
+}
+
+# 工廠以 RegiID 對應
+FACTORY_FIELDS = {
+    'FactoryName': 'factory_name',
+    'FactoryAddress': 'factory_address',
+    'Contact': 'contact',
+}
+
+FACTORY_CHILDREN = {
+    'Products': (Product.__table__, 'name'),
+    'UsedMaterials': (UsedMaterial.__table__, 'name'),
+}
+
+
+def _text(value):
+    if value is None:
+        return None
+    return str(value).strip()
+
+
+def _check_length(table, column, value):
+    length = table.c[column].type.length
+    if value is not None and length and len(value) > length:
+        raise ValueError(f'{table.name}.{column} 超過 {length} 字')
+
+
+def _values(table, column, items):
+    """子資料清單 -> 去除空白與重複後的值，保留順序"""
+    if not isinstance(items, list):
+        raise ValueError(f'{table.name} 需為陣列')
+    values = []
+    for item in items:
+        value = _text(item)
+        if value:
+            _check_length(table, column, value)
+            values.append(value)
+    return list(dict.fromkeys(values))
+
+
+def normalize_document(document):
+    """檢查並整理一份公司文件，格式錯誤時拋出 ValueError"""
+    if not isinstance(document, dict):
+        raise ValueError('文件需為物件')
+
+    business_no = _text(document.get('BusinessNo'))
+    if not business_no:
+        raise ValueError('缺少 BusinessNo')
+    _check_length(Company.__table__, 'business_no', business_no)
+
+    fields = {}
+    for key, column in COMPANY_FIELDS.items():
+        if key not in document:
+            continue
+        value = document[key]
+        if column == 'employee_count':
+            try:
+                value = int(value or 0)
+            except (TypeError, ValueError):
+                raise ValueError('EmployeeCount 需為整數')
+        else:
+            value = _text(value)
+            _check_length(Company.__table__, column, value)
+        fields[column] = value
+    if 'company_name' in fields and not fields['company_name']:
+        raise ValueError('CompanyName 不可為空')
+    if 'capital_amount' in fields:
+        fields['capital_amount_num'] = parse_capital_amount(fields['capital_amount'])
+
+    children = {
+        key: _values(table, column, document[key])
+        for key, (table, column) in COMPANY_CHILDREN.items() if key in document
+    }
+
+    factories = None
+    if 'FactoryInfos' in document:
+        if not isinstance(document['FactoryInfos'], list):
+            raise ValueError('FactoryInfos 需為陣列')
+        factories = {}
+        for factory in document['FactoryInfos']:
+            if not isinstance(factory, dict) or not _text(factory.get('RegiID')):
+                raise ValueError('FactoryInfos 每筆需有 RegiID')
+            regi_id = _text(factory['RegiID'])
+            _check_length(FactoryInfo.__table__, 'regi_id', regi_id)
+            factory_fields = {}
+            for key, column in FACTORY_FIELDS.items():
+                if key in factory:
+                    factory_fields[column] = _text(factory[key])
+                    _check_length(FactoryInfo.__table__, column, factory_fields[column])
+            if not factory_fields.get('factory_name'):
+                raise ValueError(f'工廠 {regi_id} 缺少 FactoryName')
+            factories[regi_id] = {
+                'fields': factory_fields,
+                'children': {
+                    key: _values(table, column, factory[key])
+                    for key, (table, column) in FACTORY_CHILDREN.items() if key in factory
+                },
+            }
+
+    return {'business_no': business_no, 'fields': fields, 'children': children, 'factories': factories}
+
+
+def _sync_children(table, parent_column, value_column, desired):
+    """
+    desired 為 {上層 id: [值]}，只處理其中的上層資料
+    回傳有異動的上層 id
+    """
+    if not desired:
+        return set()
+
+    parent = table.c[parent_column]
+    value = table.c[value_column]
+    remaining = {parent_id: set(values) for parent_id, values in desired.items()}
+
+    stale_ids, touched = [], set()
+    rows = db.session.execute(select(table.c.id, parent, value).where(parent.in_(list(desired))))
+    for row_id, parent_id, row_value in rows:
+        wanted = remaining[parent_id]
+        if row_value in wanted:
+            wanted.discard(row_value)
+        else:
+            # 不在文件中或重複的列
+            stale_ids.append(row_id)
+            touched.add(parent_id)
+
+    if stale_ids:
+        db.session.execute(delete(table).where(table.c.id.in_(stale_ids)))
+
+    new_rows = [
+        {parent_column: parent_id, value_column: item}
+        for parent_id, values in desired.items() for item in values if item in remaining[parent_id]
+    ]
+    if new_rows:
+        db.session.execute(insert(table), new_rows)
+        touched.update(row[parent_column] for row in new_rows)
+    return touched
+
+
+def _sync_factories(factories_by_company):
+    """factories_by_company 為 {company_id: {regi_id: 工廠}}，回傳有異動的 company_id"""
+    if not factories_by_company:
+        return set()
+
+    factories = FactoryInfo.__table__
+    existing = {}
+    rows = db.session.execute(
+        select(factories.c.id, factories.c.company_id, factories.c.regi_id, *[
+            factories.c[column] for column in FACTORY_FIELDS.values()
+        ]).where(factories.c.company_id.in_(list(factories_by_company)))
+    )
+    for row in rows:
+        existing[(row.company_id, row.regi_id)] = row
+
+    wanted = {
+        (company_id, regi_id): factory
+        for company_id, items in factories_by_company.items() for regi_id, factory in items.items()
+    }
+
+    # 移除文件中沒有的工廠，先刪除其產品與原料
+    stale_ids = [row.id for key, row in existing.items() if key not in wanted]
+    if stale_ids:
+        for table, _ in FACTORY_CHILDREN.values():
+            db.session.execute(delete(table).where(table.c.factory_info_id.in_(stale_ids)))
+        db.session.execute(delete(factories).where(factories.c.id.in_(stale_ids)))
+
+    new_rows = [
+        {'company_id': company_id, 'regi_id': regi_id, **dict.fromkeys(FACTORY_FIELDS.values()), **factory['fields']}
+        for (company_id, regi_id), factory in wanted.items() if (company_id, regi_id) not in existing
+    ]
+    if new_rows:
+        db.session.execute(insert(factories), new_rows)
+
+    changed_rows = []
+    for key, factory in wanted.items():
+        row = existing.get(key)
+        if row is not None and any(getattr(row, column) != value for column, value in factory['fields'].items()):
+            values = {column: getattr(row, column) for column in FACTORY_FIELDS.values()}
+            values.update(factory['fields'])
+            changed_rows.append({'_id': row.id, **values})
+    if changed_rows:
+        db.session.execute(
+            update(factories).where(factories.c.id == bindparam('_id')),
+            changed_rows
+        )
+
+    # 新增的工廠取回 id 後比對產品與原料
+    factory_ids = {key: row.id for key, row in existing.items() if key in wanted}
+    if new_rows:
+        rows = db.session.execute(
+            select(factories.c.id, factories.c.company_id, factories.c.regi_id)
+            .where(tuple_(factories.c.company_id, factories.c.regi_id).in_(
+                [(row['company_id'], row['regi_id']) for row in new_rows]
+            ))
+        )
+        factory_ids.update({(row.company_id, row.regi_id): row.id for row in rows})
+
+    company_ids = {factory_id: company_id for (company_id, _), factory_id in factory_ids.items()}
+    touched = {existing[key].company_id for key in existing if key not in wanted}
+    touched.update(row['company_id'] for row in new_rows)
+    touched.update(company_ids[row['_id']] for row in changed_rows)
+    for key, (table, column) in FACTORY_CHILDREN.items():
+        changed_factories = _sync_children(table, 'factory_info_id', column, {
+            factory_ids[factory_key]: factory['children'][key]
+            for factory_key, factory in wanted.items() if key in factory['children']
+        })
+        touched.update(company_ids[factory_id] for factory_id in changed_factories)
+
+    return touched
+
+
+def upsert_batch(documents):
+    """
+    在同一個交易中寫入一批已整理的文件，回傳新增、更新、未變動的公司數與缺少名稱而略過的統一編號
+    同一批中重複的統一編號以最後一份為準
+    """
+    documents = list({document['business_no']: document for document in documents}.values())
+    companies = Company.__table__
+    now = datetime.datetime.utcnow()
+
+    existing = {
+        row.business_no: row
+        for row in db.session.execute(
+            select(companies.c.id, companies.c.business_no, *[
+                companies.c[column] for column in (*COMPANY_FIELDS.values(), 'capital_amount_num')
+            ]).where(companies.c.business_no.in_([document['business_no'] for document in documents]))
+        )
+    }
+
+    # 新公司必須有名稱，缺少時只略過該文件
+    rejected = [
+        document['business_no'] for document in documents
+        if document['business_no'] not in existing and not document['fields'].get('company_name')
+    ]
+    if rejected:
+        documents = [document for document in documents if document['business_no'] not in rejected]
+
+    new_documents = [document for document in documents if document['business_no'] not in existing]
+    new_business_nos = {document['business_no'] for document in new_documents}
+    if new_documents:
+        db.session.execute(insert(companies), [
+            {
+                'business_no': document['business_no'],
+                **dict.fromkeys((*COMPANY_FIELDS.values(), 'capital_amount_num')),
+                'employee_count': 0,
+                **document['fields'],
+                'created_at': now,
+                'updated_at': now,
+            }
+            for document in new_documents
+        ])
+        for row in db.session.execute(
+            select(companies.c.id, companies.c.business_no)
+            .where(companies.c.business_no.in_(list(new_business_nos)))
+        ):
+            existing[row.business_no] = row
+
+    # 只更新內容有變動的公司，欄位一致才能以 executemany 批次送出
+    changed_rows = []
+    for document in documents:
+        row = existing[document['business_no']]
+        if document['business_no'] in new_business_nos:
+            continue
+        if any(getattr(row, column) != value for column, value in document['fields'].items()):
+            values = {column: getattr(row, column) for column in (*COMPANY_FIELDS.values(), 'capital_amount_num')}
+            values.update(document['fields'])
+            changed_rows.append({'_id': row.id, **values, 'updated_at': now})
+    if changed_rows:
+        db.session.execute(
+            update(companies).where(companies.c.id == bindparam('_id')),
+            changed_rows
+        )
+
+    touched = {row['_id'] for row in changed_rows}
+    for key, (table, column) in COMPANY_CHILDREN.items():
+        touched |= _sync_children(table, 'company_id', column, {
+            existing[document['business_no']].id: document['children'][key]
+            for document in documents if key in document['children']
+        })
+    touched |= _sync_factories({
+        existing[document['business_no']].id: document['factories']
+        for document in documents if document['factories'] is not None
+    })
+
+    db.session.commit()
+
+    # 異動的公司讓共用快取中的詳細資料失效
+    updated = [
+        document['business_no'] for document in documents
+        if document['business_no'] not in new_business_nos and existing[document['business_no']].id in touched
+    ]
+    payload_cache.invalidate_business_nos(updated)
+
+    return {
+        'inserted': len(new_documents),
+        'updated': len(updated),
+        'unchanged': len(documents) - len(new_documents) - len(updated),
+        'rejected': rejected,
+    }
+
+
+def upsert_companies(documents, batch_size=UPSERT_BATCH_SIZE):
+    """
+    寫入公司文件 (可為 generator)，回傳統計與格式錯誤的文件
+    格式錯誤的文件略過，不影響同批其他文件；寫入失敗時整批回復
+    """
+    result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'errors': []}
+
+    def flush(batch):
+        try:
+            counts = upsert_batch([document for _, document in batch])
+        except Exception as e:
+            db.session.rollback()
+            result['errors'].extend({'index': index, 'error': str(e)} for index, _ in batch)
+            return
+        for key in ('inserted', 'updated', 'unchanged'):
+            result[key] += counts[key]
+        rejected = set(counts['rejected'])
+        result['errors'].extend(
+            {'index': index, 'error': '新公司缺少 CompanyName'}
+            for index, document in batch if document['business_no'] in rejected
+        )
+
+    batch = []
+    for index, document in enumerate(documents):
+        try:
+            batch.append((index, normalize_document(document)))
+        except ValueError as e:
+            result['errors'].append({'index': index, 'error': str(e)})
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    return result
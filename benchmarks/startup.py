@@ -0,0 +1,79 @@
+# benchmarks/startup.py
+"""
+worker 啟動時間基準測試
+
+在全新的 Python 行程中量測：
+- import_ms: 匯入 app 套件 (含 create_app()) 所需時間
+- first_request_ms: 匯入後處理第一個請求 (/DataAccess/test) 所需時間
+- heavy_modules: 啟動後已載入的重量級匯出模組 (應為空)
+
+用法:
+    python benchmarks/startup.py --runs 5 --max-import-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['pandas', 'numpy', 'docx', 'xlsxwriter', 'pyarrow']
+
+CHILD = '''
+import json, sys, time
+t0 = time.perf_counter()
+from app import app
+t1 = time.perf_counter()
+response = app.test_client().get('/DataAccess/test')
+t2 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'first_request_ms': (t2 - t1) * 1000,
+    'status': response.status_code,
+    'heavy_modules': [m for m in %r if m in sys.modules],
+}))
+''' % HEAVY_MODULES
+
+
+def run_once():
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, help='匯入時間中位數超過此值時以非 0 結束')
+    parser.add_argument('--output', help='將結果寫入 JSON 檔')
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    report = {
+        'runs': args.runs,
+        'import_ms_median': statistics.median(s['import_ms'] for s in samples),
+        'import_ms_max': max(s['import_ms'] for s in samples),
+        'first_request_ms_median': statistics.median(s['first_request_ms'] for s in samples),
+        'heavy_modules': sorted({m for s in samples for m in s['heavy_modules']}),
+    }
+
+    print(f"匯入時間     中位數 {report['import_ms_median']:.1f} ms / 最大 {report['import_ms_max']:.1f} ms")
+    print(f"第一個請求   中位數 {report['first_request_ms_median']:.1f} ms")
+    print(f"已載入的重量級模組: {', '.join(report['heavy_modules']) or '無'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failed = bool(report['heavy_modules'])
+    if args.max_import_ms and report['import_ms_median'] > args.max_import_ms:
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
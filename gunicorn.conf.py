@@ -0,0 +1,74 @@
+# gunicorn.conf.py
+"""
+gunicorn 設定
+
+GUNICORN_PRELOAD=true 時在 master 行程載入應用程式後再 fork worker，
+已載入的模組與唯讀資料以 copy-on-write 方式由所有 worker 共用
+
+非同步服務模式改用 uvicorn worker 並載入 app.asgi:application，
+單一 worker 即可同時處理大量查詢
+
+sync worker 處理請求期間不回報存活，timeout 需大於最長的請求時限 (DEADLINE_*_MS)，
+否則時限到期前 worker 就被 master 終止，用戶端只會收到中斷的連線而不是 422；
+未設定 GUNICORN_TIMEOUT 時以最長的時限加上 30 秒為預設值
+"""
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+# 與 app/config.py 的 DEADLINES 相同的環境變數與預設值 (不在這裡載入應用程式)
+_DEADLINES_MS = (
+    int(os.environ.get('DEADLINE_SEARCH_MS', 15000)),
+    int(os.environ.get('DEADLINE_EXPORT_MS', 300000)),
+    int(os.environ.get('DEADLINE_READ_MS', 5000)),
+)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', max(_DEADLINES_MS) // 1000 + 30))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+# Prometheus 多行程模式：各 worker 的指標寫入此目錄，需在載入應用程式前設定
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'prometheus_multiproc'))
+
+
+def on_starting(server):
+    """清除上次執行留下的指標檔案，並檢查 worker 逾時是否大於請求時限"""
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    if server.cfg.timeout * 1000 <= max(_DEADLINES_MS):
+        server.log.warning(
+            'GUNICORN_TIMEOUT=%s 秒不大於最長的請求時限 %s 毫秒，時限到期前 worker 會被終止',
+            server.cfg.timeout, max(_DEADLINES_MS)
+        )
+
+
+def when_ready(server):
+    """preload 模式下預先載入匯出用的重量級模組，讓 worker 共用"""
+    if not preload_app:
+        return
+
+    from app.exports import _label_template
+    import xlsxwriter  # noqa: F401
+
+    _label_template()
+
+
+def post_fork(server, worker):
+    """fork 後不可沿用 master 的資料庫連線"""
+    if not preload_app:
+        return
+
+    from app import app, db
+
+    with app.app_context():
+        db.dispose_engines(close=False)
+
+
+def child_exit(server, worker):
+    """worker 結束時移除其即時指標，累計的計數仍保留"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,69 @@
+# tests/conftest.py
+"""
+測試環境: 資料庫改用暫存目錄下的 SQLite，共享記憶體檔案與輸出目錄也放在暫存目錄，
+需在載入 app 之前設定環境變數；設定 TEST_DATABASE_URL 時改用該 PostgreSQL 資料庫
+
+測試只建立各自需要的資料表；SQLite 無法在複合主鍵中自動編號，
+company_govs 在 SQLite 上以不自動編號的方式建立，測試需自行指定 id
+只能在 PostgreSQL 上執行的測試使用 postgresql fixture，其他資料庫時略過
+"""
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix='company_search_tests_')
+
+os.environ.update({
+    'DATABASE_URL': os.environ.get('TEST_DATABASE_URL') or f'sqlite:///{os.path.join(_TMP, "test.db")}',
+    'PAYLOAD_CACHE_PATH': os.path.join(_TMP, 'payload_cache'),
+    'RATE_LIMIT_PATH': os.path.join(_TMP, 'rate_limits'),
+    'BUSINESS_NO_INDEX_PATH': os.path.join(_TMP, 'business_no_index'),
+    'SNAPSHOT_DIR': os.path.join(_TMP, 'snapshot'),
+    'EXPORT_DIR': os.path.join(_TMP, 'exports'),
+    'SLOW_QUERY_LOG_DIR': os.path.join(_TMP, 'slow_queries'),
+    'SLOW_QUERY_ENABLED': 'false',
+    'RATE_LIMIT_ENABLED': 'false',
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from sqlalchemy import MetaData  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    from app import app as flask_app
+
+    with flask_app.app_context():
+        yield flask_app
+
+
+@pytest.fixture
+def create_tables(app):
+    """建立指定的資料表，測試結束後刪除"""
+    from app import db
+
+    created = []
+
+    def create(*models):
+        tables = [model.__table__ for model in models]
+        for table in tables:
+            if db.engine.dialect.name == 'sqlite' and len(table.primary_key.columns) > 1:
+                table = table.to_metadata(MetaData())
+                for column in table.primary_key.columns:
+                    column.autoincrement = False
+            table.create(db.engine, checkfirst=True)
+        created.extend(tables)
+
+    yield create
+    db.session.remove()
+    db.metadata.drop_all(db.engine, tables=list(reversed(created)))
+
+
+@pytest.fixture
+def postgresql(app):
+    from app import db
+
+    if db.engine.dialect.name != 'postgresql':
+        pytest.skip('需要 PostgreSQL (TEST_DATABASE_URL)')
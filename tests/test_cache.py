@@ -0,0 +1,61 @@
+# tests/test_cache.py
+import threading
+import time
+from types import SimpleNamespace
+
+from app.cache import PayloadCache
+
+
+def make_cache(tmp_path):
+    config = {'PAYLOAD_CACHE_PATH': str(tmp_path / 'payload_cache'), 'PAYLOAD_CACHE_SIZE_MB': 1}
+    return PayloadCache(SimpleNamespace(config=config))
+
+
+def test_single_tag_invalidation(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set('company:12345678', 'detail', tag='12345678')
+    cache.set('company:87654321', 'other', tag='87654321')
+
+    assert cache.invalidate_business_no('12345678') == 1
+    assert cache.get('company:12345678') is None
+    assert cache.get('company:87654321') == 'other'
+
+
+def test_page_invalidated_by_any_company(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set('summary:c:1:10', 'page one', tags=['11111111', '22222222'])
+    cache.set('summary:c:2:10', 'page two', tags=['33333333'])
+
+    assert cache.get('summary:c:1:10') == 'page one'
+    assert cache.invalidate_business_nos(['22222222']) == 1
+    assert cache.get('summary:c:1:10') is None
+    assert cache.get('summary:c:2:10') == 'page two'
+
+
+def test_tags_count_towards_slot_size(tmp_path):
+    cache = make_cache(tmp_path)
+    payload = 'x' * (cache.slot_size - 32 - 8)
+    assert cache.set('fits', payload, tag='1')
+    assert not cache.set('too-big', payload, tags=['1', '2'])
+
+
+def test_lock_excludes_threads(tmp_path):
+    cache = make_cache(tmp_path)
+    inside = []
+    overlaps = []
+
+    def worker():
+        for _ in range(20):
+            with cache._shm.lock():
+                inside.append(1)
+                if len(inside) > 1:
+                    overlaps.append(1)
+                time.sleep(0.0005)
+                inside.pop()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == []
@@ -0,0 +1,28 @@
+# tests/test_changes.py
+import pytest
+
+from app.changes import CHANGES_MAX_PAGE_SIZE, CHANGES_PAGE_SIZE, decode_token, encode_token, parse_limit
+
+
+def test_parse_limit():
+    assert parse_limit(None) == CHANGES_PAGE_SIZE
+    assert parse_limit('50') == 50
+    assert parse_limit(str(CHANGES_MAX_PAGE_SIZE + 1)) == CHANGES_MAX_PAGE_SIZE
+
+
+@pytest.mark.parametrize('value', ['abc', '-1', '0', '', '1.5', '²'])
+def test_parse_limit_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_limit(value)
+
+
+def test_token_round_trip():
+    position = {'changes': ['2024-01-02T03:04:05', 10], 'deleted': None}
+    decoded = decode_token(encode_token(position))
+    assert decoded['changes'][1] == 10
+    assert decoded['deleted'] is None
+
+
+def test_invalid_token():
+    with pytest.raises(ValueError):
+        decode_token('not-a-token')
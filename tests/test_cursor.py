@@ -0,0 +1,68 @@
+# tests/test_cursor.py
+"""搜尋游標的 result_ids 為 CompanyGov.id，GetSummary 與游標匯出都需經由統一編號對應到 Company"""
+import base64
+import datetime
+import gzip
+import json
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import db
+from app.models import (
+    ApiKey, Company, CompanyGov, Contact, Email, Fax, Industrial, SearchCursor, Telephone, Website,
+)
+
+# CompanyGov.id -> 統一編號，與 Company.id 的順序刻意不同
+GOV_ROWS = {30: '33333333', 10: '11111111', 20: '22222222'}
+CURSOR_IDS = ['30', '10', '20']
+EXPECTED = ['33333333', '11111111', '22222222']
+
+
+@pytest.fixture
+def cursor_data(create_tables, monkeypatch):
+    create_tables(ApiKey, Company, CompanyGov, SearchCursor, Industrial, Contact, Telephone, Fax, Email, Website)
+    monkeypatch.setattr('app.auth._key_active_cache', {})
+
+    api_key = ApiKey(key=ApiKey.hash_key('secret'))
+    db.session.add(api_key)
+    for business_no in sorted(GOV_ROWS.values()):
+        db.session.add(Company(business_no=business_no, company_name=f'公司{business_no}'))
+    for gov_id, business_no in GOV_ROWS.items():
+        db.session.add(CompanyGov(
+            id=gov_id, _id=business_no, business_no=business_no, company_name=f'公司{business_no}', county='台北市',
+        ))
+    db.session.add(SearchCursor(
+        cursor_id='cursor-1', keywords='[]', result_ids=json.dumps(CURSOR_IDS), total_count=len(CURSOR_IDS),
+        expires_at=datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+    ))
+    db.session.commit()
+
+    # Company.id 與 CompanyGov.id 不同，避免兩種讀法碰巧得到相同的結果
+    assert not {company.id for company in Company.query} & set(GOV_ROWS)
+    return {'Authorization': f'Bearer {create_access_token(identity=str(api_key.id))}'}
+
+
+def _summary(app, headers, page=1, page_size=10):
+    response = app.test_client().get(
+        f'/DataAccess/GetSummary?cursorId=cursor-1&page={page}&pageSize={page_size}', headers=headers
+    )
+    assert response.status_code == 200
+    items = json.loads(gzip.decompress(base64.b64decode(response.get_data())))
+    return [item['BusinessNo'] for item in items]
+
+
+def test_summary_reads_company_gov_ids(app, cursor_data):
+    assert _summary(app, cursor_data) == EXPECTED
+    assert _summary(app, cursor_data, page=2, page_size=2) == EXPECTED[2:]
+
+
+def test_summary_matches_cursor_export(app, cursor_data, postgresql):
+    response = app.test_client().post(
+        '/DataAccess/DownloadCompanyInfos?cursorId=cursor-1&format=jsonl', headers=cursor_data, json={}
+    )
+    assert response.status_code == 200
+    exported = [json.loads(line)['統一編號'] for line in response.get_data(as_text=True).splitlines()]
+
+    assert exported == EXPECTED
+    assert _summary(app, cursor_data) == exported
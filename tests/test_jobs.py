@@ -0,0 +1,135 @@
+# tests/test_jobs.py
+import datetime
+import os
+import time
+import uuid
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+
+from app import db, deadlines
+from app.jobs import EXPORT_TYPES, _run_job, export_jobs
+from app.models import ApiKey, ExportJob
+
+
+def _select_one(params, path, on_progress):
+    db.session.execute(text('SELECT 1'))
+    with open(path, 'w') as f:
+        f.write('ok')
+
+
+def _wait(job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db.session.expire_all()
+        job = ExportJob.query.filter_by(job_id=job_id).first()
+        if job.status in ('done', 'failed'):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f'export job {job_id} did not finish')
+
+
+def test_job_runs_after_request_deadline_expired(app, create_tables, monkeypatch):
+    create_tables(ExportJob)
+    monkeypatch.setitem(EXPORT_TYPES, 'SelectOne', (_select_one, 'txt', 'text/plain'))
+    monkeypatch.setitem(deadlines.deadlines, 'export', 500)
+    monkeypatch.setattr(export_jobs, '_executor', None)
+
+    # 與 POST /ExportJobs 相同: 行程池在帶有時限的請求中建立
+    token = deadlines.start('export')
+    try:
+        first = export_jobs.submit('SelectOne', {}, 0)
+    finally:
+        deadlines.finish(token)
+    assert _wait(first.job_id).status == 'done'
+
+    # 請求的時限已過，之後的工作仍不受影響
+    time.sleep(0.5)
+    second = export_jobs.submit('SelectOne', {}, 0)
+    job = _wait(second.job_id)
+    assert job.status == 'done', job.error
+
+    export_jobs._executor.shutdown()
+
+
+def _add_job(status, heartbeat_at, runner_id=None):
+    now = datetime.datetime.utcnow()
+    job = ExportJob(
+        job_id=str(uuid.uuid4()), export_type='SelectOne', params='{}', status=status,
+        runner_id=runner_id, heartbeat_at=heartbeat_at, created_at=now, expires_at=now + export_jobs.ttl,
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job.job_id
+
+
+def test_stale_jobs_marked_failed(app, create_tables):
+    create_tables(ExportJob)
+    now = datetime.datetime.utcnow()
+    old = now - export_jobs.stale_after - datetime.timedelta(seconds=1)
+    stale_pending = _add_job('pending', old)
+    stale_running = _add_job('running', old)
+    alive = _add_job('running', now)
+    finished = _add_job('done', old)
+
+    assert export_jobs.fail_stale() == 2
+
+    db.session.expire_all()
+    statuses = {job.job_id: job.status for job in ExportJob.query}
+    assert statuses == {stale_pending: 'failed', stale_running: 'failed', alive: 'running', finished: 'done'}
+
+
+def test_heartbeat_keeps_own_jobs_alive(app, create_tables):
+    create_tables(ExportJob)
+    old = datetime.datetime.utcnow() - export_jobs.stale_after - datetime.timedelta(seconds=1)
+    own = _add_job('running', old, runner_id='runner-a')
+    other = _add_job('running', old, runner_id='runner-b')
+
+    export_jobs.heartbeat('runner-a')
+    export_jobs.fail_stale()
+
+    db.session.expire_all()
+    statuses = {job.job_id: job.status for job in ExportJob.query}
+    assert statuses == {own: 'running', other: 'failed'}
+
+
+def test_job_failed_as_stale_while_running_stays_failed(app, create_tables, monkeypatch, tmp_path):
+    create_tables(ExportJob)
+    monkeypatch.setattr(export_jobs, 'export_dir', str(tmp_path))
+
+    def stale_while_rendering(params, path, on_progress):
+        # 產生檔案期間 heartbeat 逾時，被其他 worker 標記為失敗
+        monkeypatch.setattr(export_jobs, 'stale_after', datetime.timedelta(seconds=-60))
+        assert export_jobs.fail_stale() == 1
+        with open(path, 'w') as f:
+            f.write('ok')
+
+    monkeypatch.setitem(EXPORT_TYPES, 'SelectOne', (stale_while_rendering, 'txt', 'text/plain'))
+    job_id = _add_job('pending', datetime.datetime.utcnow())
+
+    _run_job(job_id)
+
+    job = ExportJob.query.filter_by(job_id=job_id).one()
+    assert job.status == 'failed'
+    assert job.file_path is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_missing_file_returns_410(app, create_tables, monkeypatch, tmp_path):
+    create_tables(ApiKey, ExportJob)
+    monkeypatch.setattr('app.auth._key_active_cache', {})
+    api_key = ApiKey(key=ApiKey.hash_key('secret'))
+    db.session.add(api_key)
+    db.session.commit()
+
+    now = datetime.datetime.utcnow()
+    job = ExportJob(
+        job_id=str(uuid.uuid4()), owner_id=str(api_key.id), export_type='CompanyInfos', params='{}',
+        status='done', file_path=str(tmp_path / 'removed.xlsx'), heartbeat_at=now, expires_at=now + export_jobs.ttl,
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(api_key.id))}'}
+    response = app.test_client().get(f'/DataAccess/ExportJobs/{job.job_id}/Download', headers=headers)
+    assert response.status_code == 410
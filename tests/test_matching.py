@@ -0,0 +1,51 @@
+# tests/test_matching.py
+from app import db
+from app.matching import best_candidate, unmatched_blocks
+from app.models import Company, CompanyLink
+from app.normalize import match_name_part, normalize_name
+
+
+def test_normalize_name():
+    assert normalize_name('台灣積體電路製造股份有限公司') == '台灣積體電路製造'
+    assert normalize_name('臺灣積體電路製造股份有限公司') == '台灣積體電路製造'
+    assert normalize_name('ＡＢＣ 科技（股）有限公司') == 'ABC科技股'
+    assert normalize_name('華碩電腦 股份有限公司') == '華碩電腦'
+    # 整個名稱就是組織型態時不去除
+    assert normalize_name('公司') == '公司'
+    assert normalize_name(None) == ''
+
+
+def test_match_name_part_ignores_spelling_variants():
+    assert match_name_part('臺灣電力股份有限公司') == match_name_part('台灣 電力公司') == '台灣電'
+    assert match_name_part('ＡＢＣ企業社') == 'ABC'
+
+
+def test_best_candidate():
+    candidates = [
+        ('11111111', normalize_name('台灣積體電路製造股份有限公司')),
+        ('22222222', normalize_name('台灣積體電子股份有限公司')),
+    ]
+    business_no, confidence = best_candidate('臺灣積體電路製造公司', candidates)
+    assert business_no == '11111111'
+    assert confidence == 0.95
+
+    assert best_candidate('完全不同的名稱', candidates) is None
+
+
+def test_best_candidate_ties_lower_confidence():
+    candidates = [('22222222', '大同'), ('11111111', '大同')]
+    assert best_candidate('大同股份有限公司', candidates) == ('11111111', 0.475)
+
+
+def test_unmatched_blocks_use_normalized_keys(create_tables):
+    create_tables(Company, CompanyLink)
+    db.session.add_all([
+        Company(business_no='1', company_name='臺灣電力股份有限公司', company_address='100臺北市中正區羅斯福路'),
+        Company(business_no='2', company_name='台灣 電力公司', company_address='台北市中正區'),
+        Company(business_no='3', company_name='台灣電力公司', company_address='新北市板橋區縣民大道'),
+    ])
+    db.session.commit()
+
+    blocks = unmatched_blocks()
+    assert sorted(len(companies) for companies in blocks.values()) == [1, 2]
+    assert set(blocks) == {('台灣電', '台北市'), ('台灣電', '新北市')}
@@ -0,0 +1,82 @@
+# tests/test_models.py
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import db, payload_cache, rate_limiter
+from app.models import ApiKey, Company, CompanyGov
+
+
+def add_company(business_no):
+    company = Company(business_no=business_no, company_name='測試股份有限公司')
+    db.session.add(company)
+    db.session.commit()
+    return company
+
+
+def test_company_cache_invalidated_after_commit(create_tables):
+    create_tables(Company)
+    company = add_company('12345678')
+    payload_cache.set('company:12345678', 'detail', tag='12345678')
+
+    company.company_name = '改名股份有限公司'
+    db.session.flush()
+    assert payload_cache.get('company:12345678') == 'detail'
+
+    db.session.commit()
+    assert payload_cache.get('company:12345678') is None
+
+
+def test_old_business_no_invalidated(create_tables):
+    create_tables(Company)
+    company = add_company('12345678')
+    payload_cache.set('company:12345678', 'detail', tag='12345678')
+
+    company.business_no = '87654321'
+    db.session.commit()
+    assert payload_cache.get('company:12345678') is None
+
+
+def test_rollback_keeps_cache(create_tables):
+    create_tables(Company)
+    company = add_company('12345678')
+    payload_cache.set('company:12345678', 'detail', tag='12345678')
+
+    company.company_name = '改名股份有限公司'
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+    assert payload_cache.get('company:12345678') == 'detail'
+
+
+def test_api_key_generation_bumped_after_commit(create_tables, monkeypatch):
+    create_tables(ApiKey)
+    bumps = []
+    monkeypatch.setattr(rate_limiter, 'bump_key_generation', lambda: bumps.append(1))
+
+    api_key = ApiKey(key=ApiKey.hash_key('secret'))
+    db.session.add(api_key)
+    db.session.commit()
+
+    api_key.is_active = False
+    db.session.flush()
+    assert bumps == []
+    db.session.commit()
+    assert bumps == [1]
+
+
+def test_company_gov_business_no_unique_across_partitions(create_tables, postgresql):
+    create_tables(CompanyGov)
+    db.session.add(CompanyGov(_id='12345678', business_no='12345678', company_name='測試', county='台北市'))
+    db.session.commit()
+
+    # 修改縣市只是搬到另一個分區，不算重複
+    company_gov = CompanyGov.query.filter_by(business_no='12345678').one()
+    company_gov.county = '新北市'
+    db.session.commit()
+
+    # 不經由 merge_staging 在其他縣市新增相同統一編號 (例如直接寫入) 時由觸發程序拒絕
+    db.session.add(CompanyGov(_id='12345678', business_no='12345678', company_name='測試', county='台中市'))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+    assert [row.county for row in CompanyGov.query.filter_by(business_no='12345678')] == ['新北市']
@@ -0,0 +1,77 @@
+# tests/test_normalize.py
+import datetime
+
+import pytest
+
+from app.normalize import normalize_county, parse_capital_amount, roc_to_date
+
+
+@pytest.mark.parametrize('value, amount', [
+    ('10,000,000', 10000000),
+    ('10000000.0', 10000000),
+    (10000000, 10000000),
+    (10000000.0, 10000000),
+    ('１０００', 1000),     # 全形數字
+    (' 500 ', 500),
+])
+def test_parse_capital_amount(value, amount):
+    assert parse_capital_amount(value) == amount
+
+
+@pytest.mark.parametrize('value', [None, '', 'nan', 'None', '-5', 'abc', '1,000元'])
+def test_parse_capital_amount_invalid(value):
+    assert parse_capital_amount(value) is None
+
+
+@pytest.mark.parametrize('value, date', [
+    ('1040413', datetime.date(2015, 4, 13)),
+    ('0940406', datetime.date(2005, 4, 6)),
+    ('940406', datetime.date(2005, 4, 6)),      # 以數字讀入而遺失前導 0
+    (940406, datetime.date(2005, 4, 6)),
+    ('940406.0', datetime.date(2005, 4, 6)),
+    ('1130229', datetime.date(2024, 2, 29)),    # 閏年
+])
+def test_roc_to_date(value, date):
+    assert roc_to_date(value) == date
+
+
+@pytest.mark.parametrize('value', [
+    None, '', 'nan',
+    '1040231',      # 2 月 31 日
+    '1120229',      # 非閏年
+    '1041301',      # 13 月
+    '1040400',      # 0 日
+    '10404',        # 位數不足
+    '10404130',     # 位數過多
+    '104/04/13',
+])
+def test_roc_to_date_invalid(value):
+    assert roc_to_date(value) is None
+
+
+@pytest.mark.parametrize('address, county', [
+    ('新北市板橋區縣民大道二段7號', '新北市'),
+    ('臺中市豐原區縣前街1號', '台中市'),
+    ('高雄市鳳山區縣衙街2號', '高雄市'),
+    ('南投縣中寮鄉永平村', '南投縣'),
+    ('220新北市板橋區文化路一段', '新北市'),
+    ('100 臺北市中正區重慶南路', '台北市'),
+    ('　臺北市信義區', '台北市'),   # 全形空白
+])
+def test_normalize_county_from_address(address, county):
+    assert normalize_county(address) == county
+
+
+@pytest.mark.parametrize('value, county', [
+    ('臺北市', '台北市'),
+    ('台北市', '台北市'),
+    ('臺東縣', '台東縣'),
+    ('台東縣', '台東縣'),
+])
+def test_normalize_county_folds_tai(value, county):
+    assert normalize_county(value) == county
+
+
+@pytest.mark.parametrize('value', ['', None, 'nan', '台北', '火星', '臺灣省台北縣', 'Taipei City'])
+def test_normalize_county_rejects_non_county(value):
+    assert normalize_county(value) == ''
@@ -0,0 +1,47 @@
+# tests/test_registry.py
+from types import SimpleNamespace
+
+import pytest
+
+from app.registry import _FLAGS_OFFSET, BusinessNoIndex, IndexNotBuilt, is_valid_business_no
+
+
+def test_checksum():
+    assert is_valid_business_no('04595257')
+    assert not is_valid_business_no('04595258')
+    # 2023 年起總和被 5 整除即通過 (總和 15)
+    assert is_valid_business_no('10450063')
+
+
+def test_checksum_seventh_digit_seven():
+    # 第 7 位 7 的乘積 28 -> 10，總和 19 不整除，視為 1 加上後 20 整除
+    assert is_valid_business_no('10450073')
+    # 第 7 位不是 7 時沒有這個例外 (總和 14)
+    assert not is_valid_business_no('10450083')
+
+
+def test_checksum_rejects_non_ascii_digits():
+    assert not is_valid_business_no('0459525²')
+    assert not is_valid_business_no('０４５９５２５７')
+    assert not is_valid_business_no('4595257')
+    assert not is_valid_business_no(4595257)
+    assert not is_valid_business_no(None)
+
+
+def test_lookup_rejects_non_ascii_digits():
+    index = BusinessNoIndex()
+    buf = bytearray(_FLAGS_OFFSET)
+    index._current = lambda: buf
+
+    results = index.lookup(['0459525²', '04595257'])
+    assert [result['Registered'] for result in results] == [False, False]
+    assert [result['ValidChecksum'] for result in results] == [False, True]
+
+
+def test_missing_index_is_not_built_on_request(tmp_path):
+    index = BusinessNoIndex(SimpleNamespace(config={'BUSINESS_NO_INDEX_PATH': str(tmp_path / 'index')}))
+    index.build = lambda: pytest.fail('請求中不應建立索引')
+
+    assert not index.is_built()
+    with pytest.raises(IndexNotBuilt):
+        index.lookup(['04595257'])
@@ -0,0 +1,68 @@
+# tests/test_search.py
+import datetime
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from app.models import CompanyGov
+from app.search import range_filters
+
+
+def values(conditions):
+    """(欄位名稱, 運算子, 值)"""
+    return [
+        (condition.left.name, condition.operator.__name__, getattr(condition.right, 'value', None))
+        for condition in conditions
+    ]
+
+
+def test_no_filters():
+    assert range_filters(MultiDict()) == ([], [])
+
+
+def test_capital_and_founded_range():
+    conditions, order_by = range_filters(MultiDict({
+        'minCapital': '1000000', 'maxCapital': '5000000', 'foundedFrom': '2015-04-13', 'foundedTo': '2020-06-30',
+    }))
+    assert values(conditions) == [
+        ('capital_amount_num', 'ge', 1000000),
+        ('capital_amount_num', 'le', 5000000),
+        ('established_on', 'ge', datetime.date(2015, 4, 13)),
+        ('established_on', 'le', datetime.date(2020, 6, 30)),
+    ]
+    assert order_by == []
+
+
+def test_founded_years_cover_whole_year():
+    conditions, _ = range_filters(MultiDict({'foundedFrom': '2015', 'foundedTo': '2015'}))
+    assert values(conditions) == [
+        ('established_on', 'ge', datetime.date(2015, 1, 1)),
+        ('established_on', 'le', datetime.date(2015, 12, 31)),
+    ]
+
+
+def test_regions():
+    conditions, _ = range_filters(MultiDict([('regions', '臺北市,新北市'), ('regions', '台中市')]))
+    assert conditions[0].left.name == 'county'
+    assert conditions[0].right.value == ['台北市', '新北市', '台中市']
+
+
+def test_sort_excludes_missing_values():
+    conditions, order_by = range_filters(MultiDict({'sort': 'capitalDesc'}))
+    assert values(conditions) == [('capital_amount_num', 'is_not', None)]
+    assert str(order_by[0]) == str(CompanyGov.capital_amount_num.desc())
+    assert str(order_by[1]) == str(CompanyGov.id)
+
+
+@pytest.mark.parametrize('args', [
+    {'minCapital': 'abc'},
+    {'maxCapital': '1.5'},
+    {'foundedFrom': '2015-02-30'},
+    {'foundedTo': '15'},
+    {'foundedTo': '2015/01/01'},
+    {'sort': 'nameAsc'},
+    {'regions': '火星'},
+])
+def test_invalid_arguments(args):
+    with pytest.raises(ValueError):
+        range_filters(MultiDict(args))
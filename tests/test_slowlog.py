@@ -0,0 +1,59 @@
+# tests/test_slowlog.py
+from types import SimpleNamespace
+
+from app.slowlog import SlowQueryLog, keyword_pattern, normalize_sql
+
+
+def make_log(tmp_path):
+    log = SlowQueryLog(SimpleNamespace(config={'SLOW_QUERY_LOG_DIR': str(tmp_path), 'SLOW_QUERY_ENABLED': False}))
+    log.threshold = 0
+    log.explain_rate = 1.0
+    return log
+
+
+class _Connection:
+    dialect = SimpleNamespace(name='postgresql')
+
+    @property
+    def connection(self):
+        raise AssertionError('請求中不應再執行查詢')
+
+
+def test_slow_select_is_marked_not_explained(tmp_path):
+    log = make_log(tmp_path)
+    context = SimpleNamespace()
+    statement = 'SELECT id FROM companies WHERE company_name ILIKE %(name)s'
+    log._before_cursor_execute(_Connection(), None, statement, {'name': '%台北%'}, context, False)
+    log._after_cursor_execute(_Connection(), SimpleNamespace(rowcount=3), statement, {'name': '%台北%'}, context, False)
+
+    [entry] = log.iter_entries()
+    assert entry['explain'] is True
+    assert 'plan' not in entry
+    assert entry['keywords'] == ['台北']
+    assert entry['parameters'] == {'name': '%台北%'}
+
+
+def test_report_explains_out_of_band(tmp_path, monkeypatch):
+    log = make_log(tmp_path)
+    context = SimpleNamespace()
+    statement = 'SELECT id FROM companies WHERE company_name ILIKE %(name)s'
+    for _ in range(3):
+        log._before_cursor_execute(_Connection(), None, statement, {'name': '%台北%'}, context, False)
+        log._after_cursor_execute(_Connection(), SimpleNamespace(rowcount=1), statement, {'name': '%台北%'}, context, False)
+
+    explained = []
+    monkeypatch.setattr(log, 'explain', lambda engine, entry: explained.append(entry) or 'Seq Scan on companies')
+
+    [group] = log.report()
+    assert group['explained'] == 0 and explained == []
+
+    [group] = log.report(explain=2, engine=object())
+    assert len(explained) == 2
+    assert group['explained'] == 2
+    assert group['seqScans'] == 2
+    assert group['count'] == 3
+
+
+def test_grouping_helpers():
+    assert keyword_pattern(['台北', 'ABC']) == 'cjk2 + latin3'
+    assert normalize_sql("SELECT * FROM t WHERE a = 'x' AND b = 10") == 'SELECT * FROM t WHERE a = ? AND b = ?'
@@ -0,0 +1,22 @@
+# tests/test_snapshot.py
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app import registry_snapshot
+from app.snapshot import RegistrySnapshot, SnapshotNotBuilt
+
+
+def test_default_directory_is_in_instance_folder(tmp_path):
+    snapshot = RegistrySnapshot(SimpleNamespace(config={}, instance_path=str(tmp_path)))
+    assert snapshot.directory == os.path.join(str(tmp_path), 'registry_snapshot')
+
+
+def test_missing_snapshot_is_not_built_on_request(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(registry_snapshot, 'directory', str(tmp_path / 'snapshot'))
+    monkeypatch.setattr(registry_snapshot, 'build', lambda: pytest.fail('請求中不應輸出快照'))
+
+    assert not registry_snapshot.is_built()
+    with pytest.raises(SnapshotNotBuilt):
+        registry_snapshot.stats({})